@@ -0,0 +1,150 @@
+"""/misskey/summary のフローをネットワーク無しで計測するベンチマーク
+
+uv run python benchmarks/bench_summary.py --sizes 10 100 1000
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+os.environ.setdefault("PROJECT_ID", "benchmark")
+os.environ.setdefault("REGION", "us-central1")
+os.environ.setdefault("MISSKY_HOST", "misskey.example.com")
+
+from benchmarks.fakes import (
+    FakeGenaiClient,
+    create_discord_client,
+    create_misskey_client,
+)
+from services.ai_service import AIService
+from services.cursor_store import CursorStore
+from services.discord_service import DiscordService
+from services.misskey_service import MisskeyService
+from services.summary_service import summarize_channel
+
+CHANNEL_ID = 1
+
+
+def percentile(values: list[float], q: float) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(q) - 1]
+
+
+async def run_once(  # noqa: PLR0913
+    message_count: int,
+    gemini_latency: float,
+    misskey_latency: float,
+    concurrency: int,
+    *,
+    streaming: bool = False,
+    output_chars: int = 800,
+    digest: bool = False,
+) -> dict[str, float]:
+    http_client, notes = create_misskey_client(misskey_latency)
+    first_post: list[float] = []
+
+    async def record_first_post(response) -> None:
+        if not first_post:
+            first_post.append(time.perf_counter() - start)
+
+    http_client.event_hooks["response"].append(record_first_post)
+    ai_service = AIService()
+    ai_service.client = FakeGenaiClient(
+        latency=gemini_latency, output_chars=output_chars
+    )
+    misskey_service = MisskeyService(
+        http_client=http_client,
+        concurrency=concurrency,
+        ai_service=ai_service,
+        streaming=streaming,
+    )
+    discord_service = DiscordService()
+    discord_service.discord_client = create_discord_client(message_count, CHANNEL_ID)
+    discord_service.cursor_store = CursorStore(path=":memory:")
+    # カーソルを設定しておき、合成した履歴をすべて読み込ませる
+    discord_service.cursor_store.advance(CHANNEL_ID, 0)
+
+    # 実行の開始から各メッセージの処理が終わるまでの時間 (メッセージごとの処理時間ではない)
+    completions: list[float] = []
+    start = time.perf_counter()
+
+    def report(progress) -> None:
+        if progress.done > len(completions):
+            completions.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    results = await summarize_channel(
+        discord_service, misskey_service, CHANNEL_ID, report=report, digest=digest
+    )
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    await http_client.aclose()
+
+    succeeded = sum(result.status == "success" for result in results)
+    return {
+        "messages": message_count,
+        "succeeded": succeeded,
+        "notes": len(notes),
+        "gemini_calls": ai_service.client.aio.models.calls,
+        "elapsed_seconds": elapsed,
+        "messages_per_second": message_count / elapsed,
+        "p50_completion_seconds": percentile(completions, 50),
+        "p95_completion_seconds": percentile(completions, 95),
+        "first_post_seconds": first_post[0] if first_post else float("nan"),
+        "peak_memory_mib": peak / 1024 / 1024,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--gemini-latency", type=float, default=0.05)
+    parser.add_argument("--misskey-latency", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--output-chars", type=int, default=800)
+    parser.add_argument(
+        "--streaming", action="store_true", help="ストリーミング生成で投稿する"
+    )
+    parser.add_argument(
+        "--digest",
+        action="store_true",
+        help="URL を含まないメッセージをまとめて要約する",
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'messages':>8} {'msg/s':>8} {'first[s]':>8} {'done50[s]':>9} {'done95[s]':>9} "
+        f"{'peak[MiB]':>10} {'ok':>6} {'notes':>6} {'calls':>6}"
+    )
+    for size in args.sizes:
+        stats = asyncio.run(
+            run_once(
+                size,
+                args.gemini_latency,
+                args.misskey_latency,
+                args.concurrency,
+                streaming=args.streaming,
+                output_chars=args.output_chars,
+                digest=args.digest,
+            )
+        )
+        print(
+            f"{stats['messages']:>8} {stats['messages_per_second']:>8.1f} "
+            f"{stats['first_post_seconds']:>8.3f} "
+            f"{stats['p50_completion_seconds']:>9.3f} "
+            f"{stats['p95_completion_seconds']:>9.3f} "
+            f"{stats['peak_memory_mib']:>10.2f} {stats['succeeded']:>6} "
+            f"{stats['notes']:>6} {stats['gemini_calls']:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
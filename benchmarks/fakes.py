@@ -0,0 +1,145 @@
+"""ネットワークを使わずに要約フローを動かすためのフェイク実装"""
+
+import asyncio
+import itertools
+from datetime import UTC, datetime
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import discord
+import httpx
+from fastapi import FastAPI
+from google.genai import types
+
+
+class FakeModels:
+    """client.aio.models の代わり。指定した遅延の後に固定の応答を返す"""
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        output_chars: int = 800,
+        prompt_tokens: int = 500,
+        output_tokens: int = 400,
+    ):
+        self.latency = latency
+        self.output_chars = output_chars
+        self.prompt_tokens = prompt_tokens
+        self.output_tokens = output_tokens
+        self.calls = 0
+
+    def _text(self) -> str:
+        return (
+            "**要約**\n" + ("要約本文です。" * self.output_chars)[: self.output_chars]
+        )
+
+    def _response(self, text: str, final: bool = True) -> types.GenerateContentResponse:
+        """final の場合だけ、グラウンディングとトークン使用量を含める"""
+        return types.GenerateContentResponse(
+            candidates=[
+                types.Candidate(
+                    content=types.Content(role="model", parts=[types.Part(text=text)]),
+                    grounding_metadata=types.GroundingMetadata(
+                        grounding_chunks=[
+                            types.GroundingChunk(
+                                web=types.GroundingChunkWeb(
+                                    title="example", uri="https://example.com/"
+                                )
+                            )
+                        ]
+                    )
+                    if final
+                    else None,
+                )
+            ],
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=self.prompt_tokens,
+                candidates_token_count=self.output_tokens,
+                total_token_count=self.prompt_tokens + self.output_tokens,
+            )
+            if final
+            else None,
+        )
+
+    async def generate_content(self, model: str, contents: str, config=None):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return self._response(self._text())
+
+    async def generate_content_stream(
+        self, model: str, contents: str, config=None, chunks: int = 10
+    ):
+        """latency を chunks 個のチャンクに分けて、テキストを少しずつ返す"""
+        self.calls += 1
+        text = self._text()
+        size = -(-len(text) // chunks)
+
+        async def stream():
+            for start in range(0, len(text), size):
+                await asyncio.sleep(self.latency / chunks)
+                yield self._response(
+                    text[start : start + size], final=start + size >= len(text)
+                )
+
+        return stream()
+
+
+class FakeGenaiClient:
+    """genai.Client の代わり (非同期 API のみ)"""
+
+    def __init__(self, **kwargs):
+        self.aio = SimpleNamespace(models=FakeModels(**kwargs))
+
+
+def create_misskey_stub(latency: float = 0.0) -> tuple[FastAPI, list[dict]]:
+    """Misskey の /api/notes/create を模したローカルアプリと、受け取った投稿の一覧"""
+    app = FastAPI()
+    notes: list[dict] = []
+    note_ids = itertools.count(1)
+
+    @app.post("/api/notes/create")
+    async def create_note(body: dict):
+        if latency:
+            await asyncio.sleep(latency)
+        notes.append(body)
+        return {"createdNote": {"id": f"note-{next(note_ids)}"}}
+
+    return app, notes
+
+
+def create_misskey_client(latency: float = 0.0) -> tuple[httpx.AsyncClient, list]:
+    app, notes = create_misskey_stub(latency)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app)), notes
+
+
+def make_discord_message(message_id: int):
+    # 4件に1件が URL。間の3件は雑談としてダイジェストにまとめられる
+    if message_id % 4 == 1:
+        content = f"https://example.com/articles/{message_id}"
+    else:
+        content = f"メッセージ {message_id} について調べてください"
+    return SimpleNamespace(
+        id=message_id,
+        content=content,
+        channel=SimpleNamespace(id=1),
+        author=SimpleNamespace(name="user", id=1, bot=False),
+        created_at=datetime(2025, 1, 1, tzinfo=UTC),
+    )
+
+
+def create_discord_client(message_count: int, channel_id: int = 1) -> MagicMock:
+    """合成したメッセージ履歴を返すテキストチャンネルを持つ Discord クライアント"""
+
+    async def history(limit=None, after=None, **kwargs):
+        start = getattr(after, "id", 0) + 1
+        for message_id in range(start, message_count + 1):
+            yield make_discord_message(message_id)
+
+    channel = MagicMock(spec=discord.TextChannel)
+    channel.id = channel_id
+    channel.name = "benchmark"
+    channel.history = history
+    discord_client = MagicMock()
+    discord_client.is_closed.return_value = False
+    discord_client.get_channel.return_value = channel
+    return discord_client
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import os
+from typing import Any
+
+import discord
+import httpx
+from dotenv import load_dotenv
+
+from services.ai_service import AIService
+from services.batch_service import create_vertex_batch_service
+from services.cache_service import SummaryCache
+from services.cursor_store import CursorStore
+from services.discord_service import DISCORD_REST_CONCURRENCY
+from services.domain_store import DomainFailureStore
+from services.gemini_scheduler import GeminiScheduler
+from services.metrics_store import METRICS_MULTIPROCESS, MetricsStore
+from services.misskey_service import MisskeyService
+from services.page_service import (
+    URL_PREFETCH_ENABLED,
+    PageService,
+    create_page_client,
+)
+from services.page_store import PageStore
+from services.post_ledger import PostLedger
+from services.rate_limit_store import RateLimitStore
+from services.rss_store import RSSStore
+from utils.telemetry import log_event
+
+load_dotenv()
+
+BOT_TOKEN = os.getenv("DISCORD_BOT_TOKEN")
+# false の場合、API サーバーはゲートウェイに接続せず Discord の REST API だけを使う
+# (serve.py で起動するワーカー。ゲートウェイは gateway.py の1プロセスだけが接続する)
+DISCORD_GATEWAY_ENABLED = os.getenv("DISCORD_GATEWAY_ENABLED", "true").lower() == "true"
+HTTP_TIMEOUT_SECONDS = 10.0
+HTTP_MAX_CONNECTIONS = 20
+
+
+def create_discord_client() -> discord.Client:
+    """メッセージの本文を受け取るインテントで Discord クライアントを作成する"""
+    intents = discord.Intents.default()
+    intents.messages = True
+    intents.message_content = True  # 特権インテント
+    intents.guilds = True
+    return discord.Client(intents=intents)
+
+
+async def login_rest_only(client: discord.Client) -> None:
+    """ゲートウェイに接続せず、REST API を使えるようにログインだけ行う"""
+    try:
+        await client.login(BOT_TOKEN)
+    except Exception as e:
+        log_event("Discord Botのログインに失敗しました", logging.ERROR, error=str(e))
+        # 閉じておくと、API は Bot が準備できていないとして 503 を返す
+        await client.close()
+
+
+def open_services(state: Any) -> None:
+    """プロセス内で共有するサービスを作成し、state (app.state など) に設定する
+
+    キャッシュや処理済みの位置は DATA_DIR の SQLite に保存するため、
+    同じホストの複数のプロセスで共有できる。
+    """
+    # 外部API (Misskey など) への接続を使い回す共有HTTPクライアント
+    state.http_client = httpx.AsyncClient(
+        timeout=HTTP_TIMEOUT_SECONDS,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+        ),
+    )
+    state.summary_cache = SummaryCache()
+    state.domain_store = DomainFailureStore()
+    state.page_store = PageStore()
+    # ページの取得は、内部ネットワークに接続しない専用のクライアントで行う
+    state.page_client = create_page_client()
+    page_service = None
+    if URL_PREFETCH_ENABLED:
+        page_service = PageService(state.page_client, state.page_store)
+    # Gemini の呼び出しはすべて1つのスケジューラで割り当ての範囲に収める
+    # 割り当ての残量は SQLite に保存し、serve.py で起動した全プロセスで共有する
+    state.rate_limit_store = RateLimitStore()
+    state.gemini_scheduler = GeminiScheduler(store=state.rate_limit_store)
+    # サービスはリクエストごとではなく起動時に1度だけ作成して共有する
+    state.ai_service = AIService(
+        cache=state.summary_cache,
+        domain_store=state.domain_store,
+        page_service=page_service,
+        scheduler=state.gemini_scheduler,
+    )
+    # BATCH_GCS_URI が未設定の場合は None (溜まったメッセージもオンラインで要約する)
+    state.batch_service = create_vertex_batch_service(state.ai_service)
+    state.post_ledger = PostLedger()
+    state.misskey_service = MisskeyService(
+        http_client=state.http_client,
+        ai_service=state.ai_service,
+        batch_service=state.batch_service,
+        ledger=state.post_ledger,
+    )
+    state.cursor_store = CursorStore()
+    state.discord_rest_semaphore = asyncio.Semaphore(DISCORD_REST_CONCURRENCY)
+    state.rss_store = RSSStore()
+    # 複数のプロセスで動かす場合、/metrics は全プロセス分をまとめて返す
+    state.metrics_store = None
+    if METRICS_MULTIPROCESS:
+        state.metrics_store = MetricsStore()
+        state.metrics_store.start()
+
+
+async def close_services(state: Any) -> None:
+    if state.metrics_store is not None:
+        await state.metrics_store.stop()
+        state.metrics_store.close()
+    await state.http_client.aclose()
+    await state.page_client.aclose()
+    state.summary_cache.close()
+    state.domain_store.close()
+    state.page_store.close()
+    state.cursor_store.close()
+    state.post_ledger.close()
+    state.rss_store.close()
+    state.rate_limit_store.close()
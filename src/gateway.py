@@ -0,0 +1,57 @@
+import asyncio
+import contextlib
+import signal
+from types import SimpleNamespace
+
+import discord
+
+from bootstrap import BOT_TOKEN, close_services, create_discord_client, open_services
+from services.discord_service import configured_channels
+from services.live_service import LiveSummaryService
+from utils.telemetry import configure_logging, log_event
+
+
+async def run_gateway() -> None:
+    """Discord のゲートウェイに接続し、受信したメッセージをライブ要約する
+
+    serve.py から1プロセスだけ起動する。HTTP API は API ワーカーが提供する。
+    """
+    # 終了時 (SIGTERM) も後片付けをしてから止める
+    asyncio.get_running_loop().add_signal_handler(
+        signal.SIGTERM, asyncio.current_task().cancel
+    )
+    state = SimpleNamespace()
+    open_services(state)
+    client = create_discord_client()
+    live_summary_service = LiveSummaryService(
+        state.misskey_service,
+        channels=configured_channels(),
+    )
+
+    @client.event
+    async def on_ready():
+        log_event("Discordにログインしました", user=str(client.user))
+
+    @client.event
+    async def on_message(message: discord.Message):
+        live_summary_service.enqueue(message)
+
+    live_summary_service.start()
+    try:
+        await client.start(BOT_TOKEN)
+    finally:
+        log_event("Discordゲートウェイを停止します")
+        await live_summary_service.stop()
+        if not client.is_closed():
+            await client.close()
+        await close_services(state)
+
+
+def main() -> None:
+    configure_logging()
+    with contextlib.suppress(KeyboardInterrupt, asyncio.CancelledError):
+        asyncio.run(run_gateway())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,47 @@
 import asyncio
-import os
+import logging
 from contextlib import asynccontextmanager  # lifespanで使用
 
 import discord
 import uvicorn
-from dotenv import load_dotenv
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+
+from bootstrap import (
+    BOT_TOKEN,
+    DISCORD_GATEWAY_ENABLED,
+    close_services,
+    create_discord_client,
+    login_rest_only,
+    open_services,
+)
 
 # routersからインポート
-from routers import discord_messages, rss_messages, summary_messages
+from routers import discord_messages, jobs, metrics, rss_messages, summary_messages
+from services.discord_service import configured_channels
+from services.job_service import JobService, JobStore
+from services.live_service import LIVE_SUMMARY_ENABLED, LiveSummaryService
+from utils.telemetry import configure_logging, log_event, span, start_trace
 
 # --- Discord Bot 設定 ---
-load_dotenv()
-BOT_TOKEN = os.getenv("DISCORD_BOT_TOKEN")
-
-# 必要なインテントを設定
-intents = discord.Intents.default()
-intents.messages = True
-intents.message_content = True  # 特権インテント
-intents.guilds = True
+configure_logging()
 
 # Discordクライアントを作成
-client = discord.Client(intents=intents)
-discord_ready = False  # Bot の準備完了フラグ
+client = create_discord_client()
 discord_task = None  # Discord Botのタスクを保持する変数
 
 
 @client.event
 async def on_ready():
     """BotがDiscordに接続し準備が完了したときに呼ばれる"""
-    print(f"{client.user} としてログインしました")
+    log_event("Discordにログインしました", user=str(client.user))
+
+
+@client.event
+async def on_message(message: discord.Message):
+    """ライブ要約モードの場合、受信したメッセージを要約キューに追加する"""
+    live_summary_service = getattr(app.state, "live_summary_service", None)
+    if live_summary_service is not None:
+        live_summary_service.enqueue(message)
 
 
 async def run_discord_bot():
@@ -37,7 +49,7 @@ async def run_discord_bot():
     try:
         await client.start(BOT_TOKEN)
     except Exception as e:
-        print(f"Discord Bot Error: {e}")
+        log_event("Discord Bot Error", logging.ERROR, error=str(e))
     finally:
         if not client.is_closed():
             await client.close()
@@ -49,15 +61,35 @@ async def run_discord_bot():
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """FastAPIのライフサイクル管理 (推奨される方法)"""
-    print("FastAPI起動、Discord Botをバックグラウンドで起動します...")
+    log_event("FastAPI起動、Discord Botをバックグラウンドで起動します")
     app.state.discord_client = client
-    # Discord Botをバックグラウンドタスクとして起動
-    app.state.discord_task = asyncio.create_task(run_discord_bot())
+    open_services(app.state)
+    job_store = JobStore()
+    # 同じストアを使う他のワーカーのジョブは中断扱いにしない
+    job_store.interrupt_orphaned()
+    app.state.job_service = JobService(job_store)
+    app.state.live_summary_service = None
+    app.state.discord_task = None
+    if DISCORD_GATEWAY_ENABLED:
+        if LIVE_SUMMARY_ENABLED:
+            app.state.live_summary_service = LiveSummaryService(
+                app.state.misskey_service,
+                channels=configured_channels(),
+            )
+            app.state.live_summary_service.start()
+        # Discord Botをバックグラウンドタスクとして起動
+        app.state.discord_task = asyncio.create_task(run_discord_bot())
+    else:
+        # ゲートウェイには gateway.py のプロセスが接続する。ここでは REST API だけを使う
+        await login_rest_only(client)
 
     # --- アプリケーションが実行されるフェーズ ---
     yield
     # --- アプリケーション終了時の処理 ---
-    print("FastAPI終了、Discord Botを停止します...")
+    log_event("FastAPI終了、Discord Botを停止します")
+    if app.state.live_summary_service is not None:
+        await app.state.live_summary_service.stop()
+    await app.state.job_service.stop()
     discord_task = app.state.discord_task
     discord_client = app.state.discord_client
     if client and not client.is_closed():
@@ -69,17 +101,32 @@ async def lifespan(app: FastAPI):
         try:
             await discord_task  # キャンセルが完了するのを待つ
         except asyncio.CancelledError:
-            print("Discord Botタスクのキャンセルを確認しました。")
+            log_event("Discord Botタスクのキャンセルを確認しました")
+    await close_services(app.state)
+    app.state.job_service.store.close()
 
 
 # lifespanを指定してFastAPIアプリを作成
 app = FastAPI(lifespan=lifespan)
 
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """リクエストごとにトレースIDを割り当て、処理時間を記録する"""
+    trace_id = start_trace(request.headers.get("X-Request-ID"))
+    with span("http_request", method=request.method, path=request.url.path) as fields:
+        response = await call_next(request)
+        fields["status_code"] = response.status_code
+    response.headers["X-Request-ID"] = trace_id
+    return response
+
+
 # ルーターの登録
 app.include_router(discord_messages.router)
 app.include_router(summary_messages.router)
 app.include_router(rss_messages.router)
+app.include_router(jobs.router)
+app.include_router(metrics.router)
 
 
 @app.get("/")
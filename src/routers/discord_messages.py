@@ -1,7 +1,12 @@
-from fastapi import APIRouter, Depends, Request
+from collections.abc import AsyncIterator
+from typing import Literal
+
+import discord
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
-from services.discord_service import DiscordService, Message
+from services.discord_service import DiscordService, Message, MessageRecord
 
 
 class ErrorResponse(BaseModel):
@@ -15,21 +20,56 @@ router = APIRouter(
 )
 
 
+async def _ndjson_lines(
+    first: MessageRecord, records: AsyncIterator[MessageRecord]
+) -> AsyncIterator[str]:
+    yield first.to_json() + "\n"
+    async for record in records:
+        yield record.to_json() + "\n"
+
+
 @router.get(
     "/{channel_id}/messages",
     response_model=list[Message],
     responses={
+        200: {
+            "content": {"application/x-ndjson": {}},
+            "description": "format=ndjson の場合は1行に1メッセージの NDJSON",
+        },
         400: {"model": ErrorResponse, "description": "不正なリクエスト"},
         403: {"model": ErrorResponse, "description": "権限がありません"},
         404: {"model": ErrorResponse, "description": "チャンネルが見つかりません"},
         503: {"model": ErrorResponse, "description": "Discord Botが準備できていません"},
     },
 )
-async def get_channel_messages(
+async def get_channel_messages(  # noqa: PLR0913, PLR0917
     request: Request,
     channel_id: int,
     limit: int | None = 100,
+    before: int | None = None,
+    after: int | None = None,
+    output: Literal["json", "ndjson"] = Query("json", alias="format"),
     discord_service: DiscordService = Depends(DiscordService()),
 ):
-    """指定されたチャンネルIDのメッセージ履歴を取得するAPIエンドポイント"""
-    return await discord_service.get_discord_channel_messages(channel_id, limit)
+    """指定されたチャンネルIDのメッセージ履歴を取得するAPIエンドポイント
+
+    before / after にメッセージIDを指定すると、そのメッセージより前 / 後だけを返す。
+    続きのページは、受け取った最後のメッセージIDを before (after のみの場合は after) に指定する。
+    format=ndjson の場合は、Discord から受け取ったメッセージを溜めずに順に返す。
+    """
+    before_id = discord.Object(id=before) if before is not None else None
+    after_id = discord.Object(id=after) if after is not None else None
+    if output == "json":
+        return await discord_service.get_discord_channel_messages(
+            channel_id, limit, before=before_id, after=after_id
+        )
+    records = discord_service.iter_channel_messages(
+        channel_id, limit, before=before_id, after=after_id
+    )
+    # 権限エラーなどをステータスコードで返すため、最初の1件はレスポンスの前に取得する
+    first = await anext(records, None)
+    if first is None:
+        return StreamingResponse(iter(()), media_type="application/x-ndjson")
+    return StreamingResponse(
+        _ndjson_lines(first, records), media_type="application/x-ndjson"
+    )
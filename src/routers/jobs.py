@@ -0,0 +1,33 @@
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+
+from services.job_service import Job, JobService, get_job_service
+
+
+class ErrorResponse(BaseModel):
+    detail: str
+
+
+# ルーターの作成
+router = APIRouter(
+    prefix="/jobs",
+    tags=["jobs"],
+)
+
+
+@router.get(
+    "/{job_id}",
+    response_model=Job,
+    responses={
+        404: {"model": ErrorResponse, "description": "ジョブが見つかりません"},
+    },
+)
+async def get_job(
+    job_id: str,
+    job_service: JobService = Depends(get_job_service),
+):
+    """ジョブの状態と進捗を取得する"""
+    job = job_service.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found.")
+    return job
@@ -0,0 +1,20 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import PlainTextResponse
+
+from utils.metrics import REGISTRY
+
+# ルーターの作成
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(request: Request):
+    """Prometheus のテキスト形式でメトリクスを返す
+
+    serve.py で起動した場合は、全プロセスのメトリクスを process ラベル付きで返す。
+    """
+    metrics_store = request.app.state.metrics_store
+    text = metrics_store.render() if metrics_store is not None else REGISTRY.render()
+    return PlainTextResponse(
+        text, media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -1,10 +1,34 @@
+from collections.abc import Callable
+
 from dotenv import load_dotenv
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
 
-from services.rss_service import RSSService
+from services.job_service import (
+    JobAccepted,
+    JobProgress,
+    JobService,
+    get_job_service,
+)
+from services.rss_service import RSSService, get_rss_service
+from services.rss_summary_service import (
+    RSS_SUMMARY_MAX_ITEMS,
+    RSS_SUMMARY_MAX_TOKENS,
+    RSSItemResult,
+    RSSSummaryService,
+    get_rss_summary_service,
+)
 
 load_dotenv()
 
+# 同時に1つだけ実行するためのジョブのキー
+RSS_SUMMARY_JOB_KEY = "rss_summary"
+
+
+class ErrorResponse(BaseModel):
+    detail: str
+
 
 # ルーターの作成
 router = APIRouter(
@@ -15,6 +39,52 @@ router = APIRouter(
 
 @router.get("/entries")
 async def get_rss_entries(
-    rss_service: RSSService = Depends(RSSService),
+    only_new: bool = False,
+    rss_service: RSSService = Depends(get_rss_service),
 ):
-    return rss_service.get_rss_feed_urls()
+    """RSSエントリーのURLを返す。only_new=true の場合は未取得のものだけを返す"""
+    return await rss_service.get_rss_feed_urls(only_new=only_new)
+
+
+@router.get(
+    "/summary",
+    response_model=list[RSSItemResult],
+    responses={
+        202: {"model": JobAccepted, "description": "バッチ予測のジョブを登録しました"},
+        409: {"model": ErrorResponse, "description": "別の要約を実行中です"},
+    },
+)
+async def summarize_rss_entries(
+    max_items: int = RSS_SUMMARY_MAX_ITEMS,
+    max_tokens: int = RSS_SUMMARY_MAX_TOKENS,
+    rss_summary_service: RSSSummaryService = Depends(get_rss_summary_service),
+    job_service: JobService = Depends(get_job_service),
+):
+    """要約済みでないRSSエントリーを要約してMisskeyに投稿する
+
+    既読にするのは投稿の後のため、同時に実行すると同じエントリーを投稿してしまう。
+    ジョブとして記録し、実行中の要約がある場合は 409 を返す。
+    バッチ予測でまとめて要約するほど溜まっている場合は、完了まで長くかかるため
+    ジョブを登録して 202 を返す。進捗と結果は GET /jobs/{job_id} で確認できる。
+    """
+    pending = await rss_summary_service.pending_entries(max_items)
+    batch = rss_summary_service.should_batch(len(pending))
+
+    async def run(report: Callable[[JobProgress], None]) -> list[dict]:
+        results = await rss_summary_service.summarize_new_entries(
+            max_items=max_items, max_tokens=max_tokens, allow_batch=batch
+        )
+        return [result.model_dump() for result in results]
+
+    if batch:
+        job, created = job_service.submit("rss_summary", RSS_SUMMARY_JOB_KEY, run)
+        accepted = JobAccepted(job_id=job.id, status=job.status, created=created)
+        return JSONResponse(status_code=202, content=accepted.model_dump())
+    job, created = await job_service.run("rss_summary", RSS_SUMMARY_JOB_KEY, run)
+    if not created:
+        raise HTTPException(
+            status_code=409, detail=f"RSS summary job {job.id} is already running."
+        )
+    if job.status != "succeeded":
+        raise HTTPException(status_code=500, detail=job.error or job.status)
+    return job.result
@@ -1,13 +1,20 @@
 import os
-from datetime import datetime, timedelta
+from collections.abc import Callable
 
 from dotenv import load_dotenv
 from fastapi import APIRouter, Depends, Request
 from pydantic import BaseModel
 
 from services.discord_service import DiscordService
-from services.misskey_service import MisskeyService
-from utils.url_validator import which_url
+from services.gemini_scheduler import gemini_priority
+from services.job_service import (
+    JobAccepted,
+    JobProgress,
+    JobService,
+    get_job_service,
+)
+from services.misskey_service import MisskeyService, get_misskey_service
+from services.summary_service import summarize_channels
 
 load_dotenv()
 
@@ -28,6 +35,8 @@ router = APIRouter(
 
 @router.get(
     "/summary",
+    status_code=202,
+    response_model=JobAccepted,
     responses={
         400: {"model": ErrorResponse, "description": "不正なリクエスト"},
         403: {"model": ErrorResponse, "description": "権限がありません"},
@@ -37,9 +46,31 @@ router = APIRouter(
 )
 async def get_channel_messages(
     request: Request,
+    digest: bool = False,
     discord_service: DiscordService = Depends(DiscordService()),
-    misskey_service: MisskeyService = Depends(MisskeyService),
+    misskey_service: MisskeyService = Depends(get_misskey_service),
+    job_service: JobService = Depends(get_job_service),
 ):
-    after = datetime.now() - timedelta(hours=1)
-    messages = await discord_service.get_discord_defined_channel_messages(after=after)
-    return await misskey_service.message_summaries(messages)
+    """設定された全チャンネルの要約ジョブを登録してすぐに返す
+
+    進捗は GET /jobs/{job_id} で確認できる。結果はチャンネルごとに返す。
+    digest=true の場合、URL を含まない連続したメッセージはまとめて1つの要約として投稿する。
+    """
+    channels = discord_service.configured_channels()
+    # チャンネルの存在や Bot の状態はジョブ登録前に確認してエラーを返す
+    for channel in channels:
+        await discord_service.get_text_channel(channel.channel_id)
+
+    async def run(report: Callable[[JobProgress], None]) -> list[dict]:
+        # ジョブは溜まったメッセージの処理のため、ライブ要約などより後に回す
+        with gemini_priority("backlog"):
+            results = await summarize_channels(
+                discord_service, misskey_service, channels, report=report, digest=digest
+            )
+        return [result.model_dump() for result in results]
+
+    channel_ids = ",".join(str(channel.channel_id) for channel in channels)
+    job, created = job_service.submit(
+        "misskey_summary", f"misskey_summary:{channel_ids}", run
+    )
+    return JobAccepted(job_id=job.id, status=job.status, created=created)
@@ -0,0 +1,59 @@
+import multiprocessing
+import os
+
+import uvicorn
+from dotenv import load_dotenv
+
+from utils.telemetry import configure_logging, log_event
+
+load_dotenv()
+
+# HTTP API のワーカープロセス数
+API_WORKERS = int(os.getenv("API_WORKERS", str(os.cpu_count() or 1)))
+API_HOST = os.getenv("API_HOST", "0.0.0.0")  # noqa: S104
+API_PORT = int(os.getenv("API_PORT", "8080"))
+
+
+def main() -> None:
+    """本番用の起動スクリプト
+
+    Discord のゲートウェイはライブ要約用の1プロセスだけが接続し、
+    HTTP API は API_WORKERS 個のワーカーで処理する。ワーカーは Discord の REST API だけを使う。
+    """
+    configure_logging()
+    # サービスのモジュールは読み込み時に設定を読むため、環境変数を書き換えてから import する
+    # (API_WORKERS=1 の場合、uvicorn はこのプロセスでアプリを読み込む)
+    live_summary_enabled = os.getenv("LIVE_SUMMARY_ENABLED", "false").lower() == "true"
+    os.environ["DISCORD_GATEWAY_ENABLED"] = "false"
+    # どのワーカーが /metrics に応答しても、全プロセスのメトリクスを返す
+    os.environ["METRICS_MULTIPROCESS"] = "true"
+    gateway_process = None
+    if live_summary_enabled:
+        import gateway  # noqa: PLC0415
+
+        # fork では読み込み済みのモジュールを引き継ぐため spawn で起動する
+        gateway_process = multiprocessing.get_context("spawn").Process(
+            target=gateway.main, name="discord-gateway"
+        )
+        gateway_process.start()
+    log_event(
+        "APIワーカーを起動します",
+        workers=API_WORKERS,
+        gateway=gateway_process is not None,
+    )
+    try:
+        uvicorn.run(
+            "main:app",
+            host=API_HOST,
+            port=API_PORT,
+            workers=API_WORKERS,
+            log_level="info",
+        )
+    finally:
+        if gateway_process is not None:
+            gateway_process.terminate()
+            gateway_process.join()
+
+
+if __name__ == "__main__":
+    main()
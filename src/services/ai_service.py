@@ -1,26 +1,61 @@
+import asyncio
 import datetime
 import os
-from typing import Literal
-from weakref import ref
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterator
+from contextlib import contextmanager, suppress
+from contextvars import ContextVar
+from functools import cached_property
+from typing import TYPE_CHECKING, Literal
+from urllib.parse import urlsplit
 
 from dotenv import load_dotenv
 from google import genai
 from google.genai.types import (
+    Content,
     GenerateContentConfig,
     GenerateContentResponse,
     GoogleSearch,
     HttpOptions,
+    Part,
     Tool,
     UrlContext,
 )
-from numpy import append
 from pydantic import BaseModel
 
+from services.page_store import ExtractedPage
+from utils.metrics import (
+    CACHE_REQUESTS,
+    FALLBACKS,
+    GEMINI_REQUEST_DURATION,
+    GEMINI_TOKENS,
+)
+from utils.telemetry import log_event, span
+from utils.text_splitter import NoteSplitter, split_note
+from utils.url_validator import URL_PATTERN
+
+if TYPE_CHECKING:
+    from services.cache_service import SummaryCache
+    from services.domain_store import DomainFailureStore
+    from services.gemini_scheduler import GeminiScheduler
+    from services.page_service import PageService
+
 load_dotenv()
 
 PROJECT_ID = os.getenv("PROJECT_ID")
 REGION = os.getenv("REGION")
 
+GEMINI_PRO_MODEL = os.getenv("GEMINI_PRO_MODEL", "gemini-2.5-pro")
+GEMINI_FAST_MODEL = os.getenv("GEMINI_FAST_MODEL", "gemini-2.5-flash")
+# adaptive: 入力に応じて選ぶ / pro: 常に Pro / fast: 常に Fast (いずれも失敗時は Pro)
+GEMINI_ROUTING = os.getenv("GEMINI_ROUTING", "adaptive")
+# adaptive の場合に Fast モデルを使うプロンプトの最大文字数と URL の最大数
+GEMINI_FAST_MAX_PROMPT_CHARS = int(os.getenv("GEMINI_FAST_MAX_PROMPT_CHARS", "400"))
+GEMINI_FAST_MAX_URLS = int(os.getenv("GEMINI_FAST_MAX_URLS", "1"))
+# true の場合、URL を含むプロンプトは url と search を同時に生成し、先に確定した方を使う
+URL_HEDGING_ENABLED = os.getenv("URL_HEDGING_ENABLED", "false").lower() == "true"
+# レート制限で確保する出力トークン数の見込み (実際の使用量は応答後に精算する)
+GEMINI_OUTPUT_TOKENS_ESTIMATE = int(os.getenv("GEMINI_OUTPUT_TOKENS_ESTIMATE", "2048"))
 
 SYSTEM_PROMPT = """あなたは有能なアシスタントです。
 与えられた指示及び情報に基づいて、正確で簡潔な回答を提供してください。
@@ -39,9 +74,18 @@ SYSTEM_PROMPT = """あなたは有能なアシスタントです。
 """
 
 MISSKEY_MAX_LENGTH = 3000 - 50  # 余裕を持たせるために50文字引く
+# 1つのプロンプトでローカルに取得する URL の最大数
+PREFETCH_MAX_URLS = 3
+
+# local はローカルで取得したページの本文を渡して生成する (補足のため検索ツールは使える)
+ToolName = Literal["search", "url", "local"]
+
+
+class GroundingError(Exception):
+    pass
 
 
-class URLAccessError(Exception):
+class URLAccessError(GroundingError):
     pass
 
 
@@ -50,17 +94,106 @@ class Reference(BaseModel):
     uri: str
 
 
+class BatchItem(BaseModel):
+    """バッチ予測で生成する1件分のプロンプトと、生成に使うツール"""
+
+    prompt: str
+    tool: ToolName
+    pages: list[ExtractedPage] | None = None
+
+
+class TokenUsage(BaseModel):
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    total_tokens: int = 0
+
+
+_token_usage: ContextVar[TokenUsage | None] = ContextVar("token_usage", default=None)
+
+
+@contextmanager
+def track_token_usage() -> Iterator[TokenUsage]:
+    """ブロック内 (同じタスク内) で呼び出した Gemini のトークン使用量を集計する"""
+    usage = TokenUsage()
+    token = _token_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _token_usage.reset(token)
+
+
+class ModelRouter:
+    """プロンプトの長さとツールから、最初に使うモデルを選ぶ"""
+
+    POLICIES = ("adaptive", "pro", "fast")
+
+    def __init__(
+        self,
+        policy: str = GEMINI_ROUTING,
+        fast_model: str = GEMINI_FAST_MODEL,
+        pro_model: str = GEMINI_PRO_MODEL,
+        max_prompt_chars: int = GEMINI_FAST_MAX_PROMPT_CHARS,
+        max_urls: int = GEMINI_FAST_MAX_URLS,
+    ):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown routing policy: {policy}")
+        self.policy = policy
+        self.fast_model = fast_model
+        self.pro_model = pro_model
+        self.max_prompt_chars = max_prompt_chars
+        self.max_urls = max_urls
+
+    def select(self, prompt: str, tool: ToolName) -> str:
+        if self.policy == "pro":
+            return self.pro_model
+        if self.policy == "fast":
+            return self.fast_model
+        if len(prompt) > self.max_prompt_chars:
+            return self.pro_model
+        if tool == "url" and len(URL_PATTERN.findall(prompt)) > self.max_urls:
+            return self.pro_model
+        return self.fast_model
+
+
+def _cancel(task: asyncio.Task) -> None:
+    """不要になったタスクを取り消す。終わっていれば例外を回収しておく"""
+    if not task.done():
+        task.cancel()
+    elif not task.cancelled():
+        task.exception()
+
+
 class AIService:
-    def __init__(self):
-        self.client = genai.Client(
+    def __init__(  # noqa: PLR0913
+        self,
+        *,
+        cache: "SummaryCache | None" = None,
+        router: ModelRouter | None = None,
+        domain_store: "DomainFailureStore | None" = None,
+        hedging: bool = URL_HEDGING_ENABLED,
+        page_service: "PageService | None" = None,
+        scheduler: "GeminiScheduler | None" = None,
+    ):
+        self.router = router or ModelRouter()
+        # Pro モデル。Fast モデルの回答がグラウンディングに失敗した場合にも使う
+        self.model = self.router.pro_model
+        self.cache = cache
+        self.domain_store = domain_store
+        self.hedging = hedging
+        self.page_service = page_service
+        self.scheduler = scheduler
+
+    @cached_property
+    def client(self) -> genai.Client:
+        """genai クライアントは初回利用時に作成する"""
+        return genai.Client(
             vertexai=True,
             project=PROJECT_ID,
             location="us-central1",
             http_options=HttpOptions(api_version="v1"),
         )
-        self.model = "gemini-2.5-pro"
 
-    def _get_tools(self, tool: Literal["search", "url"]) -> list[Tool]:
+    def _get_tools(self, tool: ToolName) -> list[Tool]:
         if tool == "url":
             url_context_tool = Tool(url_context=UrlContext())
             return [url_context_tool]
@@ -74,7 +207,7 @@ class AIService:
             SYSTEM_PROMPT + f"\n今日は{today.year}年{today.month}月{today.day}日です。"
         )
 
-    def _get_config(self, tool: Literal["search", "url"]) -> GenerateContentConfig:
+    def _get_config(self, tool: ToolName) -> GenerateContentConfig:
         tools = self._get_tools(tool)
         system_prompt = self._generate_system_prompt()
         return GenerateContentConfig(
@@ -110,50 +243,533 @@ class AIService:
                 return False
         return True
 
+    def _has_grounding_metadata(self, response: GenerateContentResponse) -> bool:
+        """ストリーミングのチャンクにグラウンディングの結果が含まれているか"""
+        return any(
+            candidate.grounding_metadata is not None
+            for candidate in response.candidates or []
+        )
+
     def _split_text(self, text: str, references: list[str]) -> list[str]:
-        res = [
-            text[i : i + MISSKEY_MAX_LENGTH]
-            for i in range(0, len(text), MISSKEY_MAX_LENGTH)
+        return split_note(text, references, MISSKEY_MAX_LENGTH)
+
+    def _format_references(self, references: list[Reference]) -> list[str]:
+        return [f"- [{ref.title}]({ref.uri})" for ref in references]
+
+    def _page_references(self, pages: list[ExtractedPage] | None) -> list[Reference]:
+        return [
+            Reference(title=page.title or page.url, uri=page.url)
+            for page in pages or []
         ]
-        fragment = "\n**References**:"
-        for reference in references:
-            if len(fragment) + len(reference) + 1 > MISSKEY_MAX_LENGTH:
-                res.append(fragment)
-                fragment = reference
-            else:
-                fragment += "\n" + reference
-        res.append(fragment)
-        if (joined := "\n".join(res)) and len(joined) <= MISSKEY_MAX_LENGTH:
-            return [joined]
-        return res
 
-    def _generate_message(self, response: GenerateContentResponse) -> list[str]:
+    def _generate_message(
+        self,
+        response: GenerateContentResponse,
+        pages: list[ExtractedPage] | None = None,
+    ) -> list[str]:
         if not response.text:
             raise ValueError("Response text is empty")
         text = response.text
-        references = self._get_references(response)
-        formatted_references = [f"- [{ref.title}]({ref.uri})" for ref in references]
-        return self._split_text(text, formatted_references)
+        references = self._page_references(pages) + self._get_references(response)
+        return self._split_text(text, self._format_references(references))
+
+    def _build_contents(
+        self, prompt: str, pages: list[ExtractedPage] | None
+    ) -> str | list[Part]:
+        """ローカルで取得したページがあれば、プロンプトの後ろに本文 (PDF はファイル) を添える"""
+        if not pages:
+            return prompt
+        parts = [Part.from_text(text=prompt)]
+        for page in pages:
+            header = f"[{page.url} の内容]"
+            if page.title:
+                header += f"\nタイトル: {page.title}"
+            if page.kind == "pdf":
+                parts.append(Part.from_text(text=header))
+                parts.append(
+                    Part.from_bytes(data=page.data, mime_type="application/pdf")
+                )
+            else:
+                parts.append(Part.from_text(text=f"{header}\n{page.text}"))
+        return parts
+
+    def _record_usage(self, response: GenerateContentResponse, model: str) -> None:
+        metadata = response.usage_metadata
+        if metadata is None:
+            return
+        prompt_tokens = metadata.prompt_token_count or 0
+        output_tokens = metadata.candidates_token_count or 0
+        total_tokens = metadata.total_token_count or 0
+        GEMINI_TOKENS.inc(prompt_tokens, model=model, type="prompt")
+        GEMINI_TOKENS.inc(output_tokens, model=model, type="output")
+        GEMINI_TOKENS.inc(total_tokens, model=model, type="total")
+        if usage := _token_usage.get():
+            usage.prompt_tokens += prompt_tokens
+            usage.output_tokens += output_tokens
+            usage.total_tokens += total_tokens
+
+    def _estimate_tokens(
+        self, prompt: str, pages: list[ExtractedPage] | None = None
+    ) -> int:
+        """入出力のトークン数の見込み。入力は文字数を上限とみなす"""
+        page_chars = sum(len(page.text) for page in pages or [])
+        return len(prompt) + page_chars + GEMINI_OUTPUT_TOKENS_ESTIMATE
+
+    async def _schedule[T](self, tokens: int, call: Callable[[], Awaitable[T]]) -> T:
+        """スケジューラがあれば、レート制限の範囲で順番が来てから call を実行する"""
+        if self.scheduler is None:
+            return await call()
+        return await self.scheduler.run(call, tokens)
+
+    def _settle(self, tokens: int, response: GenerateContentResponse | None) -> None:
+        """見込みのトークン数と実際の使用量の差をスケジューラに反映する"""
+        if self.scheduler is None or response is None:
+            return
+        if response.usage_metadata is None:
+            return
+        self.scheduler.adjust((response.usage_metadata.total_token_count or 0) - tokens)
+
+    def _requires_grounding(self, tool: ToolName, model: str) -> bool:
+        """Fast モデルの回答は、検索でもグラウンディングを確認して Pro に切り替える
+
+        local はページの本文を渡しているため確認しない。
+        """
+        return tool == "url" or (tool == "search" and model != self.model)
+
+    def _grounding_error(self, prompt: str, tool: ToolName) -> GroundingError:
+        if tool == "url":
+            return URLAccessError(
+                f"Failed to access the URL or no relevant information found. prompt: {prompt}"
+            )
+        return GroundingError(f"No grounding results found. prompt: {prompt}")
+
+    def _handle_response(
+        self,
+        prompt: str,
+        tool: ToolName,
+        response: GenerateContentResponse,
+        model: str,
+        pages: list[ExtractedPage] | None = None,
+    ) -> list[str]:
+        self._record_usage(response, model)
+        if self._requires_grounding(tool, model) and not self._success_grounding(
+            response
+        ):
+            raise self._grounding_error(prompt, tool)
+        return self._generate_message(response, pages)
+
+    @contextmanager
+    def _observe(self, stage: str, model: str, tool: ToolName) -> Iterator[dict]:
+        """Gemini の呼び出しを計測し、応答したモデルとレイテンシを記録する"""
+        start = time.perf_counter()
+        with span(stage, model=model, tool=tool) as fields:
+            yield fields
+        elapsed = time.perf_counter() - start
+        GEMINI_REQUEST_DURATION.observe(elapsed, model=model, tool=tool)
+        log_event(
+            "Geminiが応答しました",
+            model=model,
+            tool=tool,
+            latency_ms=round(elapsed * 1000, 1),
+        )
+
+    def _escalate(self, model: str, tool: ToolName) -> None:
+        log_event(
+            "グラウンディングに失敗したため Pro モデルで再生成します",
+            model=model,
+            tool=tool,
+        )
+        FALLBACKS.inc(kind="fast_to_pro")
+
+    def _select_tool(self, prompt: str) -> ToolName:
+        if "https://" in prompt:
+            return "url"
+        return "search"
+
+    def _url_domains(self, prompt: str) -> list[str]:
+        domains: set[str] = set()
+        for url in URL_PATTERN.findall(prompt):
+            # URL として解釈できないものは数えない
+            with suppress(ValueError):
+                domains.add(urlsplit(url).netloc.lower())
+        return sorted(domains - {""})
+
+    def _choose_tool(self, prompt: str) -> ToolName:
+        """URL の取得に失敗し続けているドメインの URL だけなら、最初から検索を使う"""
+        tool = self._select_tool(prompt)
+        if tool != "url" or self.domain_store is None:
+            return tool
+        domains = self._url_domains(prompt)
+        if domains and all(self.domain_store.is_blocked(d) for d in domains):
+            log_event(
+                "URLの取得に失敗し続けているドメインのため検索を使います",
+                domains=domains,
+            )
+            FALLBACKS.inc(kind="known_bad_domain")
+            return "search"
+        return tool
+
+    def _record_url_result(self, prompt: str, tool: ToolName, success: bool) -> None:
+        if tool != "url" or self.domain_store is None:
+            return
+        for domain in self._url_domains(prompt):
+            if success:
+                self.domain_store.record_success(domain)
+            else:
+                self.domain_store.record_failure(domain)
+
+    async def _prefetch(self, prompt: str) -> list[ExtractedPage] | None:
+        """プロンプト中の URL をローカルで取得する。1つでも読めなければ None を返す"""
+        if self.page_service is None or self._select_tool(prompt) != "url":
+            return None
+        urls = list(dict.fromkeys(URL_PATTERN.findall(prompt)))[:PREFETCH_MAX_URLS]
+        pages = await asyncio.gather(*(self.page_service.fetch(url) for url in urls))
+        if not urls or any(page is None for page in pages):
+            return None
+        return pages
+
+    def _select_local_model(self, prompt: str, pages: list[ExtractedPage]) -> str:
+        """本文を含めた長さでモデルを選ぶ。PDF は Pro モデルで読む"""
+        if any(page.kind == "pdf" for page in pages):
+            return self.model
+        return self.router.select(
+            "\n".join([prompt, *(p.text for p in pages)]), "local"
+        )
+
+    def _log_fallback(self) -> None:
+        log_event("URL access failed, switching to search tool.")
+        FALLBACKS.inc(kind="url_to_search")
+
+    def _cache_key(
+        self,
+        prompt: str,
+        tool: ToolName,
+        model: str,
+        pages: list[ExtractedPage] | None = None,
+    ) -> str | None:
+        if self.cache is None:
+            return None
+        # ページの内容が変わったら別のキーになるよう、内容のハッシュも含める
+        source = prompt + "".join(f"\n{page.url}#{page.digest}" for page in pages or [])
+        return self.cache.make_key(source, tool, model)
+
+    def _cache_get(
+        self,
+        prompt: str,
+        tool: ToolName,
+        model: str,
+        pages: list[ExtractedPage] | None = None,
+    ) -> tuple[str | None, list[str] | None]:
+        key = self._cache_key(prompt, tool, model, pages)
+        if self.cache is None or key is None:
+            return None, None
+        cached = self.cache.get(key)
+        CACHE_REQUESTS.inc(result="miss" if cached is None else "hit")
+        if cached is not None:
+            log_event("要約キャッシュにヒットしました", tool=tool)
+        return key, cached
+
+    def _cache_set(self, key: str | None, texts: list[str]) -> None:
+        if self.cache is not None and key is not None:
+            self.cache.set(key, texts)
 
     def generate_content(
-        self, prompt: str, tool: Literal["search", "url"]
+        self, prompt: str, tool: ToolName, model: str | None = None
     ) -> list[str]:
+        """model を省略した場合は Pro モデルを使う"""
+        model = model or self.model
+        key, cached = self._cache_get(prompt, tool, model)
+        if cached is not None:
+            return cached
         config = self._get_config(tool)
-        response: GenerateContentResponse = self.client.models.generate_content(
-            model=self.model, contents=prompt, config=config
-        )
-        if tool == "url" and not self._success_grounding(response):
-            raise URLAccessError(
-                f"Failed to access the URL or no relevant information found. prompt: {prompt}"
+        with self._observe("gemini_generate", model, tool):
+            response: GenerateContentResponse = self.client.models.generate_content(
+                model=model, contents=prompt, config=config
             )
-        return self._generate_message(response)
+        texts = self._handle_response(prompt, tool, response, model)
+        self._cache_set(key, texts)
+        return texts
+
+    def _generate_routed(self, prompt: str, tool: ToolName) -> list[str]:
+        model = self.router.select(prompt, tool)
+        try:
+            return self.generate_content(prompt, tool, model)
+        except GroundingError:
+            if model == self.model:
+                raise
+            self._escalate(model, tool)
+        return self.generate_content(prompt, tool, self.model)
 
     def generate_content_if(self, prompt) -> list[str]:
-        tool: Literal["search", "url"] = "search"
-        if "https://" in prompt:
-            tool = "url"
+        tool = self._choose_tool(prompt)
+        try:
+            texts = self._generate_routed(prompt, tool)
+        except URLAccessError:
+            self._record_url_result(prompt, tool, success=False)
+            self._log_fallback()
+            with span("gemini_fallback", model=self.model):
+                return self._generate_routed(prompt, "search")
+        self._record_url_result(prompt, tool, success=True)
+        return texts
+
+    async def agenerate_content(
+        self,
+        prompt: str,
+        tool: ToolName,
+        model: str | None = None,
+        pages: list[ExtractedPage] | None = None,
+    ) -> list[str]:
+        """generate_content の非同期版。イベントループをブロックしない
+
+        pages を渡した場合は、ページの本文をプロンプトに添えて生成する。
+        """
+        model = model or self.model
+        key, cached = self._cache_get(prompt, tool, model, pages)
+        if cached is not None:
+            return cached
+        config = self._get_config(tool)
+        tokens = self._estimate_tokens(prompt, pages)
+
+        async def call() -> GenerateContentResponse:
+            # 順番待ちの時間はレイテンシに含めない
+            with self._observe("gemini_generate", model, tool):
+                return await self.client.aio.models.generate_content(
+                    model=model,
+                    contents=self._build_contents(prompt, pages),
+                    config=config,
+                )
+
+        response = await self._schedule(tokens, call)
+        self._settle(tokens, response)
+        texts = self._handle_response(prompt, tool, response, model, pages)
+        self._cache_set(key, texts)
+        return texts
+
+    async def _agenerate_routed(self, prompt: str, tool: ToolName) -> list[str]:
+        model = self.router.select(prompt, tool)
+        try:
+            return await self.agenerate_content(prompt, tool, model)
+        except GroundingError:
+            if model == self.model:
+                raise
+            self._escalate(model, tool)
+        return await self.agenerate_content(prompt, tool, self.model)
+
+    async def agenerate_content_if(self, prompt: str) -> list[str]:
+        """generate_content_if の非同期版
+
+        URL のページをローカルで取得できた場合は、その本文から生成する。
+        hedging の場合、URL を含むプロンプトは url と search を同時に生成する。
+        URL の回答が得られればそれを返し、失敗すれば検索の回答を返す。
+        """
+        if pages := await self._prefetch(prompt):
+            model = self._select_local_model(prompt, pages)
+            return await self.agenerate_content(prompt, "local", model, pages)
+        tool = self._choose_tool(prompt)
+        search_task = None
+        if tool == "url" and self.hedging:
+            search_task = asyncio.create_task(self._agenerate_routed(prompt, "search"))
+        try:
+            texts = await self._agenerate_routed(prompt, tool)
+        except URLAccessError:
+            self._record_url_result(prompt, tool, success=False)
+            self._log_fallback()
+            with span("gemini_fallback", model=self.model):
+                if search_task is not None:
+                    return await search_task
+                return await self._agenerate_routed(prompt, "search")
+        finally:
+            if search_task is not None:
+                _cancel(search_task)
+        self._record_url_result(prompt, tool, success=True)
+        return texts
+
+    async def aprepare_batch(self, prompt: str) -> BatchItem:
+        """バッチ予測に入れる前に、URL のページを取得してツールを決めておく"""
+        if pages := await self._prefetch(prompt):
+            return BatchItem(prompt=prompt, tool="local", pages=pages)
+        return BatchItem(prompt=prompt, tool=self._choose_tool(prompt))
+
+    def batch_cached(self, item: BatchItem) -> list[str] | None:
+        _, cached = self._cache_get(item.prompt, item.tool, self.model, item.pages)
+        return cached
+
+    def batch_request(self, item: BatchItem) -> dict:
+        """バッチ予測の入力 1行分 (REST の GenerateContentRequest) を作る
+
+        バッチ予測は 1つのジョブで1つのモデルしか使えないため、Pro モデルで生成する。
+        """
+        contents = self._build_contents(item.prompt, item.pages)
+        if isinstance(contents, str):
+            contents = [Part.from_text(text=contents)]
+        config = self._get_config(item.tool)
+        return {
+            "contents": [
+                Content(role="user", parts=contents).model_dump(
+                    mode="json", by_alias=True, exclude_none=True
+                )
+            ],
+            "systemInstruction": {"parts": [{"text": config.system_instruction}]},
+            "tools": [
+                tool.model_dump(mode="json", by_alias=True, exclude_none=True)
+                for tool in config.tools or []
+            ],
+            "generationConfig": {"responseModalities": config.response_modalities},
+        }
+
+    def batch_result(self, item: BatchItem, response: dict) -> list[str]:
+        """バッチ予測の出力を検証し、オンラインの生成と同じようにノートに分割する
+
+        グラウンディングに失敗していれば GroundingError (URLAccessError) を送出する。
+        """
+        parsed = GenerateContentResponse.model_validate(response)
+        try:
+            texts = self._handle_response(
+                item.prompt, item.tool, parsed, self.model, item.pages
+            )
+        except URLAccessError:
+            self._record_url_result(item.prompt, item.tool, success=False)
+            raise
+        self._record_url_result(item.prompt, item.tool, success=True)
+        self._cache_set(
+            self._cache_key(item.prompt, item.tool, self.model, item.pages), texts
+        )
+        return texts
+
+    async def astream_content(
+        self,
+        prompt: str,
+        tool: ToolName,
+        model: str | None = None,
+        pages: list[ExtractedPage] | None = None,
+    ) -> AsyncIterator[str]:
+        """agenerate_content のストリーミング版。ノートが確定するたびに返す
+
+        グラウンディングを確認する場合 (url ツールと Fast モデル) は、
+        グラウンディングの結果を受け取るまでノートを返さない。
+        失敗していれば、何も返さずに GroundingError (URLAccessError) を送出する。
+        """
+        model = model or self.model
+        key, cached = self._cache_get(prompt, tool, model, pages)
+        if cached is not None:
+            for text in cached:
+                yield text
+            return
+        texts: list[str] = []
+        with self._observe("gemini_stream", model, tool) as fields:
+            start = time.perf_counter()
+            async for text in self._astream_notes(prompt, tool, model, pages):
+                if not texts:
+                    fields["first_note_ms"] = round(
+                        (time.perf_counter() - start) * 1000, 1
+                    )
+                texts.append(text)
+                yield text
+        self._cache_set(key, texts)
+
+    async def _astream_notes(
+        self,
+        prompt: str,
+        tool: ToolName,
+        model: str,
+        pages: list[ExtractedPage] | None,
+    ) -> AsyncIterator[str]:
+        config = self._get_config(tool)
+        splitter = NoteSplitter(MISSKEY_MAX_LENGTH)
+        # None はグラウンディングの結果をまだ受け取っていない状態
+        grounded: bool | None = None if self._requires_grounding(tool, model) else True
+        # 同じ参考文献が複数のチャンクに含まれることがあるため URI で重複を除く
+        references = {ref.uri: ref for ref in self._page_references(pages)}
+        usage_chunk: GenerateContentResponse | None = None
+        has_text = False
+        pending: list[str] = []
+        tokens = self._estimate_tokens(prompt, pages)
+        stream = await self._schedule(
+            tokens,
+            lambda: self.client.aio.models.generate_content_stream(
+                model=model, contents=self._build_contents(prompt, pages), config=config
+            ),
+        )
+        async for chunk in stream:
+            if chunk.usage_metadata is not None:
+                usage_chunk = chunk
+            for reference in self._get_references(chunk):
+                references.setdefault(reference.uri, reference)
+            if grounded is None and self._has_grounding_metadata(chunk):
+                grounded = self._success_grounding(chunk)
+            if grounded is False:
+                break
+            if chunk.text:
+                has_text = True
+                pending.extend(splitter.feed(chunk.text))
+            if grounded:
+                for text in pending:
+                    yield text
+                pending = []
+        if usage_chunk is not None:
+            self._record_usage(usage_chunk, model)
+        self._settle(tokens, usage_chunk)
+        if grounded is False:
+            raise self._grounding_error(prompt, tool)
+        if not has_text:
+            raise ValueError("Response text is empty")
+        pending.extend(
+            splitter.finish(self._format_references(list(references.values())))
+        )
+        for text in pending:
+            yield text
+
+    async def _astream_routed(self, prompt: str, tool: ToolName) -> AsyncIterator[str]:
+        model = self.router.select(prompt, tool)
+        try:
+            async for text in self.astream_content(prompt, tool, model):
+                yield text
+        except GroundingError:
+            if model == self.model:
+                raise
+            self._escalate(model, tool)
+        else:
+            return
+        async for text in self.astream_content(prompt, tool, self.model):
+            yield text
+
+    async def astream_content_if(self, prompt: str) -> AsyncIterator[str]:
+        """agenerate_content_if のストリーミング版
+
+        hedging の場合、検索の回答は裏で生成しておき、URL の回答が届き始めたら取り消す。
+        """
+        if pages := await self._prefetch(prompt):
+            model = self._select_local_model(prompt, pages)
+            async for text in self.astream_content(prompt, "local", model, pages):
+                yield text
+            return
+        tool = self._choose_tool(prompt)
+        search_task = None
+        if tool == "url" and self.hedging:
+            search_task = asyncio.create_task(self._agenerate_routed(prompt, "search"))
         try:
-            return self.generate_content(prompt, tool)
+            async for text in self._astream_routed(prompt, tool):
+                if search_task is not None:
+                    _cancel(search_task)
+                yield text
         except URLAccessError:
-            print("URL access failed, switching to search tool.")
-            return self.generate_content(prompt, "search")
+            self._record_url_result(prompt, tool, success=False)
+            self._log_fallback()
+            with span("gemini_fallback", model=self.model):
+                async for text in self._astream_search(prompt, search_task):
+                    yield text
+            return
+        finally:
+            if search_task is not None:
+                _cancel(search_task)
+        self._record_url_result(prompt, tool, success=True)
+
+    async def _astream_search(
+        self, prompt: str, search_task: asyncio.Task | None
+    ) -> AsyncIterator[str]:
+        if search_task is None:
+            async for text in self._astream_routed(prompt, "search"):
+                yield text
+            return
+        for text in await search_task:
+            yield text
@@ -0,0 +1,360 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+from typing import Literal, Protocol
+
+from dotenv import load_dotenv
+from google import genai
+from google.genai.types import CreateBatchJobConfig, JobState
+from pydantic import BaseModel
+
+from services.ai_service import (
+    AIService,
+    BatchItem,
+    GroundingError,
+    track_token_usage,
+)
+from services.gemini_scheduler import gemini_priority
+from utils.metrics import BATCH_ITEMS, FALLBACKS
+from utils.telemetry import log_event, span
+
+load_dotenv()
+
+# バッチ予測の入出力を置く Cloud Storage の URI (gs://bucket/prefix)。未設定ならバッチモードを使わない
+BATCH_GCS_URI = os.getenv("BATCH_GCS_URI")
+# 未処理のプロンプトがこの件数以上ある場合にバッチ予測で要約する
+BATCH_MIN_ITEMS = int(os.getenv("BATCH_MIN_ITEMS", "20"))
+BATCH_POLL_INTERVAL_SECONDS = float(os.getenv("BATCH_POLL_INTERVAL_SECONDS", "30"))
+# この時間内に終わらないジョブは取り消し、オンラインで要約する
+BATCH_TIMEOUT_SECONDS = float(os.getenv("BATCH_TIMEOUT_SECONDS", "86400"))
+# バッチに入れる前のページ取得や、オンラインでの再生成を同時に行う最大数
+BATCH_CONCURRENCY = 8
+# 出力の行と入力のプロンプトを対応付けるため、リクエストのラベルにキーを入れる
+BATCH_KEY_LABEL = "batch_key"
+
+BatchState = Literal["running", "succeeded", "failed"]
+# ローカルのバッチで1行分のリクエストに応答する関数 (モデル名, リクエスト) -> レスポンス
+BatchResponder = Callable[[str, dict], Awaitable[dict]]
+
+_SUCCEEDED_STATES = (
+    JobState.JOB_STATE_SUCCEEDED,
+    JobState.JOB_STATE_PARTIALLY_SUCCEEDED,
+)
+_FAILED_STATES = (
+    JobState.JOB_STATE_FAILED,
+    JobState.JOB_STATE_CANCELLED,
+    JobState.JOB_STATE_EXPIRED,
+)
+
+
+class BatchJobError(Exception):
+    pass
+
+
+class BatchItemError(Exception):
+    pass
+
+
+class BatchBackend(Protocol):
+    """バッチ予測のジョブを実行する先 (Vertex AI またはローカルの代替)"""
+
+    async def submit(self, model: str, requests: dict[str, dict]) -> str:
+        """キーごとのリクエストを1つのジョブとして登録し、ジョブ名を返す"""
+        ...
+
+    async def state(self, name: str) -> BatchState: ...
+
+    async def results(self, name: str) -> dict[str, dict]:
+        """キーごとのレスポンスを返す。失敗した行は含めない"""
+        ...
+
+    async def cancel(self, name: str) -> None: ...
+
+
+def _input_line(key: str, request: dict) -> str:
+    labelled = {**request, "labels": {BATCH_KEY_LABEL: key}}
+    return json.dumps({"request": labelled}, ensure_ascii=False)
+
+
+def _parse_output(lines: list[str]) -> dict[str, dict]:
+    """バッチ予測の出力 (入力のリクエストとレスポンスが1行ずつ並ぶ JSONL) を読む"""
+    responses: dict[str, dict] = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        key = row.get("request", {}).get("labels", {}).get(BATCH_KEY_LABEL)
+        if key is None or not row.get("response"):
+            log_event(
+                "バッチ予測の行が失敗しました",
+                logging.WARNING,
+                key=key,
+                status=row.get("status"),
+            )
+            continue
+        responses[key] = row["response"]
+    return responses
+
+
+class VertexBatchBackend:
+    """Vertex AI のバッチ予測。入出力は Cloud Storage の JSONL ファイルでやり取りする"""
+
+    def __init__(self, client: genai.Client, gcs_uri: str):
+        self.client = client
+        self.gcs_uri = gcs_uri.rstrip("/")
+        # BATCH_GCS_URI を設定した場合だけ使うため、起動時には読み込まない
+        from google.cloud import storage  # noqa: PLC0415
+
+        self.storage = storage.Client()
+
+    def _blob(self, uri: str):
+        bucket, _, path = uri.removeprefix("gs://").partition("/")
+        return self.storage.bucket(bucket).blob(path)
+
+    async def submit(self, model: str, requests: dict[str, dict]) -> str:
+        prefix = (
+            f"{self.gcs_uri}/{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        )
+        body = "\n".join(_input_line(key, request) for key, request in requests.items())
+        blob = self._blob(f"{prefix}/input.jsonl")
+        # Cloud Storage のクライアントは同期 API のため、スレッドで実行する
+        await asyncio.to_thread(
+            blob.upload_from_string, body, content_type="application/jsonl"
+        )
+        job = await self.client.aio.batches.create(
+            model=model,
+            src=f"{prefix}/input.jsonl",
+            config=CreateBatchJobConfig(dest=f"{prefix}/output"),
+        )
+        return job.name
+
+    async def state(self, name: str) -> BatchState:
+        job = await self.client.aio.batches.get(name=name)
+        if job.state in _SUCCEEDED_STATES:
+            return "succeeded"
+        if job.state in _FAILED_STATES:
+            return "failed"
+        return "running"
+
+    async def results(self, name: str) -> dict[str, dict]:
+        job = await self.client.aio.batches.get(name=name)
+        if job.dest is None or job.dest.gcs_uri is None:
+            raise BatchJobError(f"Batch job {name} has no output location.")
+        return await asyncio.to_thread(self._read_output, job.dest.gcs_uri)
+
+    def _read_output(self, uri: str) -> dict[str, dict]:
+        bucket, _, prefix = uri.removeprefix("gs://").partition("/")
+        lines: list[str] = []
+        for blob in self.storage.list_blobs(bucket, prefix=prefix):
+            if blob.name.endswith(".jsonl"):
+                lines.extend(blob.download_as_text().splitlines())
+        return _parse_output(lines)
+
+    async def cancel(self, name: str) -> None:
+        await self.client.aio.batches.cancel(name=name)
+
+
+class LocalBatchBackend:
+    """ローカルのディレクトリに入出力ファイルを置いて処理するバッチ (テストや検証用)
+
+    Vertex AI と同じ形式の JSONL を読み書きし、1行ずつ responder に応答させる。
+    """
+
+    def __init__(self, directory: str | Path, responder: BatchResponder):
+        self.directory = Path(directory)
+        self.responder = responder
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    async def submit(self, model: str, requests: dict[str, dict]) -> str:
+        name = uuid.uuid4().hex
+        job_dir = self.directory / name
+        job_dir.mkdir(parents=True)
+        body = "\n".join(_input_line(key, request) for key, request in requests.items())
+        (job_dir / "input.jsonl").write_text(body, encoding="utf-8")
+        self._tasks[name] = asyncio.create_task(self._process(job_dir, model))
+        return name
+
+    async def _process(self, job_dir: Path, model: str) -> None:
+        lines = (job_dir / "input.jsonl").read_text(encoding="utf-8").splitlines()
+        rows = []
+        for line in lines:
+            row = json.loads(line)
+            try:
+                row["response"] = await self.responder(model, row["request"])
+                row["status"] = ""
+            except Exception as e:
+                row["status"] = str(e)
+            rows.append(json.dumps(row, ensure_ascii=False))
+        (job_dir / "predictions.jsonl").write_text("\n".join(rows), encoding="utf-8")
+
+    async def state(self, name: str) -> BatchState:
+        task = self._tasks[name]
+        if not task.done():
+            return "running"
+        if task.cancelled() or task.exception() is not None:
+            return "failed"
+        return "succeeded"
+
+    async def results(self, name: str) -> dict[str, dict]:
+        path = self.directory / name / "predictions.jsonl"
+        return _parse_output(path.read_text(encoding="utf-8").splitlines())
+
+    async def cancel(self, name: str) -> None:
+        self._tasks[name].cancel()
+
+
+class BatchOutcome(BaseModel):
+    """バッチモードで要約した1件分の結果"""
+
+    texts: list[str] = []
+    source: str  # "cache" | "batch" | "online" | "failed"
+    tokens: int = 0
+    error: str | None = None
+
+    def result(self) -> list[str]:
+        """要約したノートを返す。失敗していれば BatchItemError を送出する"""
+        if self.error is not None:
+            raise BatchItemError(self.error)
+        return self.texts
+
+
+class BatchSummaryService:
+    """溜まったプロンプトをまとめてバッチ予測で要約する
+
+    オンラインの生成より安く、オンラインの割り当てを使わない代わりに完了まで時間がかかる。
+    バッチで要約できなかったプロンプト (グラウンディングの失敗やジョブの失敗) は、
+    オンラインの生成で要約し直す。
+    """
+
+    def __init__(
+        self,
+        ai_service: AIService,
+        backend: BatchBackend,
+        min_items: int = BATCH_MIN_ITEMS,
+        poll_interval: float = BATCH_POLL_INTERVAL_SECONDS,
+        timeout: float = BATCH_TIMEOUT_SECONDS,
+    ):
+        self.ai_service = ai_service
+        self.backend = backend
+        self.min_items = min_items
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+    def should_batch(self, count: int) -> bool:
+        return count >= self.min_items
+
+    async def summarize(self, prompts: list[str]) -> list[BatchOutcome]:
+        """プロンプトごとの要約結果を、プロンプトと同じ順番で返す"""
+        semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+        async def prepare(prompt: str) -> BatchItem:
+            async with semaphore:
+                return await self.ai_service.aprepare_batch(prompt)
+
+        items = await asyncio.gather(*(prepare(prompt) for prompt in prompts))
+        outcomes: dict[int, BatchOutcome] = {}
+        for index, item in enumerate(items):
+            if (cached := self.ai_service.batch_cached(item)) is not None:
+                outcomes[index] = BatchOutcome(texts=cached, source="cache")
+        pending = {
+            str(index): item
+            for index, item in enumerate(items)
+            if index not in outcomes
+        }
+        if pending:
+            responses = await self._run_job(pending)
+            for key, item in pending.items():
+                if (response := responses.get(key)) is not None:
+                    outcome = self._from_response(item, response)
+                    if outcome is not None:
+                        outcomes[int(key)] = outcome
+
+        async def online(prompt: str) -> BatchOutcome:
+            async with semaphore:
+                return await self._summarize_online(prompt)
+
+        retry = [index for index in range(len(items)) if index not in outcomes]
+        outcomes.update(
+            zip(
+                retry,
+                await asyncio.gather(*(online(prompts[index]) for index in retry)),
+                strict=True,
+            )
+        )
+        for outcome in outcomes.values():
+            BATCH_ITEMS.inc(source=outcome.source)
+        return [outcomes[index] for index in range(len(items))]
+
+    async def _run_job(self, pending: dict[str, BatchItem]) -> dict[str, dict]:
+        """ジョブを登録して完了を待つ。ジョブが失敗した場合は空の結果を返す"""
+        requests = {
+            key: self.ai_service.batch_request(item) for key, item in pending.items()
+        }
+        try:
+            with span("gemini_batch", items=len(requests)) as fields:
+                name = await self.backend.submit(self.ai_service.model, requests)
+                fields["job"] = name
+                log_event("バッチ予測を登録しました", job=name, items=len(requests))
+                await self._wait(name)
+                return await self.backend.results(name)
+        except Exception as e:
+            log_event(
+                "バッチ予測に失敗したため、オンラインで要約します",
+                logging.WARNING,
+                error=str(e),
+            )
+            FALLBACKS.inc(kind="batch_to_online")
+            return {}
+
+    async def _wait(self, name: str) -> None:
+        deadline = time.monotonic() + self.timeout
+        while (state := await self.backend.state(name)) == "running":
+            if time.monotonic() > deadline:
+                await self.backend.cancel(name)
+                raise BatchJobError(f"Batch job {name} timed out.")
+            await asyncio.sleep(self.poll_interval)
+        if state != "succeeded":
+            raise BatchJobError(f"Batch job {name} {state}.")
+
+    def _from_response(self, item: BatchItem, response: dict) -> BatchOutcome | None:
+        """バッチの出力から結果を作る。オンラインで要約し直す場合は None を返す"""
+        with track_token_usage() as usage:
+            try:
+                texts = self.ai_service.batch_result(item, response)
+            except (GroundingError, ValueError) as e:
+                log_event(
+                    "バッチの回答を使えないため、オンラインで要約します",
+                    prompt=item.prompt[:100],
+                    error=str(e),
+                )
+                return None
+        return BatchOutcome(texts=texts, source="batch", tokens=usage.total_tokens)
+
+    async def _summarize_online(self, prompt: str) -> BatchOutcome:
+        with gemini_priority("backlog"), track_token_usage() as usage:
+            try:
+                texts = await self.ai_service.agenerate_content_if(prompt)
+            except Exception as e:
+                log_event(
+                    "要約に失敗しました",
+                    logging.WARNING,
+                    prompt=prompt[:100],
+                    error=str(e),
+                )
+                return BatchOutcome(
+                    source="failed", tokens=usage.total_tokens, error=str(e)
+                )
+        return BatchOutcome(texts=texts, source="online", tokens=usage.total_tokens)
+
+
+def create_vertex_batch_service(ai_service: AIService) -> BatchSummaryService | None:
+    """BATCH_GCS_URI が設定されていれば、Vertex AI のバッチ予測を使うサービスを作る"""
+    if not BATCH_GCS_URI:
+        return None
+    backend = VertexBatchBackend(ai_service.client, BATCH_GCS_URI)
+    return BatchSummaryService(ai_service, backend)
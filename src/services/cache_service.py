@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import time
+
+from dotenv import load_dotenv
+
+from utils.storage import connect
+from utils.url_validator import normalize_prompt
+
+load_dotenv()
+
+SUMMARY_CACHE_PATH = os.getenv("SUMMARY_CACHE_PATH", "summary_cache.sqlite3")
+SUMMARY_CACHE_TTL_SECONDS = int(os.getenv("SUMMARY_CACHE_TTL_SECONDS", "604800"))
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "10000"))
+
+
+class SummaryCache:
+    """要約結果 (list[str]) を SQLite に保存するキャッシュ
+
+    キーはプロンプト・ツール・モデル名から計算し、TTL と件数上限 (LRU) で削除する。
+    """
+
+    def __init__(
+        self,
+        path: str = SUMMARY_CACHE_PATH,
+        ttl_seconds: int = SUMMARY_CACHE_TTL_SECONDS,
+        max_entries: int = SUMMARY_CACHE_MAX_ENTRIES,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.conn = connect(path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS summary_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS summary_cache_accessed_at"
+            " ON summary_cache (accessed_at)"
+        )
+
+    @staticmethod
+    def make_key(prompt: str, tool: str, model: str) -> str:
+        payload = json.dumps([normalize_prompt(prompt), tool, model])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key: str) -> list[str] | None:
+        now = time.time()
+        row = self.conn.execute(
+            "SELECT value, created_at FROM summary_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        value, created_at = row
+        if now - created_at > self.ttl_seconds:
+            self.conn.execute("DELETE FROM summary_cache WHERE key = ?", (key,))
+            self.misses += 1
+            return None
+        self.conn.execute(
+            "UPDATE summary_cache SET accessed_at = ? WHERE key = ?", (now, key)
+        )
+        self.hits += 1
+        return json.loads(value)
+
+    def set(self, key: str, value: list[str]) -> None:
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO summary_cache (key, value, created_at, accessed_at)"
+            " VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), now, now),
+        )
+        self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        self.conn.execute(
+            "DELETE FROM summary_cache WHERE created_at < ?",
+            (now - self.ttl_seconds,),
+        )
+        self.conn.execute(
+            """
+            DELETE FROM summary_cache WHERE key NOT IN (
+                SELECT key FROM summary_cache ORDER BY accessed_at DESC LIMIT ?
+            )
+            """,
+            (self.max_entries,),
+        )
+
+    def stats(self) -> dict[str, int]:
+        (size,) = self.conn.execute("SELECT COUNT(*) FROM summary_cache").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "size": size}
+
+    def close(self) -> None:
+        self.conn.close()
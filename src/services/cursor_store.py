@@ -0,0 +1,84 @@
+import os
+import time
+
+from dotenv import load_dotenv
+
+from utils.storage import connect
+
+load_dotenv()
+
+CURSOR_STORE_PATH = os.getenv("CURSOR_STORE_PATH", "state.sqlite3")
+
+
+class CursorStore:
+    """チャンネルごとに処理済みの最新メッセージID (high-water mark) を保存する"""
+
+    def __init__(self, path: str = CURSOR_STORE_PATH):
+        self.conn = connect(path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS channel_cursors (
+                channel_id INTEGER PRIMARY KEY,
+                last_message_id INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS message_failures (
+                channel_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL,
+                attempts INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (channel_id, message_id)
+            )
+            """
+        )
+
+    def get(self, channel_id: int) -> int | None:
+        row = self.conn.execute(
+            "SELECT last_message_id FROM channel_cursors WHERE channel_id = ?",
+            (channel_id,),
+        ).fetchone()
+        return row[0] if row else None
+
+    def advance(self, channel_id: int, message_id: int) -> None:
+        """カーソルを進める。現在値より古いIDが渡された場合は何もしない"""
+        self.conn.execute(
+            """
+            INSERT INTO channel_cursors (channel_id, last_message_id, updated_at)
+            VALUES (?, ?, ?)
+            ON CONFLICT (channel_id) DO UPDATE SET
+                last_message_id = MAX(last_message_id, excluded.last_message_id),
+                updated_at = excluded.updated_at
+            """,
+            (channel_id, message_id, time.time()),
+        )
+        # カーソルより前のメッセージは再処理しないため、失敗回数も不要になる
+        self.conn.execute(
+            "DELETE FROM message_failures WHERE channel_id = ? AND message_id <= ?",
+            (channel_id, message_id),
+        )
+
+    def record_failure(self, channel_id: int, message_id: int) -> int:
+        """メッセージの処理に失敗した回数を1つ増やし、これまでの失敗回数を返す"""
+        self.conn.execute(
+            """
+            INSERT INTO message_failures (channel_id, message_id, attempts, updated_at)
+            VALUES (?, ?, 1, ?)
+            ON CONFLICT (channel_id, message_id) DO UPDATE SET
+                attempts = attempts + 1,
+                updated_at = excluded.updated_at
+            """,
+            (channel_id, message_id, time.time()),
+        )
+        row = self.conn.execute(
+            "SELECT attempts FROM message_failures"
+            " WHERE channel_id = ? AND message_id = ?",
+            (channel_id, message_id),
+        ).fetchone()
+        return row[0]
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,110 @@
+import os
+from collections.abc import Mapping
+
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+from services.discord_service import Message
+
+load_dotenv()
+
+# ダイジェスト1回分のプロンプトに詰めるメッセージのトークン数の上限 (推定)
+DIGEST_MAX_TOKENS = int(os.getenv("DIGEST_MAX_TOKENS", "8000"))
+
+DIGEST_PROMPT = """以下は Discord のチャンネルに投稿された複数のメッセージです。
+話題ごとにまとめて要約してください。必要なら検索ツールで補足してください。
+各メッセージは [ID 投稿者] の行から始まります。
+"""
+
+
+class SummaryUnit(BaseModel):
+    """1回の Gemini 呼び出しで要約するメッセージとプロンプト"""
+
+    messages: list[Message]
+    prompt: str
+    # 前回までに台帳に記録した単位のキー。新しくまとめた単位は None
+    key: str | None = None
+
+
+def estimate_tokens(text: str) -> int:
+    """トークン数の推定。日本語はおおむね1文字1トークン以下のため、文字数を上限とみなす"""
+    return len(text)
+
+
+def _format_message(message: Message) -> str:
+    return f"[{message.id} {message.author_name}]\n{message.content.strip()}\n"
+
+
+def _digest_unit(messages: list[Message]) -> SummaryUnit:
+    if len(messages) == 1:
+        # 1件だけならダイジェストにせず、通常どおり要約する
+        return SummaryUnit(messages=messages, prompt=messages[0].content.strip())
+    body = "\n".join(_format_message(message) for message in messages)
+    return SummaryUnit(messages=messages, prompt=f"{DIGEST_PROMPT}\n{body}")
+
+
+def plan_units(
+    messages: list[Message],
+    digest: bool = False,
+    max_tokens: int = DIGEST_MAX_TOKENS,
+    sources: Mapping[int, str] | None = None,
+) -> list[SummaryUnit]:
+    """メッセージを Gemini の呼び出し単位に分ける
+
+    digest の場合、連続する URL を含まないメッセージは max_tokens に収まる分ずつ
+    1つのプロンプトにまとめる。URL を含むメッセージは、これまでどおり1件ずつ要約する。
+    URL のメッセージをまたいではまとめない。
+
+    sources はメッセージIDと、前回までにそのメッセージを要約した単位のキー。
+    これらのメッセージは前回と同じ単位 (key 付き) にまとめ、残りのメッセージだけを新しくまとめる。
+    一部の失敗の後に実行し直しても、投稿済みのメッセージを別のダイジェストで投稿し直さない。
+    単位は最初のメッセージの順に並べる。
+    """
+    sources = sources or {}
+    recorded: dict[str, list[Message]] = {}
+    rest: list[Message] = []
+    for message in messages:
+        if (key := sources.get(message.id)) is not None:
+            recorded.setdefault(key, []).append(message)
+        else:
+            rest.append(message)
+    units = [
+        _digest_unit(group).model_copy(update={"key": key})
+        for key, group in recorded.items()
+    ]
+    units.extend(_plan_new_units(rest, digest, max_tokens))
+    order = {message.id: index for index, message in enumerate(messages)}
+    return sorted(units, key=lambda unit: order[unit.messages[0].id])
+
+
+def _plan_new_units(
+    messages: list[Message], digest: bool, max_tokens: int
+) -> list[SummaryUnit]:
+    if not digest:
+        return [
+            SummaryUnit(messages=[message], prompt=message.content.strip())
+            for message in messages
+        ]
+    units: list[SummaryUnit] = []
+    group: list[Message] = []
+    group_tokens = estimate_tokens(DIGEST_PROMPT)
+    for message in messages:
+        if "https://" in message.content:
+            if group:
+                units.append(_digest_unit(group))
+                group = []
+                group_tokens = estimate_tokens(DIGEST_PROMPT)
+            units.append(
+                SummaryUnit(messages=[message], prompt=message.content.strip())
+            )
+            continue
+        tokens = estimate_tokens(_format_message(message))
+        if group and group_tokens + tokens > max_tokens:
+            units.append(_digest_unit(group))
+            group = []
+            group_tokens = estimate_tokens(DIGEST_PROMPT)
+        group.append(message)
+        group_tokens += tokens
+    if group:
+        units.append(_digest_unit(group))
+    return units
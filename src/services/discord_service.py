@@ -1,13 +1,34 @@
+import asyncio
+import contextlib
+import json
+import logging
 import os
-from datetime import datetime
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+from typing import Literal
 
 import discord
 from dotenv import load_dotenv
 from fastapi import HTTPException, Request
 from pydantic import BaseModel
 
+from services.cursor_store import CursorStore
+from utils.telemetry import log_event, span
+
 load_dotenv()
 
+# カーソルが未保存のチャンネルで最初に読み込む期間
+INITIAL_HISTORY_WINDOW = timedelta(hours=1)
+# 要約するチャンネルと Misskey の公開範囲 ("チャンネルID:公開範囲" をカンマ区切り)
+# 未設定の場合は DISCORD_CHANNEL_ID のチャンネルを home で投稿する
+DISCORD_CHANNELS = os.getenv("DISCORD_CHANNELS", "")
+# Discord の REST API (履歴の取得) を同時に呼び出す最大数。全チャンネルで共有する
+DISCORD_REST_CONCURRENCY = int(os.getenv("DISCORD_REST_CONCURRENCY", "4"))
+
+Visibility = Literal["public", "home", "followers"]
+VISIBILITIES: tuple[Visibility, ...] = ("public", "home", "followers")
+
 
 # --- モデル定義 ---
 class Message(BaseModel):
@@ -18,22 +39,110 @@ class Message(BaseModel):
     created_at: str
 
 
+@dataclass(slots=True, frozen=True)
+class MessageRecord:
+    """履歴の読み込みに使う軽量な内部表現。大量のメッセージを扱うため検証は行わない"""
+
+    id: int
+    content: str
+    author_name: str
+    author_id: int
+    created_at: datetime
+
+    @classmethod
+    def from_discord(cls, message: discord.Message) -> "MessageRecord":
+        return cls(
+            id=message.id,
+            content=message.content,
+            author_name=message.author.name,
+            author_id=message.author.id,
+            created_at=message.created_at,
+        )
+
+    def to_message(self) -> Message:
+        return Message(
+            id=self.id,
+            content=self.content,
+            author_name=self.author_name,
+            author_id=self.author_id,
+            created_at=self.created_at.isoformat(),
+        )
+
+    def to_json(self) -> str:
+        """Message と同じ形の JSON (NDJSON の1行分)"""
+        return json.dumps(
+            {
+                "id": self.id,
+                "content": self.content,
+                "author_name": self.author_name,
+                "author_id": self.author_id,
+                "created_at": self.created_at.isoformat(),
+            },
+            ensure_ascii=False,
+        )
+
+
+class ChannelConfig(BaseModel):
+    """要約するチャンネルと、要約を投稿する Misskey の公開範囲"""
+
+    channel_id: int
+    visibility: Visibility = "home"
+
+
+def parse_channels(value: str) -> list[ChannelConfig]:
+    """ "123:public,456" の形式を読む。公開範囲を省略した場合は home"""
+    channels: list[ChannelConfig] = []
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        channel_id, _, visibility = item.strip().partition(":")
+        visibility = visibility or "home"
+        if visibility not in VISIBILITIES:
+            raise ValueError(f"Unknown Misskey visibility: {item}")
+        channels.append(
+            ChannelConfig(channel_id=int(channel_id), visibility=visibility)
+        )
+    return channels
+
+
+def configured_channels() -> list[ChannelConfig]:
+    if channels := parse_channels(DISCORD_CHANNELS):
+        return channels
+    return [ChannelConfig(channel_id=int(os.getenv("DISCORD_CHANNEL_ID") or 0))]
+
+
+def to_message(message: discord.Message) -> Message:
+    """discord.py のメッセージをAPIモデルに変換する"""
+    return MessageRecord.from_discord(message).to_message()
+
+
+# REST API で取得したチャンネル (ゲートウェイに接続していないプロセス用)
+_fetched_channels: dict[int, discord.abc.GuildChannel] = {}
+
+
 class DiscordService:
     """Discordサービスを提供するクラス"""
 
     def __init__(self):
         """初期化"""
         self.discord_client = None
+        self.cursor_store: CursorStore | None = None
+        # 全チャンネルで共有する REST API の同時実行数の上限 (None は無制限)
+        self.rest_semaphore: asyncio.Semaphore | None = None
 
     def __call__(self, request: Request) -> "DiscordService":
         """依存性注入のためのコールメソッド"""
         self.discord_client = request.app.state.discord_client
+        self.cursor_store = request.app.state.cursor_store
+        self.rest_semaphore = request.app.state.discord_rest_semaphore
         return self
 
-    async def get_discord_channel_messages(
-        self, channel_id: int, limit: int | None = 100, after: datetime | None = None
-    ) -> list[Message]:
-        """指定されたチャンネルIDのメッセージ履歴を取得する"""
+    async def get_text_channel(self, channel_id: int) -> discord.TextChannel:
+        """指定されたチャンネルIDのテキストチャンネルを取得する
+
+        ゲートウェイに接続していない (REST API だけを使う) 場合はキャッシュが空のため、
+        REST API で取得して、このプロセス内で使い回す。
+        """
         if (
             not self.discord_client or self.discord_client.is_closed()
         ):  # Bot準備完了かつクローズされていないか確認
@@ -43,6 +152,8 @@ class DiscordService:
             )
 
         channel = self.discord_client.get_channel(channel_id)
+        if channel is None and not self.discord_client.is_ready():
+            channel = await self._fetch_channel(channel_id)
 
         if not channel:
             raise HTTPException(
@@ -54,51 +165,139 @@ class DiscordService:
                 status_code=400,
                 detail=f"Channel ID {channel_id} is not a text channel.",
             )
+        return channel
 
-        print(
-            f'チャンネル "{channel.name}" のメッセージを取得します (上限: {limit})...'
-        )
-        messages_data: list[Message] = []
+    async def _fetch_channel(self, channel_id: int) -> discord.abc.GuildChannel | None:
+        if channel := _fetched_channels.get(channel_id):
+            return channel
         try:
-            async for message in channel.history(limit=limit, after=after):
-                messages_data.extend(
-                    [
-                        Message(
-                            id=message.id,
-                            content=message.content,
-                            author_name=message.author.name,
-                            author_id=message.author.id,
-                            created_at=message.created_at.isoformat(),
-                        )
-                    ]
-                )
-            print(
-                f"--- {len(messages_data)} 件のメッセージをAPIレスポンスとして返します ---"
-            )
-            return messages_data
+            channel = await self.discord_client.fetch_channel(channel_id)
+        except discord.errors.NotFound:
+            return None
+        except discord.errors.Forbidden as e:
+            raise HTTPException(
+                status_code=403,
+                detail=f"Missing permissions to access channel {channel_id}.",
+            ) from e
+        _fetched_channels[channel_id] = channel
+        return channel
+
+    async def iter_channel_messages(
+        self,
+        channel_id: int,
+        limit: int | None = 100,
+        before: datetime | discord.abc.Snowflake | None = None,
+        after: datetime | discord.abc.Snowflake | None = None,
+    ) -> AsyncIterator[MessageRecord]:
+        """指定されたチャンネルIDのメッセージを、channel.history が返すたびに返す
 
+        after を指定した場合は (before と一緒に指定した場合も) 古い順、それ以外は新しい順に返す
+        (channel.history と同じ)。
+        """
+        channel = await self.get_text_channel(channel_id)
+        log_event(
+            "チャンネルのメッセージを取得します",
+            channel_id=channel_id,
+            channel_name=channel.name,
+            limit=limit,
+        )
+        count = 0
+        # レート制限のバケットごとの待機は discord.py が行う。ここでは同時に読む数を抑える
+        # 枠は次のメッセージ (ページ) を取得する間だけ持つ。NDJSON を読むクライアントが
+        # 遅くても、yield している間は他のチャンネルの取得を止めない
+        slot = self.rest_semaphore or contextlib.nullcontext()
+        history = channel.history(limit=limit, before=before, after=after)
+        try:
+            with span("discord_history", channel_id=channel_id) as fields:
+                while True:
+                    async with slot:
+                        try:
+                            message = await anext(history)
+                        except StopAsyncIteration:
+                            break
+                    count += 1
+                    yield MessageRecord.from_discord(message)
+                fields["count"] = count
         except discord.errors.Forbidden as e:
-            print(
-                f'エラー: チャンネル "{channel.name}" のメッセージ履歴を読む権限がありません。'
+            log_event(
+                "チャンネルのメッセージ履歴を読む権限がありません",
+                logging.ERROR,
+                channel_name=channel.name,
             )
             raise HTTPException(
                 status_code=403,
                 detail=f"Missing permissions to read history in channel {channel_id}.",
             ) from e
         except Exception as e:
-            print(f"メッセージ取得中にエラーが発生しました: {e}")
+            log_event(
+                "メッセージ取得中にエラーが発生しました", logging.ERROR, error=str(e)
+            )
             raise HTTPException(
                 status_code=500,
                 detail=f"An error occurred while fetching messages: {e}",
             ) from e
 
-    async def get_discord_defined_channel_messages(self, after: datetime | None = None):
-        channel_id = int(os.getenv("DISCORD_CHANNEL_ID") or 0)
-        print(f"チャンネルID: {channel_id}")
+    async def get_discord_channel_messages(
+        self,
+        channel_id: int,
+        limit: int | None = 100,
+        after: datetime | discord.abc.Snowflake | None = None,
+        before: datetime | discord.abc.Snowflake | None = None,
+    ) -> list[Message]:
+        """指定されたチャンネルIDのメッセージ履歴を取得する"""
+        messages = [
+            record.to_message()
+            async for record in self.iter_channel_messages(
+                channel_id, limit, before=before, after=after
+            )
+        ]
+        log_event("メッセージをAPIレスポンスとして返します", count=len(messages))
+        return messages
+
+    def defined_channel_id(self) -> int:
+        return configured_channels()[0].channel_id
+
+    def configured_channels(self) -> list[ChannelConfig]:
+        return configured_channels()
+
+    async def get_discord_defined_channel_messages(
+        self, after: datetime | discord.abc.Snowflake | None = None
+    ):
+        channel_id = self.defined_channel_id()
+        log_event("チャンネルID", channel_id=channel_id)
         try:
             return await self.get_discord_channel_messages(
                 channel_id=channel_id, after=after
             )
         except HTTPException as e:
-            print(f"チャンネルID: {channel_id}")
+            log_event("チャンネルID", logging.ERROR, channel_id=channel_id)
             raise e
+
+    async def get_discord_unprocessed_messages(self, channel_id: int) -> list[Message]:
+        """保存済みカーソルより新しいメッセージを古い順に取得する
+
+        カーソルが無い場合は直近 INITIAL_HISTORY_WINDOW の期間 (UTC) を読み込む。
+        """
+        last_message_id = (
+            self.cursor_store.get(channel_id) if self.cursor_store else None
+        )
+        after: datetime | discord.Object
+        if last_message_id is None:
+            after = datetime.now(UTC) - INITIAL_HISTORY_WINDOW
+        else:
+            after = discord.Object(id=last_message_id)
+        return await self.get_discord_channel_messages(
+            channel_id=channel_id, limit=None, after=after
+        )
+
+    def advance_channel_cursor(self, channel_id: int, message_id: int | None) -> None:
+        """投稿が完了したメッセージIDまでカーソルを進める"""
+        if message_id is None or self.cursor_store is None:
+            return
+        self.cursor_store.advance(channel_id, message_id)
+
+    def record_message_failure(self, channel_id: int, message_id: int) -> int:
+        """メッセージの処理に失敗したことを記録し、これまでの失敗回数を返す"""
+        if self.cursor_store is None:
+            return 1
+        return self.cursor_store.record_failure(channel_id, message_id)
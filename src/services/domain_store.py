@@ -0,0 +1,69 @@
+import os
+import time
+
+from dotenv import load_dotenv
+
+from utils.storage import connect
+
+load_dotenv()
+
+DOMAIN_STORE_PATH = os.getenv("DOMAIN_STORE_PATH", "state.sqlite3")
+# この回数続けて URL の取得に失敗したドメインは、URL を読まずに検索で要約する
+URL_FAILURE_THRESHOLD = int(os.getenv("URL_FAILURE_THRESHOLD", "2"))
+# 失敗の記録を有効とする期間 (秒)。過ぎたら再び URL の取得を試す
+URL_FAILURE_TTL_SECONDS = int(os.getenv("URL_FAILURE_TTL_SECONDS", "604800"))
+
+
+class DomainFailureStore:
+    """ドメインごとに URL の取得 (グラウンディング) に連続で失敗した回数を保存する"""
+
+    def __init__(
+        self,
+        path: str = DOMAIN_STORE_PATH,
+        threshold: int = URL_FAILURE_THRESHOLD,
+        ttl_seconds: int = URL_FAILURE_TTL_SECONDS,
+    ):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.conn = connect(path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS url_domain_failures (
+                domain TEXT PRIMARY KEY,
+                failures INTEGER NOT NULL,
+                last_failed_at REAL NOT NULL
+            )
+            """
+        )
+
+    def is_blocked(self, domain: str) -> bool:
+        row = self.conn.execute(
+            "SELECT failures, last_failed_at FROM url_domain_failures WHERE domain = ?",
+            (domain,),
+        ).fetchone()
+        if row is None:
+            return False
+        failures, last_failed_at = row
+        if time.time() - last_failed_at > self.ttl_seconds:
+            return False
+        return failures >= self.threshold
+
+    def record_failure(self, domain: str) -> None:
+        now = time.time()
+        # 期限切れの記録は数え直す
+        self.conn.execute(
+            """
+            INSERT INTO url_domain_failures (domain, failures, last_failed_at)
+            VALUES (?, 1, ?)
+            ON CONFLICT (domain) DO UPDATE SET
+                failures = CASE WHEN last_failed_at < ? THEN 1 ELSE failures + 1 END,
+                last_failed_at = excluded.last_failed_at
+            """,
+            (domain, now, now - self.ttl_seconds),
+        )
+
+    def record_success(self, domain: str) -> None:
+        self.conn.execute("DELETE FROM url_domain_failures WHERE domain = ?", (domain,))
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,154 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import random
+import time
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http import HTTPStatus
+from typing import Literal
+
+from dotenv import load_dotenv
+from google.genai import errors
+
+from services.rate_limit_store import RateLimitStore
+from utils.metrics import GEMINI_QUEUE_DEPTH, GEMINI_QUEUE_WAIT, RETRIES
+from utils.telemetry import log_event
+
+load_dotenv()
+
+# Vertex AI の割り当てに合わせた1分あたりのリクエスト数とトークン数 (0 は無制限)
+# 同じ DATA_DIR を使うすべてのプロセスの合計
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "60"))
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", "1000000"))
+# 割り当て超過 (429) を再試行する最大回数
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+GEMINI_BACKOFF_SECONDS = 1.0
+GEMINI_MAX_BACKOFF_SECONDS = 60.0
+
+
+# interactive: ライブ要約や API からの直接の要約 / backlog: ジョブや RSS などの溜まった分の処理
+Priority = Literal["interactive", "backlog"]
+PRIORITY_ORDER: dict[Priority, int] = {"interactive": 0, "backlog": 1}
+
+_priority: ContextVar[Priority] = ContextVar("gemini_priority", default="interactive")
+
+
+@contextmanager
+def gemini_priority(priority: Priority) -> Iterator[None]:
+    """ブロック内 (同じタスクと、そこから作成したタスク) の Gemini 呼び出しの優先度を変える"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+# RateLimitStore に保存するバケットの名前
+REQUESTS_BUCKET = "gemini:requests"
+TOKENS_BUCKET = "gemini:tokens"
+
+
+class GeminiScheduler:
+    """プロセス内のすべての Gemini 呼び出しを、RPM / TPM の範囲に収めて順に実行する
+
+    待っている呼び出しは優先度 (interactive が先)、同じ優先度なら到着順に実行する。
+    割り当ての残量は store に保存し、同じ store を使う他のプロセスと共有する
+    (優先度はプロセス内だけで効く)。
+    割り当て超過 (429) はジッター付きの指数バックオフで再試行する。
+    """
+
+    def __init__(
+        self,
+        rpm: int = GEMINI_RPM,
+        tpm: int = GEMINI_TPM,
+        max_retries: int = GEMINI_MAX_RETRIES,
+        window_seconds: float = 60.0,
+        store: RateLimitStore | None = None,
+    ):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.window_seconds = window_seconds
+        self.store = store or RateLimitStore(":memory:")
+        self.max_retries = max_retries
+        # (優先度, 到着順, 推定トークン数, 実行を許可する Future)
+        self._waiters: list[tuple[int, int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._dispatcher: asyncio.Task | None = None
+
+    async def run[T](self, call: Callable[[], Awaitable[T]], tokens: int) -> T:
+        """順番が来たら call を実行する。tokens は入出力の推定トークン数"""
+        attempt = 0
+        while True:
+            await self.acquire(tokens)
+            try:
+                return await call()
+            except errors.APIError as e:
+                if (
+                    e.code != HTTPStatus.TOO_MANY_REQUESTS
+                    or attempt >= self.max_retries
+                ):
+                    raise
+            RETRIES.inc(target="gemini")
+            # 同時に 429 を受けた呼び出しが揃って再試行しないよう、待ち時間をばらつかせる
+            delay = random.uniform(  # noqa: S311
+                0,
+                min(GEMINI_BACKOFF_SECONDS * 2**attempt, GEMINI_MAX_BACKOFF_SECONDS),
+            )
+            log_event(
+                "Geminiの割り当てを超えたため再試行します",
+                logging.WARNING,
+                attempt=attempt + 1,
+                delay_seconds=round(delay, 3),
+            )
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def acquire(self, tokens: int) -> None:
+        """リクエスト1回分と tokens 分の割り当てを確保するまで待つ"""
+        priority = _priority.get()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            self._waiters,
+            (PRIORITY_ORDER[priority], next(self._sequence), tokens, future),
+        )
+        GEMINI_QUEUE_DEPTH.inc(priority=priority)
+        start = time.perf_counter()
+        self._wake()
+        try:
+            await future
+        finally:
+            GEMINI_QUEUE_DEPTH.dec(priority=priority)
+            GEMINI_QUEUE_WAIT.observe(time.perf_counter() - start, priority=priority)
+
+    def adjust(self, tokens: int) -> None:
+        """実際の使用量と推定の差 (実際 - 推定) を精算する"""
+        self.store.take([(TOKENS_BUCKET, self.tpm, tokens)], self.window_seconds)
+
+    def available_tokens(self) -> float:
+        return self.store.available(TOKENS_BUCKET, self.tpm, self.window_seconds)
+
+    def _wake(self) -> None:
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def _dispatch(self) -> None:
+        while self._waiters:
+            _, _, tokens, future = self._waiters[0]
+            if future.done():
+                # 待っている間に取り消された
+                heapq.heappop(self._waiters)
+                continue
+            wait = self.store.try_take(
+                [(REQUESTS_BUCKET, self.rpm, 1), (TOKENS_BUCKET, self.tpm, tokens)],
+                self.window_seconds,
+            )
+            if wait > 0:
+                # 待つ間に優先度の高い呼び出しが来たら、次はそちらを先に実行する
+                await asyncio.sleep(wait)
+                continue
+            heapq.heappop(self._waiters)
+            future.set_result(None)
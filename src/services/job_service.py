@@ -0,0 +1,278 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from dotenv import load_dotenv
+from fastapi import Request
+from pydantic import BaseModel
+
+from utils.storage import connect
+from utils.telemetry import log_event
+
+load_dotenv()
+
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", "state.sqlite3")
+
+ACTIVE_STATUSES = ("queued", "running")
+JOB_COLUMNS = "id, kind, key, status, progress, result, error, created_at, updated_at"
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobProgress(BaseModel):
+    total: int = 0
+    done: int = 0
+    failed: int = 0
+
+
+class Job(BaseModel):
+    id: str
+    kind: str
+    key: str
+    status: str  # "queued" | "running" | "succeeded" | "failed" | "interrupted"
+    progress: JobProgress
+    result: Any = None
+    error: str | None = None
+    created_at: float
+    updated_at: float
+
+
+class JobAccepted(BaseModel):
+    """ジョブを登録した API の応答 (202)"""
+
+    job_id: str
+    status: str
+    created: bool  # False の場合、同じキーで実行中のジョブを返している
+
+
+# ジョブ本体。進捗を報告するコールバックを受け取り、結果 (JSON化できる値) を返す
+JobRunner = Callable[[Callable[[JobProgress], None]], Awaitable[Any]]
+
+
+class JobStore:
+    """ジョブの状態を SQLite に保存する
+
+    複数のプロセスで同じファイルを共有できるよう、ジョブには実行するプロセス (owner) を記録する。
+    """
+
+    def __init__(self, path: str = JOB_STORE_PATH):
+        self.host = socket.gethostname()
+        self.owner = f"{self.host}:{os.getpid()}"
+        self.conn = connect(path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progress TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_key_status ON jobs (key, status)"
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+        if "owner" not in columns:
+            self.conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+
+    def _to_job(self, row: tuple) -> Job:
+        id_, kind, key, status, progress, result, error, created_at, updated_at = row
+        return Job(
+            id=id_,
+            kind=kind,
+            key=key,
+            status=status,
+            progress=JobProgress(**json.loads(progress)),
+            result=json.loads(result) if result is not None else None,
+            error=error,
+            created_at=created_at,
+            updated_at=updated_at,
+        )
+
+    def get(self, job_id: str) -> Job | None:
+        row = self.conn.execute(
+            f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = ?",  # noqa: S608
+            (job_id,),
+        ).fetchone()
+        return self._to_job(row) if row else None
+
+    def create_or_get_active(self, kind: str, key: str) -> tuple[Job, bool]:
+        """同じキーで実行中のジョブがあればそれを返し、無ければ新しく作成する
+
+        戻り値の2番目は新しく作成したかどうか。
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute(
+                f"SELECT {JOB_COLUMNS} FROM jobs"  # noqa: S608
+                " WHERE key = ? AND status IN (?, ?)",
+                (key, *ACTIVE_STATUSES),
+            ).fetchone()
+            if row:
+                self.conn.execute("COMMIT")
+                return self._to_job(row), False
+            now = time.time()
+            job_id = uuid.uuid4().hex
+            self.conn.execute(
+                """
+                INSERT INTO jobs
+                    (id, kind, key, status, progress, created_at, updated_at, owner)
+                VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)
+                """,
+                (
+                    job_id,
+                    kind,
+                    key,
+                    JobProgress().model_dump_json(),
+                    now,
+                    now,
+                    self.owner,
+                ),
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        job = self.get(job_id)
+        assert job is not None
+        return job, True
+
+    def update(
+        self,
+        job_id: str,
+        status: str | None = None,
+        progress: JobProgress | None = None,
+        result: Any = None,
+        error: str | None = None,
+    ) -> None:
+        fields: dict[str, Any] = {"updated_at": time.time()}
+        if status is not None:
+            fields["status"] = status
+        if progress is not None:
+            fields["progress"] = progress.model_dump_json()
+        if result is not None:
+            fields["result"] = json.dumps(result, ensure_ascii=False)
+        if error is not None:
+            fields["error"] = error
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self.conn.execute(
+            f"UPDATE jobs SET {assignments} WHERE id = ?",  # noqa: S608
+            (*fields.values(), job_id),
+        )
+
+    def interrupt_active(self) -> None:
+        """このプロセスで実行中のジョブを中断扱いにする (終了時に使う)"""
+        self.conn.execute(
+            "UPDATE jobs SET status = 'interrupted', updated_at = ?"
+            " WHERE owner = ? AND status IN (?, ?)",
+            (time.time(), self.owner, *ACTIVE_STATUSES),
+        )
+
+    def interrupt_orphaned(self) -> None:
+        """終了したプロセスが残した実行中のジョブを中断扱いにする (起動時に使う)
+
+        同じファイルを使う他のワーカーが実行中のジョブはそのままにする。
+        別のホストのジョブはプロセスの状態を確認できないため対象にしない。
+        """
+        rows = self.conn.execute(
+            "SELECT id, owner FROM jobs WHERE status IN (?, ?)", ACTIVE_STATUSES
+        ).fetchall()
+        orphaned = []
+        for job_id, owner in rows:
+            host, _, pid = (owner or "").rpartition(":")
+            # 起動直後のため、自分の owner のジョブは同じ PID だった前のプロセスのもの
+            if owner in {None, self.owner} or (
+                host == self.host and not _process_alive(int(pid))
+            ):
+                orphaned.append(job_id)
+        now = time.time()
+        self.conn.executemany(
+            "UPDATE jobs SET status = 'interrupted', updated_at = ?"
+            " WHERE id = ? AND status IN (?, ?)",
+            [(now, job_id, *ACTIVE_STATUSES) for job_id in orphaned],
+        )
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class JobService:
+    """ジョブをバックグラウンドタスクとして実行し、状態を JobStore に記録する"""
+
+    def __init__(self, store: JobStore):
+        self.store = store
+        self._tasks: set[asyncio.Task] = set()
+
+    def submit(self, kind: str, key: str, runner: JobRunner) -> tuple[Job, bool]:
+        """ジョブを登録して実行を開始する
+
+        同じキーのジョブが実行中の場合は新しく実行せず、そのジョブを返す。
+        """
+        job, created = self.store.create_or_get_active(kind, key)
+        if created:
+            task = asyncio.create_task(self._run(job.id, runner))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return job, created
+
+    async def run(self, kind: str, key: str, runner: JobRunner) -> tuple[Job, bool]:
+        """ジョブを登録し、完了するまで待って結果を記録したジョブを返す
+
+        同じキーのジョブが (他のプロセスで) 実行中の場合は実行せず、そのジョブを返す。
+        """
+        job, created = self.store.create_or_get_active(kind, key)
+        if created:
+            await self._run(job.id, runner)
+            job = self.store.get(job.id)
+            assert job is not None
+        return job, created
+
+    async def _run(self, job_id: str, runner: JobRunner) -> None:
+        self.store.update(job_id, status="running")
+
+        def report(progress: JobProgress) -> None:
+            self.store.update(job_id, progress=progress)
+
+        try:
+            result = await runner(report)
+        except asyncio.CancelledError:
+            # 実行中のままにすると、同じキーのジョブを登録できなくなる
+            self.store.update(job_id, status="interrupted")
+            raise
+        except Exception as e:
+            log_event(
+                "ジョブが失敗しました", logging.ERROR, job_id=job_id, error=str(e)
+            )
+            self.store.update(job_id, status="failed", error=str(e))
+            return
+        self.store.update(job_id, status="succeeded", result=result)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self.store.interrupt_active()
+
+
+def get_job_service(request: Request) -> JobService:
+    return request.app.state.job_service
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+import os
+
+import discord
+from dotenv import load_dotenv
+
+from services.discord_service import ChannelConfig, Message, to_message
+from services.misskey_service import MisskeyService
+from utils.telemetry import log_event
+
+load_dotenv()
+
+# on_message で受け取ったメッセージを即時に要約するモード (オプトイン)
+LIVE_SUMMARY_ENABLED = os.getenv("LIVE_SUMMARY_ENABLED", "false").lower() == "true"
+LIVE_SUMMARY_WORKERS = int(os.getenv("LIVE_SUMMARY_WORKERS", "2"))
+
+
+class LiveSummaryService:
+    """Discord の on_message をキューに積み、バックグラウンドで要約・投稿する
+
+    チャンネルのカーソルは進めない。より古いメッセージ (停止中の投稿や、失敗したライブ要約)
+    を /misskey/summary が飛ばさないようにするため。ポーリング側で同じメッセージを読んでも、
+    投稿台帳に記録済みのため生成・投稿し直さない。
+    """
+
+    def __init__(
+        self,
+        misskey_service: MisskeyService,
+        channels: list[ChannelConfig],
+        workers: int = LIVE_SUMMARY_WORKERS,
+    ):
+        self.misskey_service = misskey_service
+        self.channels = {channel.channel_id: channel for channel in channels}
+        self.workers = max(1, workers)
+        self.queue: asyncio.Queue[tuple[ChannelConfig, Message]] = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        log_event("ライブ要約を開始しました", channel_ids=list(self.channels))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def enqueue(self, message: discord.Message) -> bool:
+        """対象チャンネルのユーザー投稿であればキューに追加する"""
+        channel = self.channels.get(message.channel.id)
+        if channel is None or message.author.bot:
+            return False
+        if not message.content.strip():
+            return False
+        self.queue.put_nowait((channel, to_message(message)))
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            channel, message = await self.queue.get()
+            try:
+                await self.misskey_service.message_summaries(
+                    [message], visibility=channel.visibility
+                )
+            except Exception as e:
+                log_event(
+                    "ライブ要約中にエラーが発生しました", logging.ERROR, error=str(e)
+                )
+            finally:
+                self.queue.task_done()
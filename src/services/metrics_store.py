@@ -0,0 +1,95 @@
+import asyncio
+import contextlib
+import json
+import os
+import time
+
+from dotenv import load_dotenv
+
+from utils.metrics import REGISTRY, Registry
+from utils.storage import connect
+
+load_dotenv()
+
+METRICS_STORE_PATH = os.getenv("METRICS_STORE_PATH", "state.sqlite3")
+# true の場合、各プロセスのメトリクスを共有し、/metrics で全プロセス分を返す (serve.py が設定する)
+METRICS_MULTIPROCESS = os.getenv("METRICS_MULTIPROCESS", "false").lower() == "true"
+# 各プロセスがメトリクスを書き込む間隔 (秒)
+METRICS_PUBLISH_INTERVAL_SECONDS = float(
+    os.getenv("METRICS_PUBLISH_INTERVAL_SECONDS", "10")
+)
+# この回数分の間隔を過ぎても更新されないプロセス (終了したワーカーなど) は返さない
+STALE_INTERVALS = 3
+
+
+class MetricsStore:
+    """プロセスごとのメトリクスを SQLite に保存し、全プロセス分をまとめて返す
+
+    serve.py で起動したワーカーとゲートウェイが定期的に自分のメトリクスを書き込む。
+    どのワーカーがスクレイプに応答しても、全プロセスのサンプルを process ラベル付きで返す。
+    """
+
+    def __init__(
+        self,
+        path: str = METRICS_STORE_PATH,
+        registry: Registry = REGISTRY,
+        interval_seconds: float = METRICS_PUBLISH_INTERVAL_SECONDS,
+        process: str | None = None,
+    ):
+        self.registry = registry
+        self.interval_seconds = interval_seconds
+        self.process = process or str(os.getpid())
+        self._task: asyncio.Task | None = None
+        self.conn = connect(path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS process_metrics (
+                process TEXT PRIMARY KEY,
+                samples TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+
+    def publish(self) -> None:
+        """このプロセスのメトリクスを書き込む"""
+        samples = self.registry.samples(process=self.process)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO process_metrics (process, samples, updated_at)"
+            " VALUES (?, ?, ?)",
+            (self.process, json.dumps(samples), time.time()),
+        )
+
+    def render(self) -> str:
+        """全プロセスのメトリクスを Prometheus のテキスト形式で返す"""
+        self.publish()
+        stale_before = time.time() - self.interval_seconds * STALE_INTERVALS
+        self.conn.execute(
+            "DELETE FROM process_metrics WHERE updated_at < ?", (stale_before,)
+        )
+        rows = self.conn.execute(
+            "SELECT samples FROM process_metrics ORDER BY process"
+        ).fetchall()
+        return self.registry.render([json.loads(samples) for (samples,) in rows])
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._publish_periodically())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        # 終了したプロセスのメトリクスは返さない
+        self.conn.execute(
+            "DELETE FROM process_metrics WHERE process = ?", (self.process,)
+        )
+
+    async def _publish_periodically(self) -> None:
+        while True:
+            self.publish()
+            await asyncio.sleep(self.interval_seconds)
+
+    def close(self) -> None:
+        self.conn.close()
@@ -1,14 +1,25 @@
+import asyncio
+import contextlib
+import logging
 import os
+from collections.abc import AsyncIterable, AsyncIterator, Callable, Iterable
+from contextvars import ContextVar
+from datetime import UTC, datetime
+from email.utils import parsedate_to_datetime
 from http import HTTPStatus
 
-import requests
+import httpx
 from dotenv import load_dotenv
-from fastapi import HTTPException
-from langchain_community.document_loaders import WebBaseLoader
-from vertexai.generative_models import GenerationConfig, GenerativeModel, Tool
+from fastapi import Request
+from pydantic import BaseModel
 
 from services.ai_service import AIService
-from utils.url_validator import which_url
+from services.batch_service import BatchOutcome, BatchSummaryService
+from services.digest_service import SummaryUnit, plan_units
+from services.discord_service import Message, Visibility
+from services.post_ledger import PostLedger
+from utils.metrics import MISSKEY_NOTES_POSTED, RETRIES
+from utils.telemetry import log_event, span
 
 load_dotenv()
 
@@ -22,44 +33,467 @@ if not PROJECT_ID or not REGION:
 
 load_dotenv()
 
+# Gemini を同時に呼び出す最大数
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+# Misskey への投稿を再試行する最大回数
+MISSKEY_MAX_RETRIES = int(os.getenv("MISSKEY_MAX_RETRIES", "3"))
+MISSKEY_BACKOFF_SECONDS = 1.0
+MISSKEY_MAX_BACKOFF_SECONDS = 60.0
+# true の場合、Gemini の生成を待たずに確定したノートから順に投稿する
+SUMMARY_STREAMING_ENABLED = (
+    os.getenv("SUMMARY_STREAMING_ENABLED", "false").lower() == "true"
+)
+
+
+# 現在のタスク内で行った再試行の回数 (同時に動く別のジョブと区別するため)
+_post_retries: ContextVar[int] = ContextVar("post_retries", default=0)
+
+
+# リクエストを送る前に失敗したエラー。ノートは作成されていないため再試行できる
+_UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# ストリーミングの終わりを表す番兵
+_STREAM_END = object()
+
+
+class MisskeyPostError(Exception):
+    pass
+
+
+async def _iterate(texts: Iterable[str]) -> AsyncIterator[str]:
+    for text in texts:
+        yield text
+
+
+async def _drain(queue: asyncio.Queue) -> AsyncIterator[str]:
+    """_STREAM_END を受け取るまでキューの中身を返す"""
+    while (text := await queue.get()) is not _STREAM_END:
+        yield text
+
+
+async def _completed(texts: list[str]) -> list[str]:
+    return texts
+
+
+def _message_key(message: Message) -> str:
+    return f"discord:{message.id}"
+
+
+def _unit_key(unit: SummaryUnit) -> str:
+    """投稿台帳のキー。ダイジェストはまとめたメッセージすべてのIDで識別する"""
+    if unit.key is not None:
+        return unit.key
+    return "discord:" + ",".join(str(message.id) for message in unit.messages)
+
+
+def _retry_after_seconds(response: httpx.Response) -> float | None:
+    """Retry-After ヘッダー (秒数 または HTTP-date) を秒数に変換する"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(UTC)).total_seconds())
+
+
+class SummaryResult(BaseModel):
+    """1メッセージ分の要約・投稿結果"""
+
+    message_id: int
+    status: str  # "success" | "failed" | "skipped"
+    note_ids: list[str] = []
+    retries: int = 0
+    error: str | None = None
+
+
+def last_contiguous_success(results: list[SummaryResult]) -> int | None:
+    """先頭から連続して成功したメッセージのうち、最後のメッセージIDを返す
+
+    失敗を繰り返して飛ばした (skipped) メッセージは、成功と同じく通過する。
+    """
+    last_message_id: int | None = None
+    for result in results:
+        if result.status not in ("success", "skipped"):
+            break
+        last_message_id = result.message_id
+    return last_message_id
+
 
 class MisskeyService:
-    def __init__(self):
+    def __init__(  # noqa: PLR0913
+        self,
+        http_client: httpx.AsyncClient | None = None,
+        concurrency: int = SUMMARY_CONCURRENCY,
+        ai_service: AIService | None = None,
+        streaming: bool = SUMMARY_STREAMING_ENABLED,
+        batch_service: BatchSummaryService | None = None,
+        *,
+        ledger: PostLedger | None = None,
+    ):
         self.missky_host = os.getenv("MISSKY_HOST")
         self.missky_token = os.getenv("MISSKY_TOKEN")
-        self.ai_searvice = AIService()
+        self.ai_searvice = ai_service or AIService()
+        self.http_client = http_client
+        self.concurrency = max(1, concurrency)
+        self.max_retries = MISSKEY_MAX_RETRIES
+        self.streaming = streaming
+        self.batch_service = batch_service
+        # 途中で失敗した投稿を、生成し直さずに続きから投稿するための台帳
+        self.ledger = ledger
+        self.posted_count = 0  # 投稿に成功したノート数
+        self.retried_count = 0  # 再試行した回数
 
-    async def message_summaries(self, messages):
-        for message in messages:
-            print("message:", message.content.strip())
-            await self.message_summary(message.content.strip())
-        return messages
+    async def message_summaries(
+        self,
+        messages: list[Message],
+        on_result: Callable[[SummaryResult], None] | None = None,
+        digest: bool = False,
+        visibility: Visibility = "home",
+    ) -> list[SummaryResult]:
+        """メッセージを並列に要約し、元の順番でMisskeyに投稿する
+
+        Gemini の呼び出しは concurrency 件まで並列に実行し、投稿はメッセージ順に行う。
+        1件の失敗でバッチ全体を止めず、メッセージごとの結果を返す。
+        on_result を指定すると、1件処理するたびに結果を渡して呼び出す。
+        streaming の場合は、投稿の順番が来たメッセージのノートを生成中から投稿する。
+        batch_service があり、メッセージが溜まっている場合はバッチ予測でまとめて要約してから投稿する。
+        digest の場合は、URL を含まないメッセージをまとめて1回で要約し、
+        まとめたメッセージすべてに同じ結果を返す。
+        visibility は投稿するノートの公開範囲。
+        ledger がある場合、前回までに要約を生成済みのメッセージは生成し直さず、
+        投稿済みのノートを飛ばしてスレッドの続きから投稿する。
+        台帳はメッセージごとに引くため、前回と違う単位にまとめ直して投稿し直すことはない。
+        """
+        units = plan_units(
+            messages, digest=digest, sources=self._recorded_sources(messages)
+        )
+        keys = [_unit_key(unit) for unit in units]
+        if self.ledger is not None:
+            for unit, key in zip(units, keys, strict=True):
+                if unit.key is None:
+                    self.ledger.record_members(
+                        key, [_message_key(message) for message in unit.messages]
+                    )
+        queues: list[asyncio.Queue] = [asyncio.Queue() for _ in units]
+        tasks, streamed = await self._start_units(units, keys, queues)
+        results: list[SummaryResult] = []
+        try:
+            for unit, key, task, queue, is_streamed in zip(
+                units, keys, tasks, queues, streamed, strict=True
+            ):
+                retried_before = _post_retries.get()
+                note_ids: list[str] = []
+                error: str | None = None
+                try:
+                    if is_streamed:
+                        try:
+                            note_ids = await self._post_thread(
+                                _drain(queue), visibility, key
+                            )
+                        except MisskeyPostError:
+                            # 生成は最後まで続けて台帳に記録し、次回は同じ要約の続きから投稿する
+                            with contextlib.suppress(Exception):
+                                await task
+                            raise
+                        # 生成中のエラーはここで送出される
+                        await task
+                    else:
+                        note_ids = await self._post_thread(await task, visibility, key)
+                except Exception as e:
+                    log_event(
+                        "要約に失敗しました",
+                        logging.WARNING,
+                        message_id=unit.messages[0].id,
+                        error=str(e),
+                    )
+                    error = str(e)
+                for message in unit.messages:
+                    result = SummaryResult(
+                        message_id=message.id,
+                        status="failed" if error is not None else "success",
+                        note_ids=note_ids if error is None else [],
+                        retries=_post_retries.get() - retried_before,
+                        error=error,
+                    )
+                    results.append(result)
+                    if on_result is not None:
+                        on_result(result)
+        finally:
+            for task in tasks:
+                task.cancel()
+        # ダイジェストは最初のメッセージの位置で投稿するため、結果はメッセージ順に並べ直す
+        order = {message.id: index for index, message in enumerate(messages)}
+        return sorted(results, key=lambda result: order[result.message_id])
+
+    async def _start_units(
+        self,
+        units: list[SummaryUnit],
+        keys: list[str],
+        queues: list[asyncio.Queue],
+    ) -> tuple[list[asyncio.Task], list[bool]]:
+        """ユニットごとに要約のタスクを開始する
+
+        2番目の戻り値は、生成中のノートを queues で受け取って投稿するユニットかどうか。
+        台帳に生成済みの要約があるユニットは、生成せずにその要約を返す。
+        """
+        for key in keys:
+            self._discard_interrupted(key)
+        recorded = [self._recorded_texts(key) for key in keys]
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def summarize(unit: SummaryUnit, key: str) -> list[str]:
+            async with semaphore:
+                log_event(
+                    "メッセージを要約します",
+                    message_id=unit.messages[0].id,
+                    messages=len(unit.messages),
+                )
+                texts = await self._summarize(unit.prompt)
+            # 投稿の順番を待つ間に中断しても、生成し直さずに済むよう先に記録する
+            self._record_texts(key, texts)
+            return texts
+
+        async def from_batch(outcome: BatchOutcome, key: str) -> list[str]:
+            texts = outcome.result()
+            self._record_texts(key, texts)
+            return texts
+
+        async def stream(unit: SummaryUnit, key: str, queue: asyncio.Queue) -> None:
+            try:
+                async with semaphore:
+                    log_event(
+                        "メッセージを要約します",
+                        message_id=unit.messages[0].id,
+                        messages=len(unit.messages),
+                    )
+                    async for text in self._record_stream(
+                        key, self._summarize_stream(unit.prompt)
+                    ):
+                        queue.put_nowait(text)
+            finally:
+                queue.put_nowait(_STREAM_END)
+
+        pending = [
+            unit for unit, texts in zip(units, recorded, strict=True) if texts is None
+        ]
+        batch = self.batch_service is not None and self.batch_service.should_batch(
+            len(pending)
+        )
+        outcomes = iter(
+            await self.batch_service.summarize([u.prompt for u in pending])
+            if batch
+            else ()
+        )
+        tasks: list[asyncio.Task] = []
+        streamed: list[bool] = []
+        for unit, key, texts, queue in zip(units, keys, recorded, queues, strict=True):
+            if texts is not None:
+                tasks.append(asyncio.create_task(_completed(texts)))
+            elif batch:
+                tasks.append(asyncio.create_task(from_batch(next(outcomes), key)))
+            elif self.streaming:
+                tasks.append(asyncio.create_task(stream(unit, key, queue)))
+            else:
+                tasks.append(asyncio.create_task(summarize(unit, key)))
+            streamed.append(texts is None and self.streaming and not batch)
+        return tasks, streamed
+
+    def _backoff_seconds(self, attempt: int, response: httpx.Response | None) -> float:
+        if response is not None and (retry_after := _retry_after_seconds(response)):
+            return min(retry_after, MISSKEY_MAX_BACKOFF_SECONDS)
+        return min(MISSKEY_BACKOFF_SECONDS * 2**attempt, MISSKEY_MAX_BACKOFF_SECONDS)
 
     async def _post_to_misskey(self, body: dict[str, str]):
-        headers = {"Content-Type": "application/json"}
+        """ノートを投稿する。接続できなかった場合と 429 はバックオフして再試行する
+
+        5xx はノートが作成済みの可能性があるため、重複して投稿しないよう再試行しない。
+        """
+        if self.http_client is None:
+            raise RuntimeError("HTTP client is not initialized.")
+        with span("misskey_post"):
+            return await self._post_with_retries(body)
+
+    async def _post_with_retries(self, body: dict[str, str]) -> str:
         kamomai_url = f"https://{self.missky_host}/api"
-        response = requests.post(
-            f"{kamomai_url}/notes/create", headers=headers, json=body, timeout=5
-        )
-        if response.status_code != HTTPStatus.OK:
-            raise ValueError(
-                "Error posting to Misskey:", response.status_code, response.text
+        for attempt in range(self.max_retries + 1):
+            response: httpx.Response | None = None
+            try:
+                response = await self.http_client.post(
+                    f"{kamomai_url}/notes/create", json=body
+                )
+            except _UNSENT_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise MisskeyPostError(f"Error posting to Misskey: {e}") from e
+            except httpx.TransportError as e:
+                # 送信後のエラー (ReadTimeout など) は、ノートが作成済みかもしれないため再試行しない
+                raise MisskeyPostError(f"Error posting to Misskey: {e}") from e
+            else:
+                if response.status_code == HTTPStatus.OK:
+                    self.posted_count += 1
+                    MISSKEY_NOTES_POSTED.inc()
+                    return response.json()["createdNote"]["id"]
+                # 429 は処理されずに返されるため、ノートは作成されていない
+                rate_limited = response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+                if not rate_limited or attempt >= self.max_retries:
+                    raise MisskeyPostError(
+                        f"Error posting to Misskey: {response.status_code} {response.text}"
+                    )
+            self.retried_count += 1
+            _post_retries.set(_post_retries.get() + 1)
+            RETRIES.inc(target="misskey")
+            delay = self._backoff_seconds(attempt, response)
+            log_event(
+                "Misskeyへの投稿を再試行します",
+                logging.WARNING,
+                attempt=attempt + 1,
+                delay_seconds=delay,
+                status_code=response.status_code if response is not None else None,
             )
-        return response.json()["createdNote"]["id"]
+            await asyncio.sleep(delay)
+        raise MisskeyPostError("Error posting to Misskey: retries exhausted")
 
-    async def message_summary(self, message):
-        texts: list[str] = self.ai_searvice.generate_content_if(message)
+    async def _summarize(self, message: str) -> list[str]:
+        return await self.ai_searvice.agenerate_content_if(message)
+
+    def _summarize_stream(self, message: str) -> AsyncIterator[str]:
+        return self.ai_searvice.astream_content_if(message)
+
+    def _recorded_sources(self, messages: list[Message]) -> dict[int, str]:
+        """要約を生成し終えた単位が台帳にあるメッセージと、その単位のキー
+
+        ライブ要約など、まとめる前の記録はメッセージのキーそのもので引く。
+        """
+        if self.ledger is None:
+            return {}
+        sources: dict[int, str] = {}
+        for message in messages:
+            member_key = _message_key(message)
+            key = self.ledger.source_of(member_key) or member_key
+            self._discard_interrupted(key)
+            if self._recorded_texts(key) is not None:
+                sources[message.id] = key
+        return sources
+
+    def _recorded_texts(self, key: str | None) -> list[str] | None:
+        """台帳に生成し終えた要約があれば返す"""
+        if self.ledger is None or key is None:
+            return None
+        entry = self.ledger.get(key)
+        return entry.texts if entry is not None and entry.complete else None
+
+    def _record_texts(self, key: str | None, texts: list[str]) -> None:
+        if self.ledger is not None and key is not None:
+            self.ledger.record_texts(key, texts, complete=True)
+
+    async def _record_stream(
+        self, key: str | None, texts: AsyncIterable[str]
+    ) -> AsyncIterator[str]:
+        """生成中のテキストを台帳に記録しながら返す。最後まで生成したら complete にする"""
+        position = 0
+        async for text in texts:
+            if self.ledger is not None and key is not None:
+                self.ledger.record_texts(key, [text], start=position)
+            position += 1
+            yield text
+        if self.ledger is not None and key is not None:
+            self.ledger.record_texts(key, [], start=position, complete=True)
+
+    def _discard_interrupted(self, key: str | None) -> None:
+        """生成が途中で止まった要約を、投稿済みのノートごと台帳から捨てる
+
+        生成し直した要約は前回と内容が異なるため、投稿済みのスレッドに続けると
+        2つの要約が混ざる。新しいスレッドとして投稿し直す。
+        """
+        if self.ledger is None or key is None:
+            return
+        entry = self.ledger.get(key)
+        if entry is None or entry.complete or not entry.note_ids:
+            return
+        log_event(
+            "生成が中断された要約を新しいスレッドで投稿し直します",
+            logging.WARNING,
+            key=key,
+            note_ids=entry.note_ids,
+        )
+        self.ledger.discard(key)
+
+    async def _post_thread(
+        self,
+        texts: Iterable[str] | AsyncIterable[str],
+        visibility: Visibility = "home",
+        key: str | None = None,
+    ) -> list[str]:
+        """分割されたテキストをリプライのスレッドとして順番に投稿する
+
+        AsyncIterable を渡すと、テキストが届くたびに投稿する。
+        key を指定すると、投稿したノートを台帳に記録する。
+        前回までに投稿済みの分は投稿せず、最後に投稿したノートへのリプライから続ける。
+        """
+        if not isinstance(texts, AsyncIterable):
+            texts = _iterate(texts)
+        ledger = self.ledger if key is not None else None
+        entry = ledger.get(key) if ledger is not None else None
+        posted = entry.note_ids if entry is not None else []
         body = {
             "i": self.missky_token,
-            "visibility": "home",
+            "visibility": visibility,
         }
-        message_id: str | None = None
-        for text in texts:
+        message_id: str | None = posted[-1] if posted else None
+        note_ids: list[str] = list(posted)
+        position = 0
+        async for text in texts:
+            position += 1
+            if position <= len(posted):
+                continue
             body["text"] = text
             if message_id:
                 body["replyId"] = message_id
             try:
                 message_id = await self._post_to_misskey(body)
             except Exception as e:
-                print("Error posting to Misskey:", text)
+                log_event("Error posting to Misskey", logging.ERROR, text=text)
                 raise e
+            if ledger is not None:
+                ledger.record_note(key, position - 1, message_id)
+            note_ids.append(message_id)
+        return note_ids
+
+    async def post_summary(self, texts: list[str], key: str | None = None) -> list[str]:
+        """要約済みのノートをスレッドとして投稿する
+
+        key の要約を台帳に記録済みであれば、texts の代わりにそちらを投稿する。
+        """
+        texts = self._recorded_texts(key) or texts
+        self._record_texts(key, texts)
+        return await self._post_thread(texts, key=key)
+
+    async def message_summary(self, message: str, key: str | None = None) -> list[str]:
+        """message を要約してスレッドとして投稿する
+
+        key を指定すると、台帳に記録済みの要約は生成し直さず、続きから投稿する。
+        """
+        self._discard_interrupted(key)
+        if (texts := self._recorded_texts(key)) is not None:
+            return await self._post_thread(texts, key=key)
+        if self.streaming:
+            stream = self._record_stream(key, self._summarize_stream(message))
+            try:
+                return await self._post_thread(stream, key=key)
+            except MisskeyPostError:
+                # 生成は最後まで続けて台帳に記録し、次回は同じ要約の続きから投稿する
+                with contextlib.suppress(Exception):
+                    async for _ in stream:
+                        pass
+                raise
+        texts = await self._summarize(message)
+        self._record_texts(key, texts)
+        return await self._post_thread(texts, key=key)
+
+
+def get_misskey_service(request: Request) -> MisskeyService:
+    """依存性注入用。lifespan で作成した共有インスタンスを返す"""
+    return request.app.state.misskey_service
@@ -0,0 +1,310 @@
+import asyncio
+import contextlib
+import ipaddress
+import logging
+import os
+import socket
+from collections.abc import AsyncIterator, Iterable, Iterator
+from http import HTTPStatus
+from typing import Literal
+from urllib.parse import urljoin, urlsplit
+
+import httpcore
+import httpx
+from dotenv import load_dotenv
+
+from services.page_store import CachedPage, ExtractedPage, PageStore
+from utils.html_extractor import extract_main_text
+from utils.telemetry import log_event, span
+from utils.url_validator import which_url
+
+load_dotenv()
+
+# true の場合、URL のページをローカルで取得し、抽出した本文を Gemini に渡す
+URL_PREFETCH_ENABLED = os.getenv("URL_PREFETCH_ENABLED", "true").lower() == "true"
+PAGE_FETCH_TIMEOUT_SECONDS = float(os.getenv("PAGE_FETCH_TIMEOUT_SECONDS", "10"))
+# 取得するページの最大サイズ (バイト)。PDF はそのまま Gemini に渡すため上限を設ける
+PAGE_MAX_BYTES = int(os.getenv("PAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+# Gemini に渡す本文の最大文字数
+PAGE_MAX_CHARS = int(os.getenv("PAGE_MAX_CHARS", "20000"))
+# 本文がこれより短い場合は抽出できなかったとみなす (JavaScript で描画するページなど)
+PAGE_MIN_CHARS = int(os.getenv("PAGE_MIN_CHARS", "200"))
+PAGE_MAX_REDIRECTS = 5
+USER_AGENT = "Mozilla/5.0 (compatible; summarizer/0.1)"
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+
+
+class PageFetchError(Exception):
+    pass
+
+
+def _is_global_address(address: str) -> bool:
+    try:
+        return ipaddress.ip_address(address).is_global
+    except ValueError:
+        return False
+
+
+def _is_public_url(url: str) -> bool:
+    """http(s) の URL で、ホストが localhost やプライベートアドレスでないか
+
+    ホスト名の名前解決の結果は、接続時に _PublicNetworkBackend が確認する。
+    """
+    try:
+        parts = urlsplit(url)
+        host = parts.hostname
+    except ValueError:
+        return False
+    if parts.scheme not in ("http", "https") or not host:
+        return False
+    if host == "localhost" or host.endswith(".localhost"):
+        return False
+    try:
+        return ipaddress.ip_address(host).is_global
+    except ValueError:
+        return True
+
+
+async def _resolve(host: str, port: int) -> list[str]:
+    infos = await asyncio.get_running_loop().getaddrinfo(
+        host, port, type=socket.SOCK_STREAM
+    )
+    return list(dict.fromkeys(str(info[4][0]) for info in infos))
+
+
+class _PublicNetworkBackend(httpcore.AsyncNetworkBackend):
+    """接続の直前に名前解決し、すべてのアドレスがグローバルな場合だけ接続する
+
+    確認したアドレスにそのまま接続するため、確認の後で DNS の応答が変わっても
+    (DNS rebinding) 内部ネットワークには接続しない。
+    """
+
+    def __init__(self, backend: httpcore.AsyncNetworkBackend):
+        self.backend = backend
+
+    async def connect_tcp(
+        self,
+        host: str,
+        port: int,
+        timeout: float | None = None,
+        local_address: str | None = None,
+        socket_options: Iterable | None = None,
+    ) -> httpcore.AsyncNetworkStream:
+        try:
+            async with asyncio.timeout(timeout):
+                addresses = await _resolve(host, port)
+        except (OSError, TimeoutError) as e:
+            raise httpcore.ConnectError(f"Could not resolve {host}: {e}") from e
+        if not addresses or not all(_is_global_address(a) for a in addresses):
+            raise httpcore.ConnectError(
+                f"Refusing to connect to non-public address: {host} {addresses}"
+            )
+        error: Exception | None = None
+        for address in addresses:
+            try:
+                return await self.backend.connect_tcp(
+                    address, port, timeout, local_address, socket_options
+                )
+            except httpcore.ConnectError as e:
+                error = e
+        raise error
+
+    async def connect_unix_socket(
+        self,
+        path: str,
+        timeout: float | None = None,
+        socket_options: Iterable | None = None,
+    ) -> httpcore.AsyncNetworkStream:
+        raise httpcore.ConnectError("Unix sockets are not allowed")
+
+    async def sleep(self, seconds: float) -> None:
+        await self.backend.sleep(seconds)
+
+
+@contextlib.contextmanager
+def _httpx_errors() -> Iterator[None]:
+    """httpcore の例外を、同じ名前の httpx の例外 (ConnectError など) にして送出する"""
+    try:
+        yield
+    except (
+        httpcore.TimeoutException,
+        httpcore.NetworkError,
+        httpcore.ProtocolError,
+        httpcore.UnsupportedProtocol,
+        httpcore.ProxyError,
+    ) as e:
+        error = getattr(httpx, type(e).__name__, httpx.TransportError)
+        raise error(str(e)) from e
+
+
+class _ResponseStream(httpx.AsyncByteStream):
+    def __init__(self, stream: AsyncIterator[bytes]):
+        self.stream = stream
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        with _httpx_errors():
+            async for part in self.stream:
+                yield part
+
+    async def aclose(self) -> None:
+        if hasattr(self.stream, "aclose"):
+            await self.stream.aclose()
+
+
+class _PublicTransport(httpx.AsyncBaseTransport):
+    """_PublicNetworkBackend で接続するコネクションプールを使うトランスポート
+
+    httpx.AsyncHTTPTransport には接続処理を差し替える設定がないため、
+    httpcore のプールを公開 API で組み立てて、httpx のリクエスト・レスポンスと変換する。
+    """
+
+    def __init__(self, network_backend: httpcore.AsyncNetworkBackend):
+        # 接続数の上限は httpx の既定と同じ
+        self.pool = httpcore.AsyncConnectionPool(
+            ssl_context=httpx.create_ssl_context(),
+            max_connections=100,
+            max_keepalive_connections=20,
+            keepalive_expiry=5.0,
+            network_backend=_PublicNetworkBackend(network_backend),
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        core_request = httpcore.Request(
+            method=request.method,
+            url=httpcore.URL(
+                scheme=request.url.raw_scheme,
+                host=request.url.raw_host,
+                port=request.url.port,
+                target=request.url.raw_path,
+            ),
+            headers=request.headers.raw,
+            content=request.stream,
+            extensions=request.extensions,
+        )
+        with _httpx_errors():
+            response = await self.pool.handle_async_request(core_request)
+        return httpx.Response(
+            status_code=response.status,
+            headers=response.headers,
+            stream=_ResponseStream(response.stream),
+            extensions=response.extensions,
+        )
+
+    async def aclose(self) -> None:
+        await self.pool.aclose()
+
+
+def create_page_client(
+    network_backend: httpcore.AsyncNetworkBackend | None = None,
+) -> httpx.AsyncClient:
+    """ページの取得に使う、内部ネットワークに接続しない HTTP クライアント
+
+    network_backend は実際に接続するバックエンド (テスト用)。
+    """
+    transport = _PublicTransport(network_backend or httpcore.AnyIOBackend())
+    # 環境変数のプロキシを経由すると接続先を確認できないため使わない
+    return httpx.AsyncClient(
+        transport=transport, trust_env=False, timeout=PAGE_FETCH_TIMEOUT_SECONDS
+    )
+
+
+def _detect_kind(content_type: str, body: bytes) -> Literal["html", "pdf"] | None:
+    """Content-Type と先頭のバイト列から HTML / PDF を判定する"""
+    content_type = content_type.split(";", maxsplit=1)[0].strip().lower()
+    if content_type == "application/pdf" or body.startswith(b"%PDF-"):
+        return "pdf"
+    if content_type in HTML_CONTENT_TYPES:
+        return "html"
+    head = body[:512].lstrip().lower()
+    if head.startswith((b"<!doctype html", b"<html")):
+        return "html"
+    return None
+
+
+class PageService:
+    """URL のページを取得し、Gemini に渡す本文を抽出する
+
+    抽出結果は PageStore に保存し、次回からは条件付きGETで再検証する。
+    http_client は create_page_client() で作成したものを渡す。
+    """
+
+    def __init__(self, http_client: httpx.AsyncClient, store: PageStore):
+        self.http_client = http_client
+        self.store = store
+
+    async def fetch(self, url: str) -> ExtractedPage | None:
+        """ページを取得する。取得や抽出ができなかった場合は None を返す"""
+        try:
+            with span("page_fetch", url=url) as fields:
+                cached = await self._fetch(url, self.store.get(url))
+                fields["kind"] = cached.page.kind
+        except (httpx.HTTPError, httpx.InvalidURL, ValueError, PageFetchError) as e:
+            # ValueError: URL として解釈できない (https://[oops など)
+            log_event(
+                "ページを取得できませんでした",
+                logging.WARNING,
+                url=url,
+                error=str(e),
+            )
+            return None
+        return cached.page
+
+    async def _fetch(self, url: str, cached: CachedPage | None) -> CachedPage:
+        accept = "application/pdf" if which_url(url) == "pdf" else "text/html"
+        headers = {"User-Agent": USER_AGENT, "Accept": f"{accept},*/*;q=0.8"}
+        if cached and cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached and cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+        current = url
+        # リダイレクト先も内部ネットワークでないことを確認するため、1回ずつ辿る
+        for _ in range(PAGE_MAX_REDIRECTS + 1):
+            if not _is_public_url(current):
+                raise PageFetchError(f"Refusing to fetch non-public URL: {current}")
+            async with self.http_client.stream(
+                "GET", current, headers=headers, timeout=PAGE_FETCH_TIMEOUT_SECONDS
+            ) as response:
+                if response.status_code == HTTPStatus.NOT_MODIFIED and cached:
+                    return cached
+                if response.has_redirect_location:
+                    current = urljoin(current, response.headers["Location"])
+                    continue
+                response.raise_for_status()
+                body = await self._read(response)
+            return await self._extract(url, response, body)
+        raise PageFetchError(f"Too many redirects: {url}")
+
+    async def _read(self, response: httpx.Response) -> bytes:
+        chunks: list[bytes] = []
+        size = 0
+        async for chunk in response.aiter_bytes():
+            size += len(chunk)
+            if size > PAGE_MAX_BYTES:
+                raise PageFetchError(f"Page is larger than {PAGE_MAX_BYTES} bytes")
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    async def _extract(
+        self, url: str, response: httpx.Response, body: bytes
+    ) -> CachedPage:
+        content_type = response.headers.get("Content-Type", "")
+        kind = _detect_kind(content_type, body)
+        if kind is None:
+            raise PageFetchError(f"Unsupported content type: {content_type}")
+        if kind == "pdf":
+            page = ExtractedPage(url=url, kind="pdf", data=body)
+        else:
+            # パースはCPU処理のため、イベントループを塞がないようスレッドで実行する
+            title, text = await asyncio.to_thread(extract_main_text, body)
+            if len(text) < PAGE_MIN_CHARS:
+                raise PageFetchError("Extracted text is too short")
+            page = ExtractedPage(
+                url=url, kind="html", title=title, text=text[:PAGE_MAX_CHARS]
+            )
+        cached = CachedPage(
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+            page=page,
+        )
+        self.store.save(cached)
+        return cached
@@ -0,0 +1,130 @@
+import hashlib
+import os
+import time
+from typing import Literal
+
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+from utils.storage import connect
+
+load_dotenv()
+
+PAGE_STORE_PATH = os.getenv("PAGE_STORE_PATH", "page_cache.sqlite3")
+PAGE_STORE_TTL_SECONDS = int(os.getenv("PAGE_STORE_TTL_SECONDS", "604800"))
+# 保存するページ (本文と PDF) の合計の上限 (バイト)。超えた分は古いものから削除する
+PAGE_STORE_MAX_BYTES = int(os.getenv("PAGE_STORE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+class ExtractedPage(BaseModel):
+    """ローカルで取得したページ。HTML は本文のテキスト、PDF はファイルそのものを持つ"""
+
+    url: str
+    kind: Literal["html", "pdf"]
+    title: str | None = None
+    text: str = ""
+    data: bytes = b""
+
+    @property
+    def digest(self) -> str:
+        """内容のハッシュ。要約キャッシュのキーに使う"""
+        return hashlib.sha256(self.text.encode() + self.data).hexdigest()
+
+
+class CachedPage(BaseModel):
+    etag: str | None = None
+    last_modified: str | None = None
+    page: ExtractedPage
+
+
+class PageStore:
+    """取得・抽出したページを URL ごとに ETag / Last-Modified と一緒に保存する
+
+    TTL を過ぎたページと、合計サイズの上限を超えた古いページは保存時に削除する。
+    """
+
+    def __init__(
+        self,
+        path: str = PAGE_STORE_PATH,
+        ttl_seconds: int = PAGE_STORE_TTL_SECONDS,
+        max_bytes: int = PAGE_STORE_MAX_BYTES,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.conn = connect(path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                kind TEXT NOT NULL,
+                title TEXT,
+                text TEXT NOT NULL,
+                data BLOB NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS pages_fetched_at ON pages (fetched_at)"
+        )
+
+    def get(self, url: str) -> CachedPage | None:
+        row = self.conn.execute(
+            "SELECT etag, last_modified, kind, title, text, data FROM pages"
+            " WHERE url = ? AND fetched_at >= ?",
+            (url, time.time() - self.ttl_seconds),
+        ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, kind, title, text, data = row
+        return CachedPage(
+            etag=etag,
+            last_modified=last_modified,
+            page=ExtractedPage(url=url, kind=kind, title=title, text=text, data=data),
+        )
+
+    def save(self, cached: CachedPage) -> None:
+        page = cached.page
+        now = time.time()
+        self.conn.execute(
+            """
+            INSERT OR REPLACE INTO pages
+                (url, etag, last_modified, kind, title, text, data, fetched_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                page.url,
+                cached.etag,
+                cached.last_modified,
+                page.kind,
+                page.title,
+                page.text,
+                page.data,
+                now,
+            ),
+        )
+        self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        self.conn.execute(
+            "DELETE FROM pages WHERE fetched_at < ?", (now - self.ttl_seconds,)
+        )
+        # 新しいものから合計サイズを数え、上限を超えた分を削除する
+        self.conn.execute(
+            """
+            DELETE FROM pages WHERE url IN (
+                SELECT url FROM (
+                    SELECT url, SUM(LENGTH(CAST(text AS BLOB)) + LENGTH(data))
+                        OVER (ORDER BY fetched_at DESC, url) AS total
+                    FROM pages
+                )
+                WHERE total > ?
+            )
+            """,
+            (self.max_bytes,),
+        )
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,193 @@
+import os
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+from utils.storage import connect
+
+load_dotenv()
+
+POST_LEDGER_PATH = os.getenv("POST_LEDGER_PATH", "state.sqlite3")
+# これより古い記録は起動時に削除する
+POST_LEDGER_TTL_SECONDS = int(os.getenv("POST_LEDGER_TTL_SECONDS", "2592000"))
+
+
+class LedgerEntry(BaseModel):
+    """1つの投稿元 (メッセージや RSS エントリー) について記録した要約と投稿済みのノート"""
+
+    texts: list[str]
+    # texts の先頭から順に、投稿済みのノートの ID
+    note_ids: list[str]
+    # 生成が終わり、texts がすべて揃っている
+    complete: bool
+
+
+class PostLedger:
+    """生成した要約の分割テキストと、投稿したノートIDを投稿元ごとに保存する
+
+    途中で失敗した投稿をやり直すときに、生成済みの要約を使い、
+    投稿済みのノートを飛ばしてスレッドの続きから投稿するために使う。
+    """
+
+    def __init__(
+        self,
+        path: str = POST_LEDGER_PATH,
+        ttl_seconds: int = POST_LEDGER_TTL_SECONDS,
+    ):
+        self.conn = connect(path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS post_sources (
+                source_key TEXT PRIMARY KEY,
+                complete INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        # 主キーで投稿元ごとの分割テキストを順に引けるようにする
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS post_segments (
+                source_key TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                note_id TEXT,
+                PRIMARY KEY (source_key, position)
+            ) WITHOUT ROWID
+            """
+        )
+        # まとめて要約した投稿元 (ダイジェスト) に含まれるメッセージなどと、その投稿元
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS post_members (
+                member_key TEXT PRIMARY KEY,
+                source_key TEXT NOT NULL
+            ) WITHOUT ROWID
+            """
+        )
+        self._prune(time.time() - ttl_seconds)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def get(self, key: str) -> LedgerEntry | None:
+        source = self.conn.execute(
+            "SELECT complete FROM post_sources WHERE source_key = ?", (key,)
+        ).fetchone()
+        if source is None:
+            return None
+        rows = self.conn.execute(
+            "SELECT text, note_id FROM post_segments"
+            " WHERE source_key = ? ORDER BY position",
+            (key,),
+        ).fetchall()
+        note_ids: list[str] = []
+        for _, note_id in rows:
+            if note_id is None:
+                break
+            note_ids.append(note_id)
+        return LedgerEntry(
+            texts=[text for text, _ in rows],
+            note_ids=note_ids,
+            complete=bool(source[0]),
+        )
+
+    def record_texts(
+        self, key: str, texts: list[str], start: int = 0, complete: bool = False
+    ) -> None:
+        """start 番目から texts を記録する。投稿済みのテキストは書き換えない
+
+        complete の場合は、texts が要約のすべて (生成が終わった) として記録する。
+        """
+        now = time.time()
+        with self._transaction():
+            self.conn.execute(
+                """
+                INSERT INTO post_sources (source_key, complete, updated_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT (source_key) DO UPDATE SET
+                    complete = MAX(complete, excluded.complete),
+                    updated_at = excluded.updated_at
+                """,
+                (key, int(complete), now),
+            )
+            self.conn.executemany(
+                """
+                INSERT INTO post_segments (source_key, position, text)
+                VALUES (?, ?, ?)
+                ON CONFLICT (source_key, position) DO UPDATE SET
+                    text = excluded.text
+                WHERE note_id IS NULL
+                """,
+                [(key, start + i, text) for i, text in enumerate(texts)],
+            )
+            if complete:
+                # 作り直した要約が前回より短い場合、未投稿の残りは使わない
+                self.conn.execute(
+                    """
+                    DELETE FROM post_segments
+                    WHERE source_key = ? AND position >= ? AND note_id IS NULL
+                    """,
+                    (key, start + len(texts)),
+                )
+
+    def record_note(self, key: str, position: int, note_id: str) -> None:
+        self.conn.execute(
+            "UPDATE post_segments SET note_id = ? WHERE source_key = ? AND position = ?",
+            (note_id, key, position),
+        )
+
+    def record_members(self, key: str, member_keys: list[str]) -> None:
+        """member_keys (メッセージなど) を key の投稿元で要約することを記録する"""
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO post_members (member_key, source_key) VALUES (?, ?)",
+            [(member_key, key) for member_key in member_keys],
+        )
+
+    def source_of(self, member_key: str) -> str | None:
+        """member_key を最後に含めた投稿元のキーを返す"""
+        row = self.conn.execute(
+            "SELECT source_key FROM post_members WHERE member_key = ?", (member_key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def discard(self, key: str) -> None:
+        """key の記録を削除する。次の投稿は新しいスレッドとして始める"""
+        with self._transaction():
+            self.conn.execute("DELETE FROM post_members WHERE source_key = ?", (key,))
+            self.conn.execute("DELETE FROM post_segments WHERE source_key = ?", (key,))
+            self.conn.execute("DELETE FROM post_sources WHERE source_key = ?", (key,))
+
+    def _prune(self, before: float) -> None:
+        with self._transaction():
+            self.conn.execute(
+                """
+                DELETE FROM post_segments WHERE source_key IN (
+                    SELECT source_key FROM post_sources WHERE updated_at < ?
+                )
+                """,
+                (before,),
+            )
+            self.conn.execute(
+                "DELETE FROM post_sources WHERE updated_at < ?", (before,)
+            )
+            self.conn.execute(
+                """
+                DELETE FROM post_members WHERE source_key NOT IN (
+                    SELECT source_key FROM post_sources
+                )
+                """
+            )
+
+    def close(self) -> None:
+        self.conn.close()
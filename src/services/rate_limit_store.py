@@ -0,0 +1,105 @@
+import os
+import time
+
+from dotenv import load_dotenv
+
+from utils.storage import connect
+
+load_dotenv()
+
+RATE_LIMIT_STORE_PATH = os.getenv("RATE_LIMIT_STORE_PATH", "state.sqlite3")
+
+# (バケットの名前, window_seconds あたりの上限, 取り出す量)。上限が 0 なら無制限
+BucketTake = tuple[str, int, float]
+
+
+class RateLimitStore:
+    """トークンバケットの残量を SQLite に保存し、同じ DATA_DIR を使うプロセスで共有する
+
+    serve.py で起動した API ワーカーとゲートウェイが、1つの割り当てを先着順に使う。
+    残量は window_seconds ごとに上限まで回復する。
+    """
+
+    def __init__(self, path: str = RATE_LIMIT_STORE_PATH):
+        self.conn = connect(path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                name TEXT PRIMARY KEY,
+                available REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+
+    def try_take(self, takes: list[BucketTake], window_seconds: float) -> float:
+        """すべてのバケットから取り出す。足りない場合は取り出さず、待つ秒数を返す
+
+        上限より大きい量は、上限まで回復したところで取り出す。
+        """
+        return self._take(takes, window_seconds, force=False)
+
+    def take(self, takes: list[BucketTake], window_seconds: float) -> None:
+        """残量に関係なく取り出す。推定との差を精算する場合は負の値も渡せる"""
+        self._take(takes, window_seconds, force=True)
+
+    def available(self, name: str, limit: int, window_seconds: float) -> float:
+        row = self.conn.execute(
+            "SELECT available, updated_at FROM rate_limit_buckets WHERE name = ?",
+            (name,),
+        ).fetchone()
+        return self._refill(row, limit, window_seconds, time.time())
+
+    @staticmethod
+    def _refill(
+        row: tuple[float, float] | None, limit: int, window_seconds: float, now: float
+    ) -> float:
+        if row is None:
+            return float(limit)
+        available, updated_at = row
+        rate = limit / window_seconds
+        return min(limit, available + max(0.0, now - updated_at) * rate)
+
+    def _take(
+        self, takes: list[BucketTake], window_seconds: float, force: bool
+    ) -> float:
+        takes = [take for take in takes if take[1] > 0]
+        if not takes:
+            return 0.0
+        now = time.time()
+        # 他のプロセスと同時に残量を読み書きしないよう、書き込みロックを取ってから読む
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            balances: list[tuple[str, float]] = []
+            wait = 0.0
+            for name, limit, amount in takes:
+                row = self.conn.execute(
+                    "SELECT available, updated_at FROM rate_limit_buckets"
+                    " WHERE name = ?",
+                    (name,),
+                ).fetchone()
+                available = self._refill(row, limit, window_seconds, now)
+                missing = min(amount, limit) - available
+                wait = max(wait, missing / (limit / window_seconds))
+                balances.append((name, available - amount))
+            if wait > 0 and not force:
+                self.conn.execute("ROLLBACK")
+                return wait
+            self.conn.executemany(
+                """
+                INSERT INTO rate_limit_buckets (name, available, updated_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET
+                    available = excluded.available,
+                    updated_at = excluded.updated_at
+                """,
+                [(name, balance, now) for name, balance in balances],
+            )
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+        return 0.0
+
+    def close(self) -> None:
+        self.conn.close()
@@ -1,24 +1,118 @@
+import asyncio
+import logging
 import os
+from http import HTTPStatus
 
 import feedparser
+import httpx
 from dotenv import load_dotenv
+from fastapi import Request
+
+from services.rss_store import FeedEntry, FeedState, RSSStore, entry_keys
+from utils.telemetry import log_event, span
 
 load_dotenv()
 
 RSS_URLS = os.getenv("RSS_URLS", "https://b.hatena.ne.jp/hotentry/it.rss")
+RSS_FETCH_TIMEOUT_SECONDS = float(os.getenv("RSS_FETCH_TIMEOUT_SECONDS", "5"))
+# /rss/entries の既読管理に使う namespace
+RSS_ENTRIES_NAMESPACE = "entries"
+
+
+def _to_feed_entry(entry: feedparser.FeedParserDict) -> FeedEntry | None:
+    links = entry.get("links") or []
+    link = links[0]["href"] if links else entry.get("link")
+    if not link:
+        return None
+    return FeedEntry(link=link, guid=entry.get("id"), title=entry.get("title"))
 
 
 class RSSService:
-    def __init__(self):
+    def __init__(self, http_client: httpx.AsyncClient, store: RSSStore):
         self.rss_urls = [url.strip() for url in RSS_URLS.split(",")]
+        self.http_client = http_client
+        self.store = store
+
+    async def _fetch_feed(self, url: str) -> list[FeedEntry]:
+        """条件付きGETでフィードを取得する。取得に失敗した場合は前回の結果を返す"""
+        state = self.store.get_feed_state(url)
+        headers = {}
+        if state and state.etag:
+            headers["If-None-Match"] = state.etag
+        if state and state.last_modified:
+            headers["If-Modified-Since"] = state.last_modified
+        try:
+            with span("rss_fetch", url=url) as fields:
+                # 共有クライアントはリダイレクトを追わないため、移転したフィードはここで追う
+                response = await self.http_client.get(
+                    url,
+                    headers=headers,
+                    timeout=RSS_FETCH_TIMEOUT_SECONDS,
+                    follow_redirects=True,
+                )
+                fields["status_code"] = response.status_code
+            if response.status_code == HTTPStatus.NOT_MODIFIED and state:
+                return state.entries
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            log_event(
+                "RSSフィードの取得に失敗しました",
+                logging.WARNING,
+                url=url,
+                error=str(e),
+            )
+            return state.entries if state else []
 
-    def list_rss_feed_entries(self):
-        rss_entries = []
-        for url in self.rss_urls:
-            feed = feedparser.parse(url)
-            rss_entries.extend(feed.entries)
+        # パースはCPU処理のため、イベントループを塞がないようスレッドで実行する
+        feed = await asyncio.to_thread(feedparser.parse, response.content)
+        entries = [
+            feed_entry
+            for entry in feed.entries
+            if (feed_entry := _to_feed_entry(entry)) is not None
+        ]
+        self.store.save_feed_state(
+            url,
+            FeedState(
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+                entries=entries,
+            ),
+        )
+        return entries
+
+    async def list_rss_feed_entries(self) -> list[FeedEntry]:
+        """全フィードのエントリーを返す。複数フィードに現れるエントリーは1件にまとめる"""
+        feeds = await asyncio.gather(*(self._fetch_feed(url) for url in self.rss_urls))
+        rss_entries: list[FeedEntry] = []
+        seen_keys: set[str] = set()
+        for entries in feeds:
+            for entry in entries:
+                keys = entry_keys(entry)
+                if seen_keys.intersection(keys):
+                    continue
+                seen_keys.update(keys)
+                rss_entries.append(entry)
         return rss_entries
 
-    def get_rss_feed_urls(self):
-        rss_entries = self.list_rss_feed_entries()
-        return [entry["links"][0]["href"] for entry in rss_entries]
+    async def list_new_rss_feed_entries(
+        self, namespace: str = RSS_ENTRIES_NAMESPACE
+    ) -> list[FeedEntry]:
+        """前回までに返していないエントリーだけを返し、既読として記録する"""
+        rss_entries = await self.list_rss_feed_entries()
+        new_entries = self.store.filter_unseen(namespace, rss_entries)
+        self.store.mark_seen(namespace, new_entries)
+        return new_entries
+
+    async def get_rss_feed_urls(self, only_new: bool = False) -> list[str]:
+        if only_new:
+            rss_entries = await self.list_new_rss_feed_entries()
+        else:
+            rss_entries = await self.list_rss_feed_entries()
+        return [entry.link for entry in rss_entries]
+
+
+def get_rss_service(request: Request) -> RSSService:
+    """依存性注入用。共有 HTTP クライアントとフィード状態ストアを使う"""
+    return RSSService(
+        http_client=request.app.state.http_client, store=request.app.state.rss_store
+    )
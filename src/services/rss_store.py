@@ -0,0 +1,122 @@
+import json
+import os
+import time
+
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+from utils.storage import connect
+from utils.url_validator import canonicalize_url
+
+load_dotenv()
+
+RSS_STORE_PATH = os.getenv("RSS_STORE_PATH", "rss.sqlite3")
+
+
+class FeedEntry(BaseModel):
+    link: str
+    guid: str | None = None
+    title: str | None = None
+
+
+class FeedState(BaseModel):
+    etag: str | None = None
+    last_modified: str | None = None
+    entries: list[FeedEntry] = []
+
+
+def entry_keys(entry: FeedEntry) -> list[str]:
+    """エントリーを識別するキー (正規化したURL と GUID)"""
+    keys = [f"url:{canonicalize_url(entry.link)}"]
+    if entry.guid:
+        keys.append(f"guid:{entry.guid}")
+    return keys
+
+
+class RSSStore:
+    """フィードごとの ETag / Last-Modified と最後に取得したエントリーを保存する"""
+
+    def __init__(self, path: str = RSS_STORE_PATH):
+        self.conn = connect(path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS feed_states (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                entries TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+            """
+        )
+        # 既読エントリーのインデックス。namespace ごとに独立して管理する
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS seen_entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                seen_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            ) WITHOUT ROWID
+            """
+        )
+
+    def get_feed_state(self, url: str) -> FeedState | None:
+        row = self.conn.execute(
+            "SELECT etag, last_modified, entries FROM feed_states WHERE url = ?",
+            (url,),
+        ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, entries = row
+        return FeedState(
+            etag=etag,
+            last_modified=last_modified,
+            entries=[FeedEntry(**entry) for entry in json.loads(entries)],
+        )
+
+    def save_feed_state(self, url: str, state: FeedState) -> None:
+        entries = json.dumps(
+            [entry.model_dump() for entry in state.entries], ensure_ascii=False
+        )
+        self.conn.execute(
+            """
+            INSERT OR REPLACE INTO feed_states
+                (url, etag, last_modified, entries, fetched_at)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (url, state.etag, state.last_modified, entries, time.time()),
+        )
+
+    def _is_seen(self, namespace: str, keys: list[str]) -> bool:
+        placeholders = ",".join("?" * len(keys))
+        row = self.conn.execute(
+            f"SELECT 1 FROM seen_entries WHERE namespace = ? AND key IN ({placeholders})",  # noqa: S608
+            (namespace, *keys),
+        ).fetchone()
+        return row is not None
+
+    def filter_unseen(
+        self, namespace: str, entries: list[FeedEntry]
+    ) -> list[FeedEntry]:
+        """未読のエントリーだけを返す。同じ呼び出し内の重複も取り除く"""
+        unseen: list[FeedEntry] = []
+        batch_keys: set[str] = set()
+        for entry in entries:
+            keys = entry_keys(entry)
+            if batch_keys.intersection(keys) or self._is_seen(namespace, keys):
+                continue
+            batch_keys.update(keys)
+            unseen.append(entry)
+        return unseen
+
+    def mark_seen(self, namespace: str, entries: list[FeedEntry]) -> None:
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO seen_entries (namespace, key, seen_at)"
+            " VALUES (?, ?, ?)",
+            [(namespace, key, now) for entry in entries for key in entry_keys(entry)],
+        )
+
+    def close(self) -> None:
+        self.conn.close()
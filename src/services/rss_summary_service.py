@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+from fastapi import Depends, Request
+from pydantic import BaseModel
+
+from services.ai_service import track_token_usage
+from services.batch_service import BatchOutcome, BatchSummaryService
+from services.gemini_scheduler import gemini_priority
+from services.misskey_service import (
+    SUMMARY_CONCURRENCY,
+    MisskeyService,
+    get_misskey_service,
+)
+from services.rss_service import RSSService, get_rss_service
+from services.rss_store import FeedEntry, entry_keys
+from utils.telemetry import log_event
+
+load_dotenv()
+
+RSS_SUMMARY_MAX_ITEMS = int(os.getenv("RSS_SUMMARY_MAX_ITEMS", "10"))
+RSS_SUMMARY_MAX_TOKENS = int(os.getenv("RSS_SUMMARY_MAX_TOKENS", "500000"))
+# 要約済みエントリーの既読管理に使う namespace
+RSS_SUMMARY_NAMESPACE = "summary"
+
+
+class RSSItemResult(BaseModel):
+    """RSSエントリー1件分の要約・投稿結果"""
+
+    link: str
+    status: str  # "success" | "failed" | "skipped"
+    note_ids: list[str] = []
+    tokens: int = 0
+    elapsed_seconds: float = 0.0
+    error: str | None = None
+
+
+def _ledger_key(entry: FeedEntry) -> str:
+    """投稿台帳のキー。正規化した URL で識別する"""
+    return f"rss:{entry_keys(entry)[0]}"
+
+
+class RSSSummaryService:
+    """新着RSSエントリーを並列に要約してMisskeyに投稿する"""
+
+    def __init__(
+        self,
+        rss_service: RSSService,
+        misskey_service: MisskeyService,
+        concurrency: int = SUMMARY_CONCURRENCY,
+        batch_service: BatchSummaryService | None = None,
+    ):
+        self.rss_service = rss_service
+        self.misskey_service = misskey_service
+        self.concurrency = max(1, concurrency)
+        self.batch_service = batch_service
+
+    async def pending_entries(
+        self, max_items: int = RSS_SUMMARY_MAX_ITEMS
+    ) -> list[FeedEntry]:
+        """要約済みでないエントリーを最大 max_items 件返す"""
+        entries = await self.rss_service.list_rss_feed_entries()
+        store = self.rss_service.store
+        return store.filter_unseen(RSS_SUMMARY_NAMESPACE, entries)[:max_items]
+
+    def should_batch(self, count: int) -> bool:
+        """count 件をバッチ予測でまとめて要約するか (完了まで長い時間がかかる)"""
+        return self.batch_service is not None and self.batch_service.should_batch(count)
+
+    async def summarize_new_entries(
+        self,
+        max_items: int = RSS_SUMMARY_MAX_ITEMS,
+        max_tokens: int = RSS_SUMMARY_MAX_TOKENS,
+        allow_batch: bool = True,
+    ) -> list[RSSItemResult]:
+        """要約済みでないエントリーを最大 max_items 件要約する
+
+        トークン使用量の合計が max_tokens に達した後は新しい要約を開始しない。
+        実行中の要約は止めないため、最大で並列数分だけ予算を超えることがある。
+        溜まったエントリーをバッチ予測でまとめて要約する場合は、max_tokens は使わない。
+        allow_batch が False の場合は、件数にかかわらずオンラインで要約する。
+        """
+        store = self.rss_service.store
+        pending = await self.pending_entries(max_items)
+        if allow_batch and self.should_batch(len(pending)):
+            return await self._summarize_batch(pending)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        used_tokens = 0
+
+        async def summarize(entry: FeedEntry) -> RSSItemResult:
+            nonlocal used_tokens
+            async with semaphore:
+                if used_tokens >= max_tokens:
+                    return RSSItemResult(
+                        link=entry.link, status="skipped", error="token budget exceeded"
+                    )
+                start = time.perf_counter()
+                # 溜まったエントリーの要約は、ライブ要約などより後に回す
+                with gemini_priority("backlog"), track_token_usage() as usage:
+                    try:
+                        note_ids = await self.misskey_service.message_summary(
+                            entry.link, key=_ledger_key(entry)
+                        )
+                    except Exception as e:
+                        log_event(
+                            "RSSエントリーの要約に失敗しました",
+                            logging.WARNING,
+                            link=entry.link,
+                            error=str(e),
+                        )
+                        status, note_ids, error = "failed", [], str(e)
+                    else:
+                        store.mark_seen(RSS_SUMMARY_NAMESPACE, [entry])
+                        status, error = "success", None
+                used_tokens += usage.total_tokens
+                return RSSItemResult(
+                    link=entry.link,
+                    status=status,
+                    note_ids=note_ids,
+                    tokens=usage.total_tokens,
+                    elapsed_seconds=round(time.perf_counter() - start, 3),
+                    error=error,
+                )
+
+        return list(await asyncio.gather(*(summarize(entry) for entry in pending)))
+
+    async def _summarize_batch(self, pending: list[FeedEntry]) -> list[RSSItemResult]:
+        """バッチ予測でまとめて要約し、要約できたエントリーから並列に投稿する"""
+        assert self.batch_service is not None
+        store = self.rss_service.store
+        outcomes = await self.batch_service.summarize([entry.link for entry in pending])
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def post(entry: FeedEntry, outcome: BatchOutcome) -> RSSItemResult:
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    note_ids = await self.misskey_service.post_summary(
+                        outcome.result(), key=_ledger_key(entry)
+                    )
+                except Exception as e:
+                    log_event(
+                        "RSSエントリーの要約に失敗しました",
+                        logging.WARNING,
+                        link=entry.link,
+                        error=str(e),
+                    )
+                    status, note_ids, error = "failed", [], str(e)
+                else:
+                    store.mark_seen(RSS_SUMMARY_NAMESPACE, [entry])
+                    status, error = "success", None
+                return RSSItemResult(
+                    link=entry.link,
+                    status=status,
+                    note_ids=note_ids,
+                    tokens=outcome.tokens,
+                    elapsed_seconds=round(time.perf_counter() - start, 3),
+                    error=error,
+                )
+
+        return list(
+            await asyncio.gather(
+                *(
+                    post(entry, outcome)
+                    for entry, outcome in zip(pending, outcomes, strict=True)
+                )
+            )
+        )
+
+
+def get_rss_summary_service(
+    request: Request,
+    rss_service: RSSService = Depends(get_rss_service),
+    misskey_service: MisskeyService = Depends(get_misskey_service),
+) -> RSSSummaryService:
+    return RSSSummaryService(
+        rss_service, misskey_service, batch_service=request.app.state.batch_service
+    )
@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import os
+from collections.abc import Callable
+
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+from services.discord_service import ChannelConfig, DiscordService, Visibility
+from services.job_service import JobProgress
+from services.misskey_service import (
+    MisskeyService,
+    SummaryResult,
+    last_contiguous_success,
+)
+from utils.telemetry import log_event
+
+load_dotenv()
+
+# この回数失敗したメッセージは飛ばしてカーソルを進める (常に失敗するメッセージで止まらないように)
+MESSAGE_MAX_ATTEMPTS = int(os.getenv("MESSAGE_MAX_ATTEMPTS", "5"))
+
+
+class ChannelSummaryResult(BaseModel):
+    """1チャンネル分の要約・投稿結果"""
+
+    channel_id: int
+    status: str  # "success" | "failed"
+    results: list[SummaryResult] = []
+    error: str | None = None
+
+
+async def summarize_channel(  # noqa: PLR0913
+    discord_service: DiscordService,
+    misskey_service: MisskeyService,
+    channel_id: int,
+    *,
+    report: Callable[[JobProgress], None] | None = None,
+    digest: bool = False,
+    visibility: Visibility = "home",
+) -> list[SummaryResult]:
+    """チャンネルの未処理メッセージを要約・投稿し、カーソルを進める
+
+    report を指定すると、1件処理するたびに進捗 (JobProgress) を渡して呼び出す。
+    digest の場合は、URL を含まないメッセージをまとめて要約する。
+    MESSAGE_MAX_ATTEMPTS 回失敗したメッセージは "skipped" として飛ばす。
+    """
+    messages = await discord_service.get_discord_unprocessed_messages(channel_id)
+    progress = JobProgress(total=len(messages))
+    if report is not None:
+        report(progress)
+
+    def on_result(result: SummaryResult) -> None:
+        progress.done += 1
+        if result.status != "success":
+            progress.failed += 1
+        if report is not None:
+            report(progress)
+
+    results = await misskey_service.message_summaries(
+        messages, on_result=on_result, digest=digest, visibility=visibility
+    )
+    for result in results:
+        if result.status != "failed":
+            continue
+        attempts = discord_service.record_message_failure(channel_id, result.message_id)
+        if attempts >= MESSAGE_MAX_ATTEMPTS:
+            log_event(
+                "失敗を繰り返したメッセージを飛ばします",
+                logging.WARNING,
+                channel_id=channel_id,
+                message_id=result.message_id,
+                attempts=attempts,
+                error=result.error,
+            )
+            result.status = "skipped"
+    # 失敗したメッセージは次回の実行で再処理できるよう、カーソルは手前で止める
+    discord_service.advance_channel_cursor(channel_id, last_contiguous_success(results))
+    return results
+
+
+async def summarize_channels(
+    discord_service: DiscordService,
+    misskey_service: MisskeyService,
+    channels: list[ChannelConfig],
+    report: Callable[[JobProgress], None] | None = None,
+    digest: bool = False,
+) -> list[ChannelSummaryResult]:
+    """複数のチャンネルを並行して要約・投稿する
+
+    履歴の取得は DiscordService の REST API の上限の範囲で並行に行う。
+    1つのチャンネルの失敗で他のチャンネルは止めない。進捗は全チャンネルの合計を報告する。
+    """
+    progresses: dict[int, JobProgress] = {}
+
+    def channel_report(channel_id: int) -> Callable[[JobProgress], None]:
+        def report_channel(progress: JobProgress) -> None:
+            progresses[channel_id] = progress
+            if report is not None:
+                report(
+                    JobProgress(
+                        total=sum(p.total for p in progresses.values()),
+                        done=sum(p.done for p in progresses.values()),
+                        failed=sum(p.failed for p in progresses.values()),
+                    )
+                )
+
+        return report_channel
+
+    async def run(channel: ChannelConfig) -> ChannelSummaryResult:
+        try:
+            results = await summarize_channel(
+                discord_service,
+                misskey_service,
+                channel.channel_id,
+                report=channel_report(channel.channel_id),
+                digest=digest,
+                visibility=channel.visibility,
+            )
+        except Exception as e:
+            log_event(
+                "チャンネルの要約に失敗しました",
+                logging.WARNING,
+                channel_id=channel.channel_id,
+                error=str(e),
+            )
+            return ChannelSummaryResult(
+                channel_id=channel.channel_id, status="failed", error=str(e)
+            )
+        return ChannelSummaryResult(
+            channel_id=channel.channel_id, status="success", results=results
+        )
+
+    return list(await asyncio.gather(*(run(channel) for channel in channels)))
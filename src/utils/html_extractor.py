@@ -0,0 +1,35 @@
+from bs4 import BeautifulSoup
+
+# 本文ではない (ナビゲーション・広告・スクリプトなど) として取り除くタグ
+BOILERPLATE_TAGS = [
+    "script",
+    "style",
+    "noscript",
+    "template",
+    "svg",
+    "iframe",
+    "form",
+    "button",
+    "nav",
+    "header",
+    "footer",
+    "aside",
+]
+
+
+def extract_main_text(html: bytes | str) -> tuple[str | None, str]:
+    """HTML からタイトルと本文のテキストを取り出す
+
+    article / main 要素があればその中だけを使い、空行は取り除く。
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    title = None
+    if og_title := soup.find("meta", property="og:title"):
+        title = og_title.get("content") or None
+    if title is None and soup.title is not None:
+        title = soup.title.get_text(strip=True) or None
+    for tag in soup(BOILERPLATE_TAGS):
+        tag.decompose()
+    root = soup.find("article") or soup.find("main") or soup.body or soup
+    lines = (line.strip() for line in root.get_text("\n").splitlines())
+    return title, "\n".join(line for line in lines if line)
@@ -0,0 +1,233 @@
+import abc
+import math
+import threading
+from collections.abc import Sequence
+
+# レイテンシ用のバケット (秒)。Gemini の呼び出しは数十秒かかることがあるため上限を広めに取る
+DEFAULT_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: Sequence[str], values: tuple[str, ...]) -> str:
+    if not labelnames:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(value)}"'
+        for name, value in zip(labelnames, values, strict=True)
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric(abc.ABC):
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}"
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+
+    @abc.abstractmethod
+    def render(self, extra: dict[str, str] | None = None) -> list[str]:
+        """サンプルの行を返す。extra のラベルを各行の先頭に加える"""
+
+    def _labels(
+        self, key: tuple[str, ...], extra: dict[str, str] | None, *more: tuple[str, str]
+    ) -> str:
+        extra = extra or {}
+        names = (*extra, *self.labelnames, *(name for name, _ in more))
+        values = (*extra.values(), *key, *(value for _, value in more))
+        return _format_labels(names, values)
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self, extra: dict[str, str] | None = None) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{self._labels(key, extra)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = (*sorted(buckets), math.inf)
+        # ラベルごとに (各バケットの件数, 合計値, 件数) を持つ
+        self._values: dict[tuple[str, ...], tuple[list[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(
+                key, ([0] * len(self.buckets), 0.0, 0)
+            )
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def count(self, **labels: str) -> int:
+        values = self._values.get(self._key(labels))
+        return values[2] if values else 0
+
+    def render(self, extra: dict[str, str] | None = None) -> list[str]:
+        lines = []
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, (counts, total, count) in items:
+            for bound, bucket_count in zip(self.buckets, counts, strict=True):
+                labels = self._labels(key, extra, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = self._labels(key, extra)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def register[T: _Metric](self, metric: T) -> T:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered.")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def samples(self, **labels: str) -> dict[str, list[str]]:
+        """メトリクスごとのサンプルの行。labels を各行のラベルに加える"""
+        return {name: metric.render(labels) for name, metric in self._metrics.items()}
+
+    def render(self, snapshots: list[dict[str, list[str]]] | None = None) -> str:
+        """Prometheus のテキスト形式で出力する
+
+        snapshots (複数のプロセスの samples()) を渡すと、このレジストリの代わりにそれらを並べる。
+        """
+        if snapshots is None:
+            snapshots = [self.samples()]
+        lines: list[str] = []
+        for name, metric in self._metrics.items():
+            lines.extend(metric.header())
+            for snapshot in snapshots:
+                lines.extend(snapshot.get(name, []))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_DURATION = REGISTRY.register(
+    Histogram(
+        "summarizer_stage_duration_seconds",
+        "Latency of each processing stage.",
+        ["stage", "status"],
+    )
+)
+RETRIES = REGISTRY.register(
+    Counter("summarizer_retries_total", "Number of retried requests.", ["target"])
+)
+FALLBACKS = REGISTRY.register(
+    Counter("summarizer_fallbacks_total", "Number of generation fallbacks.", ["kind"])
+)
+CACHE_REQUESTS = REGISTRY.register(
+    Counter(
+        "summarizer_cache_requests_total",
+        "Summary cache lookups by result.",
+        ["result"],
+    )
+)
+GEMINI_TOKENS = REGISTRY.register(
+    Counter(
+        "summarizer_gemini_tokens_total",
+        "Gemini token usage reported in the response usage metadata.",
+        ["model", "type"],
+    )
+)
+GEMINI_REQUEST_DURATION = REGISTRY.register(
+    Histogram(
+        "summarizer_gemini_request_duration_seconds",
+        "Latency of Gemini requests by the model that served them.",
+        ["model", "tool"],
+    )
+)
+MISSKEY_NOTES_POSTED = REGISTRY.register(
+    Counter("summarizer_misskey_notes_posted_total", "Number of posted notes.")
+)
+BATCH_ITEMS = REGISTRY.register(
+    Counter(
+        "summarizer_batch_items_total",
+        "Backlog prompts summarized in batch mode by where the answer came from.",
+        ["source"],
+    )
+)
+GEMINI_QUEUE_DEPTH = REGISTRY.register(
+    Gauge(
+        "summarizer_gemini_queue_depth",
+        "Gemini requests waiting for the rate limiter by priority.",
+        ["priority"],
+    )
+)
+GEMINI_QUEUE_WAIT = REGISTRY.register(
+    Histogram(
+        "summarizer_gemini_queue_wait_seconds",
+        "Time Gemini requests spent waiting for the rate limiter.",
+        ["priority"],
+    )
+)
@@ -0,0 +1,27 @@
+import os
+import sqlite3
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# キャッシュや状態を保存するローカルディレクトリ
+DATA_DIR = os.getenv("DATA_DIR", "data")
+SQLITE_BUSY_TIMEOUT_MS = 5000
+
+
+def connect(filename: str) -> sqlite3.Connection:
+    """DATA_DIR 配下の SQLite データベースに接続する
+
+    ":memory:" を指定した場合はインメモリデータベースを返す (テスト用)。
+    """
+    if filename == ":memory:":
+        path = filename
+    else:
+        Path(DATA_DIR).mkdir(parents=True, exist_ok=True)
+        path = str(Path(DATA_DIR) / filename)
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    return conn
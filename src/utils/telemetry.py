@@ -0,0 +1,90 @@
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any
+
+from dotenv import load_dotenv
+
+from utils.metrics import STAGE_DURATION
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# true の場合、処理ステージごとのトレーススパンを JSON ログとして出力する
+TRACE_SPANS_ENABLED = os.getenv("TRACE_SPANS_ENABLED", "false").lower() == "true"
+
+logger = logging.getLogger("summarizer")
+
+_trace_id: ContextVar[str | None] = ContextVar("trace_id", default=None)
+
+
+class JsonFormatter(logging.Formatter):
+    """ログを1行の JSON として出力する"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload: dict[str, Any] = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "event": record.getMessage(),
+        }
+        if trace_id := _trace_id.get():
+            payload["trace_id"] = trace_id
+        payload.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def configure_logging() -> None:
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter())
+    logger.addHandler(handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+
+def log_event(event: str, level: int = logging.INFO, **fields: Any) -> None:
+    """構造化ログを出力する。fields は JSON のキーとして出力される"""
+    logger.log(level, event, extra={"fields": fields})
+
+
+def start_trace(trace_id: str | None = None) -> str:
+    """現在のコンテキスト (リクエストやジョブ) にトレースIDを設定する"""
+    trace_id = trace_id or uuid.uuid4().hex
+    _trace_id.set(trace_id)
+    return trace_id
+
+
+@contextmanager
+def span(stage: str, **fields: Any) -> Iterator[dict[str, Any]]:
+    """ステージの処理時間を計測してヒストグラムに記録する
+
+    TRACE_SPANS_ENABLED の場合はスパンを JSON ログとしても出力する。
+    yield した dict に値を追加すると、スパンのログに含まれる。
+    """
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield fields
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_DURATION.observe(elapsed, stage=stage, status=status)
+        if TRACE_SPANS_ENABLED:
+            log_event(
+                "span",
+                stage=stage,
+                status=status,
+                duration_ms=round(elapsed * 1000, 1),
+                **fields,
+            )
@@ -0,0 +1,212 @@
+import re
+from collections.abc import Iterator
+
+# 分割してはいけない範囲 (Markdown リンク、URL、太字)
+PROTECTED_PATTERN = re.compile(
+    r"\[[^\]\n]*\]\([^)\s]*\)|https?://[^\s<>()\[\]]+|\*\*[^*\n]+?\*\*"
+)
+LINE_PATTERN = re.compile(r"[^\n]*\n|[^\n]+")
+WORD_PATTERN = re.compile(r"\S+\s*|\s+")
+JA_SENTENCE_PATTERN = re.compile(r"[^。！？]*[。！？]+|[^。！？]+")
+SENTENCE_END_PATTERN = re.compile(r"[。！？.!?][\"'」』）)]*\s*$")
+# 行の途中で区切ってよい位置 (空白か文末の記号の直後で、次が空白・文末の記号以外)
+PARTIAL_CUT_PATTERN = re.compile(r"(?<=[\s。！？])(?=[^\s。！？])")
+# 閉じていない可能性がある Markdown のリンク・太字の開始
+PROTECTED_START_PATTERN = re.compile(r"\[|\*\*")
+
+# 区切りの優先度。値が大きいほどノートの区切りとして望ましい
+BREAK_NONE = 0
+BREAK_WORD = 1
+BREAK_SENTENCE = 2
+BREAK_PARAGRAPH = 3
+
+REFERENCES_HEADER = "\n\n**References**:"
+# これを超えるコードポイントは UTF-16 でサロゲートペア (2単位) になる
+BMP_MAX_CODE_POINT = 0xFFFF
+
+
+def misskey_length(text: str) -> int:
+    """Misskey (JavaScript の String.length) と同じく UTF-16 のコード単位数で数える"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _plain_atoms(text: str) -> Iterator[tuple[str, int]]:
+    """保護範囲外のテキストを単語・文の単位に分ける"""
+    for word_match in WORD_PATTERN.finditer(text):
+        word = word_match.group(0)
+        pieces = JA_SENTENCE_PATTERN.findall(word)
+        for piece in pieces[:-1]:
+            yield piece, BREAK_SENTENCE
+        last = pieces[-1]
+        if SENTENCE_END_PATTERN.search(last):
+            yield last, BREAK_SENTENCE
+        else:
+            yield last, BREAK_WORD
+
+
+def _line_atoms(line: str) -> Iterator[tuple[str, int]]:
+    """1行を分割可能な最小単位 (atom) と、その直後で区切る場合の優先度の列にする
+
+    atom をすべて連結すると元の行に戻る。
+    """
+    content = line.rstrip("\n")
+    newline = line[len(content) :]
+    if not content.strip():
+        yield line, BREAK_PARAGRAPH
+        return
+    atoms: list[tuple[str, int]] = []
+    position = 0
+    for match in PROTECTED_PATTERN.finditer(content):
+        atoms.extend(_plain_atoms(content[position : match.start()]))
+        atoms.append((match.group(0), BREAK_WORD))
+        position = match.end()
+    atoms.extend(_plain_atoms(content[position:]))
+    if newline:
+        text, priority = atoms[-1]
+        atoms[-1] = (text + newline, max(priority, BREAK_SENTENCE))
+    yield from atoms
+
+
+class NoteSplitter:
+    """テキストを Misskey のノート長以下に分割するストリーミング分割器
+
+    段落・文・単語の境界で区切り、URL や Markdown のリンク・太字は分割しない。
+    feed() で受け取ったテキストは1度ずつしか走査せず、確定したノートから順に返す。
+    """
+
+    def __init__(self, max_length: int):
+        self.max_length = max_length
+        self._pending: list[str] = []  # 改行で終わっていない行の断片
+        # 行の途中で区切る位置を探す、次の断片の長さ (見つからないたびに倍にする)
+        self._partial_threshold = 1
+        # 現在組み立て中の投稿に含まれる (text, 長さ, 優先度)
+        self._atoms: list[tuple[str, int, int]] = []
+        self._length = 0
+
+    def feed(self, text: str) -> list[str]:
+        """テキストを追加し、確定したノートを返す
+
+        改行までの行に加えて、書きかけの行も安全に区切れる位置までは処理する。
+        """
+        newline = text.rfind("\n")
+        if newline < 0:
+            self._pending.append(text)
+            return self._consume_partial()
+        self._pending.append(text[: newline + 1])
+        complete = "".join(self._pending)
+        self._pending = [text[newline + 1 :]] if newline + 1 < len(text) else []
+        self._partial_threshold = 1
+        return self._consume(complete) + self._consume_partial()
+
+    def finish(self, references: list[str] | None = None) -> list[str]:
+        """残りのテキストと参考文献を追加し、すべてのノートを返す"""
+        notes = self._consume("".join(self._pending))
+        self._pending = []
+        if references:
+            notes.extend(self._add(REFERENCES_HEADER, BREAK_NONE))
+            for reference in references:
+                notes.extend(self._add("\n" + reference, BREAK_SENTENCE))
+        if note := "".join(text for text, _, _ in self._atoms).strip():
+            notes.extend(self._hard_split(note))
+        self._atoms = []
+        self._length = 0
+        return notes
+
+    def _consume_partial(self) -> list[str]:
+        """書きかけの行を、行全体を処理した場合と同じ atom になる位置まで処理する"""
+        if sum(len(part) for part in self._pending) < self._partial_threshold:
+            return []
+        line = "".join(self._pending)
+        # 保護範囲の内側と、閉じていないリンク・太字の開始位置より後ろでは区切らない
+        protected = [match.span() for match in PROTECTED_PATTERN.finditer(line)]
+        limit = len(line)
+        index = 0
+        for match in PROTECTED_START_PATTERN.finditer(line):
+            while index < len(protected) and protected[index][1] <= match.start():
+                index += 1
+            if index == len(protected) or match.start() < protected[index][0]:
+                limit = match.start()
+                break
+        cut = 0
+        index = 0
+        for match in PARTIAL_CUT_PATTERN.finditer(line, 0, limit):
+            position = match.start()
+            while index < len(protected) and protected[index][1] <= position:
+                index += 1
+            if index == len(protected) or position <= protected[index][0]:
+                cut = position
+        if not line[:cut].strip():
+            self._partial_threshold = len(line) * 2
+            return []
+        self._pending = [line[cut:]]
+        self._partial_threshold = 1
+        return self._consume(line[:cut])
+
+    def _consume(self, text: str) -> list[str]:
+        notes: list[str] = []
+        for line_match in LINE_PATTERN.finditer(text):
+            for atom, priority in _line_atoms(line_match.group(0)):
+                notes.extend(self._add(atom, priority))
+        return notes
+
+    def _add(self, text: str, priority: int) -> list[str]:
+        length = misskey_length(text)
+        if length > self.max_length:
+            # 1つの単位が上限を超える場合だけ、文字単位で分割する
+            notes: list[str] = []
+            chunks = list(self._hard_split(text))
+            for chunk in chunks[:-1]:
+                notes.extend(self._add(chunk, BREAK_NONE))
+            notes.extend(self._add(chunks[-1], priority))
+            return notes
+        notes = []
+        # 後半の境界で確定すると前半が残るため、収まるまで確定を繰り返す
+        while self._atoms and self._length + length > self.max_length:
+            if note := self._flush():
+                notes.append(note)
+        self._atoms.append((text, length, priority))
+        self._length += length
+        return notes
+
+    def _hard_split(self, text: str) -> Iterator[str]:
+        start = 0
+        length = 0
+        for i, char in enumerate(text):
+            char_length = 2 if ord(char) > BMP_MAX_CODE_POINT else 1
+            if length + char_length > self.max_length:
+                yield text[start:i]
+                start, length = i, 0
+            length += char_length
+        yield text[start:]
+
+    def _flush(self) -> str:
+        """現在のノートを最も望ましい境界で確定し、残りを次のノートに回す
+
+        ノートが短くなりすぎないよう、境界はノートの後半からだけ選ぶ。
+        """
+        best_index = len(self._atoms) - 1
+        best_priority = -1
+        cumulative = 0
+        for i, (_, length, priority) in enumerate(self._atoms):
+            cumulative += length
+            if cumulative * 2 >= self.max_length and priority >= best_priority:
+                best_index, best_priority = i, priority
+        note = "".join(text for text, _, _ in self._atoms[: best_index + 1]).strip()
+        self._atoms = self._atoms[best_index + 1 :]
+        if self._atoms:
+            # 次の投稿の先頭の空白は取り除く
+            text, _, priority = self._atoms[0]
+            stripped = text.lstrip()
+            self._atoms[0] = (stripped, misskey_length(stripped), priority)
+        self._length = sum(length for _, length, _ in self._atoms)
+        return note
+
+
+def split_note(
+    text: str, references: list[str] | None = None, max_length: int = 3000
+) -> list[str]:
+    """テキストと参考文献をノート長以下に分割する"""
+    splitter = NoteSplitter(max_length)
+    notes = splitter.feed(text)
+    notes.extend(splitter.finish(references))
+    return notes
@@ -1,11 +1,43 @@
+import re
 from typing import Literal
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
+URL_PATTERN = re.compile(r"https?://[^\s<>\"')\]]+")
+# 同じ記事を指すURLの表記揺れとして除去するクエリパラメータ
+TRACKING_PARAMS = {"fbclid", "gclid", "ref", "ref_src"}
 
-def which_url(text: str) -> Literal["html"] | None:
+
+def which_url(text: str) -> Literal["html", "pdf"] | None:
+    """URL の拡張子から種類を推定する。実際の種類は取得時に Content-Type で判定する"""
     if not text:
         raise ValueError("テキストが指定されていません")
     if text.startswith("https://"):
-        # TODO pdf or html or ...
+        if urlsplit(text).path.lower().endswith(".pdf"):
+            return "pdf"
         return "html"
     else:
         return None
+
+
+def canonicalize_url(url: str) -> str:
+    """URLを正規化する (スキーム・ホストの小文字化、フラグメントと計測用パラメータの除去)"""
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        # URL として解釈できない (https://[oops など) 場合はそのまま使う
+        return url.strip()
+    query = sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.startswith("utm_") and key not in TRACKING_PARAMS
+    )
+    path = parts.path or "/"
+    return urlunsplit(
+        (parts.scheme.lower(), parts.netloc.lower(), path, urlencode(query), "")
+    )
+
+
+def normalize_prompt(prompt: str) -> str:
+    """プロンプト中の空白を詰め、URLを正規化する"""
+    collapsed = " ".join(prompt.split())
+    return URL_PATTERN.sub(lambda m: canonicalize_url(m.group(0)), collapsed)
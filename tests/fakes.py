@@ -0,0 +1,106 @@
+"""テストで共有するフェイク実装 (Gemini の client.aio.models と AIService の代わり)"""
+
+import asyncio
+from types import SimpleNamespace
+
+from google.genai import types
+
+
+def make_response(
+    text: str, grounded: bool = True, tokens: int | None = None, title: str = "t"
+) -> types.GenerateContentResponse:
+    """text を返す応答。grounded の場合はグラウンディングの出典を1つ含める"""
+    chunks = (
+        [types.GroundingChunk(web=types.GroundingChunkWeb(title=title, uri="u"))]
+        if grounded
+        else None
+    )
+    usage = (
+        types.GenerateContentResponseUsageMetadata(total_token_count=tokens)
+        if tokens is not None
+        else None
+    )
+    return types.GenerateContentResponse(
+        candidates=[
+            types.Candidate(
+                content=types.Content(role="model", parts=[types.Part(text=text)]),
+                grounding_metadata=types.GroundingMetadata(grounding_chunks=chunks),
+            )
+        ],
+        usage_metadata=usage,
+    )
+
+
+class FakeModels:
+    """client.aio.models の代わり。呼び出しを記録し、respond() の応答を返す
+
+    既定ではグラウンディングの無い固定の要約を返す。テストごとの応答は respond() を上書きして作る。
+    """
+
+    def __init__(self):
+        self.calls: list[dict] = []
+
+    async def respond(
+        self, model: str, contents, config
+    ) -> types.GenerateContentResponse:
+        return make_response("要約です", grounded=False)
+
+    async def generate_content(self, model: str, contents, config=None):
+        self.calls.append({"model": model, "contents": contents, "config": config})
+        return await self.respond(model, contents, config)
+
+    async def generate_content_stream(self, model: str, contents, config=None):
+        response = await self.generate_content(model, contents, config)
+
+        async def stream():
+            yield response
+
+        return stream()
+
+
+def use_models(service, models: FakeModels) -> None:
+    """AIService の Gemini クライアントを models に差し替える"""
+    service.client = SimpleNamespace(aio=SimpleNamespace(models=models))
+
+
+class FakeAIService:
+    """MisskeyService に渡す AIService の代わり
+
+    プロンプトごとに "<prompt>-1" から "<prompt>-<parts>" までのテキストを返す。
+    """
+
+    def __init__(
+        self,
+        parts: int = 1,
+        latency: float = 0.0,
+        failing_prompts: set[str] | None = None,
+    ):
+        self.parts = parts
+        self.latency = latency
+        self.prompts: list[str] = []
+        # 要約に失敗させるプロンプト
+        self.failing_prompts = failing_prompts or set()
+        # ストリーミングの生成中 (2つ目のテキストの前) に失敗させる回数
+        self.stream_failures = 0
+
+    def texts(self, prompt: str) -> list[str]:
+        return [f"{prompt}-{i}" for i in range(1, self.parts + 1)]
+
+    async def agenerate_content_if(self, prompt: str) -> list[str]:
+        self.prompts.append(prompt)
+        await asyncio.sleep(self.latency)
+        if prompt in self.failing_prompts:
+            raise ValueError("generation failed")
+        return self.texts(prompt)
+
+    async def astream_content_if(self, prompt: str):
+        self.prompts.append(prompt)
+        for i, text in enumerate(self.texts(prompt)):
+            if i > 0:
+                await asyncio.sleep(self.latency)
+                if prompt in self.failing_prompts:
+                    raise ValueError("generation failed")
+                if self.stream_failures:
+                    self.stream_failures -= 1
+                    raise RuntimeError("stream interrupted")
+            yield text
@@ -1,8 +1,35 @@
+import asyncio
+import os
+import sys
 from json import load
 
+import google.auth
 import pytest
+from google.auth.exceptions import DefaultCredentialsError
 
-from src.services.ai_service import AIService
+# プロジェクトの src ディレクトリをパスに追加
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+
+from services.ai_service import AIService
+
+
+def has_vertex_ai_credentials() -> bool:
+    if not os.getenv("PROJECT_ID"):
+        return False
+    try:
+        google.auth.default()
+    except DefaultCredentialsError:
+        return False
+    return True
+
+
+# Vertex AI を実際に呼び出すテストは、認証情報 (ADC と PROJECT_ID) がある場合だけ実行する
+requires_vertex_ai = pytest.mark.skipif(
+    not has_vertex_ai_credentials(),
+    reason="Vertex AI の認証情報 (ADC / PROJECT_ID) がありません",
+)
 
 
 def test_ai_service_initialization():
@@ -38,3 +65,23 @@ def test_ai_searvice_generate_content_with_url2():
     prompt = "https://www.kanaloco.jp/news/culture/bunka/article-1201513.html"
     answer = ai_service.generate_content_if(prompt)
     print("Generated content with search:", answer)
+
+
+@requires_vertex_ai
+def test_ai_service_agenerate_content():
+    ai_service = AIService()
+    prompt = "こんにちは、元気ですか？"
+    answer = asyncio.run(ai_service.agenerate_content_if(prompt))
+    print("Generated content (async):", answer)
+
+
+@requires_vertex_ai
+def test_ai_service_astream_content():
+    ai_service = AIService()
+    prompt = "こんにちは、元気ですか？"
+
+    async def collect() -> list[str]:
+        return [text async for text in ai_service.astream_content_if(prompt)]
+
+    answer = asyncio.run(collect())
+    print("Generated content (stream):", answer)
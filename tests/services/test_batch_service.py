@@ -0,0 +1,177 @@
+import asyncio
+import json
+import os
+import sys
+
+# プロジェクトの src ディレクトリをパスに追加
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+os.environ.setdefault("PROJECT_ID", "test-project")
+os.environ.setdefault("REGION", "us-central1")
+
+from services.ai_service import AIService, ModelRouter
+from services.batch_service import BatchSummaryService, LocalBatchBackend
+from services.cache_service import SummaryCache
+from services.discord_service import Message
+from services.misskey_service import MisskeyService
+from tests import fakes
+from utils.metrics import BATCH_ITEMS, FALLBACKS
+
+PRO = "pro-model"
+TOKENS = 10
+
+
+def response_dict(text: str, grounded: bool = True) -> dict:
+    metadata = {"groundingChunks": [{"web": {"title": "t", "uri": "u"}}]}
+    return {
+        "candidates": [
+            {
+                "content": {"role": "model", "parts": [{"text": text}]},
+                "groundingMetadata": metadata if grounded else {},
+            }
+        ],
+        "usageMetadata": {"totalTokenCount": TOKENS},
+    }
+
+
+def prompt_of(request: dict) -> str:
+    return request["contents"][0]["parts"][0]["text"]
+
+
+class FakeModels(fakes.FakeModels):
+    """オンラインの生成。呼び出されたプロンプトを記録する"""
+
+    async def respond(self, model: str, contents, config):
+        return fakes.make_response(f"online {contents}", tokens=TOKENS)
+
+    def prompts(self) -> list[str]:
+        return [call["contents"] for call in self.calls]
+
+
+def make_service(
+    tmp_path, responder, cache: SummaryCache | None = None
+) -> tuple[BatchSummaryService, FakeModels, list[dict]]:
+    requests: list[dict] = []
+
+    async def record(model: str, request: dict) -> dict:
+        assert model == PRO
+        requests.append(request)
+        return await responder(request)
+
+    ai_service = AIService(
+        cache=cache, router=ModelRouter(policy="pro", pro_model=PRO), hedging=False
+    )
+    models = FakeModels()
+    fakes.use_models(ai_service, models)
+    backend = LocalBatchBackend(tmp_path, record)
+    service = BatchSummaryService(ai_service, backend, min_items=2, poll_interval=0.01)
+    return service, models, requests
+
+
+def test_batch_summaries_are_returned_in_prompt_order(tmp_path):
+    async def responder(request: dict) -> dict:
+        # 出力の順番が入力と違っていても、ラベルのキーで対応付ける
+        await asyncio.sleep(0.01 if prompt_of(request) == "a" else 0)
+        return response_dict(f"batch {prompt_of(request)}")
+
+    service, models, requests = make_service(tmp_path, responder)
+    before = BATCH_ITEMS.value(source="batch")
+
+    outcomes = asyncio.run(service.summarize(["a", "b", "c"]))
+
+    assert [o.texts[0].split("\n")[0] for o in outcomes] == [
+        "batch a",
+        "batch b",
+        "batch c",
+    ]
+    assert {o.source for o in outcomes} == {"batch"}
+    assert outcomes[0].tokens == TOKENS
+    assert models.prompts() == []
+    assert requests[0]["tools"] == [{"googleSearch": {}}]
+    assert requests[0]["generationConfig"] == {"responseModalities": ["TEXT"]}
+    assert BATCH_ITEMS.value(source="batch") == before + 3
+    # 入力ファイルは Vertex AI のバッチ予測と同じ JSONL
+    (job_dir,) = tmp_path.iterdir()
+    lines = (job_dir / "input.jsonl").read_text().splitlines()
+    assert json.loads(lines[1])["request"]["labels"] == {"batch_key": "1"}
+
+
+def test_ungrounded_and_failed_rows_are_summarized_online(tmp_path):
+    async def responder(request: dict) -> dict:
+        prompt = prompt_of(request)
+        if prompt == "broken":
+            raise ValueError("row failed")
+        return response_dict(f"batch {prompt}", grounded=prompt != "https://x.test/")
+
+    service, models, _ = make_service(tmp_path, responder)
+
+    outcomes = asyncio.run(service.summarize(["ok", "broken", "https://x.test/"]))
+
+    assert [o.source for o in outcomes] == ["batch", "online", "online"]
+    assert sorted(models.prompts()) == ["broken", "https://x.test/"]
+    assert outcomes[1].result()[0].startswith("online broken")
+
+
+def test_failed_job_falls_back_to_online(tmp_path):
+    async def responder(request: dict) -> dict:
+        raise RuntimeError("unreachable")
+
+    service, models, _ = make_service(tmp_path, responder)
+
+    async def failing_state(name: str) -> str:
+        return "failed"
+
+    service.backend.state = failing_state
+    before = FALLBACKS.value(kind="batch_to_online")
+
+    outcomes = asyncio.run(service.summarize(["a", "b"]))
+
+    assert [o.source for o in outcomes] == ["online", "online"]
+    assert models.prompts() == ["a", "b"]
+    assert FALLBACKS.value(kind="batch_to_online") == before + 1
+
+
+def test_cached_prompts_are_not_submitted(tmp_path):
+    async def responder(request: dict) -> dict:
+        return response_dict(f"batch {prompt_of(request)}")
+
+    cache = SummaryCache(":memory:")
+    service, _, requests = make_service(tmp_path, responder, cache)
+    asyncio.run(service.summarize(["a", "b"]))
+
+    outcomes = asyncio.run(service.summarize(["a", "c"]))
+
+    assert [o.source for o in outcomes] == ["cache", "batch"]
+    assert [prompt_of(r) for r in requests] == ["a", "b", "c"]
+
+
+def test_message_summaries_posts_batch_results_in_order(tmp_path):
+    async def responder(request: dict) -> dict:
+        return response_dict(f"batch {prompt_of(request)}", grounded=False)
+
+    batch_service, _, requests = make_service(tmp_path, responder)
+    service = MisskeyService(batch_service=batch_service)
+    posted: list[str] = []
+
+    async def fake_post(body: dict[str, str]) -> str:
+        posted.append(body["text"])
+        return f"note-{len(posted)}"
+
+    service._post_to_misskey = fake_post
+    messages = [
+        Message(
+            id=i,
+            content=f"message {i}",
+            author_name="user",
+            author_id=1,
+            created_at="2025-01-01T00:00:00+00:00",
+        )
+        for i in range(3)
+    ]
+
+    results = asyncio.run(service.message_summaries(messages))
+
+    assert [r.status for r in results] == ["success"] * 3
+    assert len(requests) == len(messages)
+    assert posted == [f"batch message {i}" for i in range(3)]
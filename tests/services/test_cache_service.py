@@ -0,0 +1,52 @@
+import os
+import sys
+
+# プロジェクトの src ディレクトリをパスに追加
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+
+from services.cache_service import SummaryCache
+
+
+def test_summary_cache_hit_and_miss():
+    cache = SummaryCache(path=":memory:")
+    key = cache.make_key("https://example.com/a", "url", "gemini-2.5-pro")
+
+    assert cache.get(key) is None
+    cache.set(key, ["summary", "references"])
+
+    assert cache.get(key) == ["summary", "references"]
+    assert cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+
+def test_summary_cache_key_is_normalized():
+    make_key = SummaryCache.make_key
+    assert make_key(
+        " https://Example.com/a?utm_source=x#top ", "url", "gemini-2.5-pro"
+    ) == make_key("https://example.com/a", "url", "gemini-2.5-pro")
+    assert make_key("https://example.com/a", "url", "gemini-2.5-pro") != make_key(
+        "https://example.com/a", "search", "gemini-2.5-pro"
+    )
+    assert make_key("https://example.com/a", "url", "gemini-2.5-pro") != make_key(
+        "https://example.com/a", "url", "gemini-2.5-flash"
+    )
+
+
+def test_summary_cache_expires_entries():
+    cache = SummaryCache(path=":memory:", ttl_seconds=-1)
+    cache.set("key", ["summary"])
+
+    assert cache.get("key") is None
+
+
+def test_summary_cache_evicts_least_recently_used():
+    cache = SummaryCache(path=":memory:", max_entries=2)
+    cache.set("a", ["a"])
+    cache.set("b", ["b"])
+    cache.get("a")
+    cache.set("c", ["c"])
+
+    assert cache.get("b") is None
+    assert cache.get("a") == ["a"]
+    assert cache.get("c") == ["c"]
@@ -0,0 +1,117 @@
+import asyncio
+import os
+import sys
+
+# プロジェクトの src ディレクトリをパスに追加
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+os.environ.setdefault("PROJECT_ID", "test-project")
+os.environ.setdefault("REGION", "us-central1")
+
+from services.digest_service import DIGEST_PROMPT, plan_units
+from services.discord_service import Message
+from services.misskey_service import MisskeyService, last_contiguous_success
+from tests.fakes import FakeAIService
+
+
+def make_message(i: int, content: str) -> Message:
+    return Message(
+        id=i,
+        content=content,
+        author_name=f"user{i}",
+        author_id=i,
+        created_at="2025-01-01T00:00:00+00:00",
+    )
+
+
+def test_without_digest_each_message_is_a_unit():
+    messages = [make_message(1, " a "), make_message(2, "b")]
+
+    units = plan_units(messages)
+
+    assert [unit.prompt for unit in units] == ["a", "b"]
+
+
+def test_digest_packs_chatter_and_keeps_urls_separate():
+    messages = [
+        make_message(1, "おはよう"),
+        make_message(2, "今日は雨"),
+        make_message(3, "https://example.com/a"),
+        make_message(4, "傘を忘れた"),
+    ]
+
+    units = plan_units(messages, digest=True)
+
+    # URL のメッセージをまたいではまとめない
+    assert [[m.id for m in unit.messages] for unit in units] == [[1, 2], [3], [4]]
+    digest = units[0].prompt
+    assert digest.startswith(DIGEST_PROMPT)
+    assert "[1 user1]\nおはよう" in digest
+    assert "[2 user2]\n今日は雨" in digest
+    assert units[1].prompt == "https://example.com/a"
+    assert units[2].prompt == "傘を忘れた"
+
+
+def test_digest_splits_at_token_budget():
+    messages = [make_message(i, "あ" * 40) for i in range(1, 6)]
+    max_tokens = len(DIGEST_PROMPT) + 110
+
+    units = plan_units(messages, digest=True, max_tokens=max_tokens)
+
+    assert [[m.id for m in unit.messages] for unit in units] == [[1, 2], [3, 4], [5]]
+    assert all(len(unit.prompt) <= max_tokens for unit in units)
+    # 1件だけ残った場合はダイジェストにしない
+    assert units[2].prompt == "あ" * 40
+
+
+def test_digest_keeps_recorded_units_and_groups_only_the_rest():
+    """前回の単位に記録済みのメッセージは、同じ単位のまま残りと混ぜずにまとめる"""
+    messages = [
+        make_message(2, "https://example.com/a"),
+        make_message(3, "おはよう"),
+        make_message(4, "今日は雨"),
+        make_message(5, "傘を忘れた"),
+    ]
+    sources = {3: "discord:3,4", 4: "discord:3,4"}
+
+    units = plan_units(messages, digest=True, sources=sources)
+
+    assert [[m.id for m in unit.messages] for unit in units] == [[2], [3, 4], [5]]
+    assert [unit.key for unit in units] == [None, "discord:3,4", None]
+
+
+def test_message_summaries_digest_shares_notes_and_keeps_message_order():
+    ai_service = FakeAIService(failing_prompts={"https://example.com/fail"})
+    service = MisskeyService(ai_service=ai_service, concurrency=1)
+    posted: list[str] = []
+
+    async def fake_post(body: dict[str, str]) -> str:
+        posted.append(body["text"])
+        return f"note-{len(posted)}"
+
+    service._post_to_misskey = fake_post
+    messages = [
+        make_message(1, "https://example.com/a"),
+        make_message(2, "おはよう"),
+        make_message(3, "今日は雨"),
+        make_message(4, "https://example.com/fail"),
+        make_message(5, "傘を忘れた"),
+    ]
+
+    results = asyncio.run(service.message_summaries(messages, digest=True))
+
+    assert len(ai_service.prompts) == len(messages) - 1
+    assert [r.message_id for r in results] == [1, 2, 3, 4, 5]
+    assert [r.status for r in results] == [
+        "success",
+        "success",
+        "success",
+        "failed",
+        "success",
+    ]
+    assert results[1].note_ids == results[2].note_ids
+    # 失敗したメッセージより後ろはカーソルを進めない
+    assert last_contiguous_success(results) == messages[2].id
+    # 失敗した URL より後ろのメッセージは、別のダイジェスト (単位) として投稿している
+    assert results[4].note_ids != results[2].note_ids
@@ -0,0 +1,190 @@
+import asyncio
+import json
+import os
+import sys
+from datetime import UTC, datetime
+from http import HTTPStatus
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import discord
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# プロジェクトの src ディレクトリをパスに追加
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+
+from routers import discord_messages
+from services.cursor_store import CursorStore
+from services.discord_service import (
+    ChannelConfig,
+    DiscordService,
+    MessageRecord,
+    parse_channels,
+)
+
+
+def make_discord_message(message_id: int):
+    return SimpleNamespace(
+        id=message_id,
+        content=f"message {message_id}",
+        author=SimpleNamespace(name="user", id=1),
+        created_at=datetime(2025, 1, 1, tzinfo=UTC),
+    )
+
+
+def make_service(message_ids: list[int], error: Exception | None = None):
+    history_calls: list[dict] = []
+
+    async def history(**kwargs):
+        history_calls.append(kwargs)
+        if error is not None:
+            raise error
+        for message_id in message_ids:
+            yield make_discord_message(message_id)
+
+    channel = MagicMock(spec=discord.TextChannel)
+    channel.name = "general"
+    channel.history = history
+    discord_client = MagicMock()
+    discord_client.is_closed.return_value = False
+    discord_client.get_channel.return_value = channel
+
+    service = DiscordService()
+    service.discord_client = discord_client
+    service.cursor_store = CursorStore(path=":memory:")
+    return service, history_calls
+
+
+def test_unprocessed_messages_without_cursor_reads_recent_utc_window():
+    service, history_calls = make_service([1, 2])
+
+    messages = asyncio.run(service.get_discord_unprocessed_messages(10))
+
+    assert [m.id for m in messages] == [1, 2]
+    after = history_calls[0]["after"]
+    assert isinstance(after, datetime)
+    assert after.tzinfo is not None
+
+
+def test_unprocessed_messages_reads_after_cursor():
+    service, history_calls = make_service([6, 7])
+    service.advance_channel_cursor(10, 5)
+
+    asyncio.run(service.get_discord_unprocessed_messages(10))
+
+    assert history_calls[0]["after"].id == 5  # noqa: PLR2004
+    assert history_calls[0]["limit"] is None
+
+
+def test_rest_slot_is_released_while_the_consumer_reads():
+    """遅いクライアントがストリームを読む間、他のチャンネルの取得を止めない"""
+    service, _ = make_service([3, 2, 1])
+    service.rest_semaphore = asyncio.Semaphore(1)
+
+    async def run():
+        return [
+            service.rest_semaphore.locked()
+            async for _ in service.iter_channel_messages(10, limit=3)
+        ]
+
+    assert asyncio.run(run()) == [False, False, False]
+
+
+def test_cursor_only_moves_forward():
+    store = CursorStore(path=":memory:")
+    store.advance(10, 7)
+    store.advance(10, 3)
+
+    assert store.get(10) == 7  # noqa: PLR2004
+    assert store.get(11) is None
+
+
+def test_message_record_json_matches_message_model():
+    record = MessageRecord.from_discord(make_discord_message(1))
+
+    assert json.loads(record.to_json()) == record.to_message().model_dump()
+
+
+def make_client(service: DiscordService) -> TestClient:
+    app = FastAPI()
+    app.include_router(discord_messages.router)
+    app.state.discord_client = service.discord_client
+    app.state.cursor_store = service.cursor_store
+    app.state.discord_rest_semaphore = None
+    return TestClient(app)
+
+
+def test_channel_messages_pages_with_before_and_after():
+    service, history_calls = make_service([3, 2])
+    client = make_client(service)
+
+    response = client.get("/channel/10/messages", params={"before": 4, "after": 1})
+
+    assert [m["id"] for m in response.json()] == [3, 2]
+    assert history_calls[0]["before"].id == 4  # noqa: PLR2004
+    assert history_calls[0]["after"].id == 1
+
+
+def test_channel_messages_streams_ndjson():
+    service, history_calls = make_service([3, 2, 1])
+    client = make_client(service)
+
+    response = client.get(
+        "/channel/10/messages", params={"format": "ndjson", "limit": 3}
+    )
+
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = response.text.splitlines()
+    assert [json.loads(line)["id"] for line in lines] == [3, 2, 1]
+    assert history_calls[0]["limit"] == 3  # noqa: PLR2004
+    assert history_calls[0]["before"] is None
+
+
+def test_channel_messages_ndjson_reports_forbidden_as_status():
+    forbidden = discord.Forbidden(MagicMock(status=403, reason="Forbidden"), "no")
+    service, _ = make_service([], error=forbidden)
+    client = make_client(service)
+
+    response = client.get("/channel/10/messages", params={"format": "ndjson"})
+
+    assert response.status_code == HTTPStatus.FORBIDDEN
+
+
+def test_parse_channels_reads_ids_and_visibility():
+    channels = parse_channels("1:public, 2 ,3:followers,")
+
+    assert channels == [
+        ChannelConfig(channel_id=1, visibility="public"),
+        ChannelConfig(channel_id=2, visibility="home"),
+        ChannelConfig(channel_id=3, visibility="followers"),
+    ]
+
+
+def test_parse_channels_rejects_unknown_visibility():
+    with pytest.raises(ValueError):
+        parse_channels("1:everyone")
+
+
+def test_rest_only_client_fetches_and_reuses_channels():
+    service, _ = make_service([1, 2])
+    channel = service.discord_client.get_channel.return_value
+    # ゲートウェイに接続していないクライアントはチャンネルのキャッシュを持たない
+    service.discord_client.get_channel.return_value = None
+    service.discord_client.is_ready.return_value = False
+    fetched: list[int] = []
+
+    async def fetch_channel(channel_id: int):
+        fetched.append(channel_id)
+        return channel
+
+    service.discord_client.fetch_channel = fetch_channel
+
+    first = asyncio.run(service.get_discord_channel_messages(123))
+    second = asyncio.run(service.get_discord_channel_messages(123))
+
+    assert [m.id for m in first] == [m.id for m in second] == [1, 2]
+    assert fetched == [123]
@@ -0,0 +1,45 @@
+import os
+import sys
+import time
+
+# プロジェクトの src ディレクトリをパスに追加
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+
+from services.domain_store import DomainFailureStore
+
+
+def test_domain_is_blocked_after_repeated_failures():
+    store = DomainFailureStore(path=":memory:", threshold=2)
+
+    store.record_failure("paywall.example.com")
+    assert not store.is_blocked("paywall.example.com")
+    store.record_failure("paywall.example.com")
+    assert store.is_blocked("paywall.example.com")
+    assert not store.is_blocked("example.com")
+
+
+def test_success_resets_failures():
+    store = DomainFailureStore(path=":memory:", threshold=1)
+
+    store.record_failure("example.com")
+    store.record_success("example.com")
+
+    assert not store.is_blocked("example.com")
+
+
+def test_failures_expire():
+    store = DomainFailureStore(path=":memory:", threshold=1, ttl_seconds=60)
+    store.conn.execute(
+        "INSERT INTO url_domain_failures VALUES (?, ?, ?)",
+        ("example.com", 5, time.time() - 120),
+    )
+
+    assert not store.is_blocked("example.com")
+    # 期限切れの失敗は数え直す
+    store.record_failure("example.com")
+    (failures,) = store.conn.execute(
+        "SELECT failures FROM url_domain_failures WHERE domain = 'example.com'"
+    ).fetchone()
+    assert failures == 1
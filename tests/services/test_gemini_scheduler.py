@@ -0,0 +1,153 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+from google.genai import errors
+
+# プロジェクトの src ディレクトリをパスに追加
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+os.environ.setdefault("PROJECT_ID", "test-project")
+os.environ.setdefault("REGION", "us-central1")
+
+from services import gemini_scheduler
+from services.ai_service import GEMINI_OUTPUT_TOKENS_ESTIMATE, AIService, ModelRouter
+from services.gemini_scheduler import GeminiScheduler, gemini_priority
+from services.rate_limit_store import RateLimitStore
+from tests import fakes
+from utils.metrics import GEMINI_QUEUE_DEPTH, GEMINI_QUEUE_WAIT, RETRIES
+
+TOKENS = 30
+
+
+def quota_error() -> errors.ClientError:
+    return errors.ClientError(
+        429, {"error": {"message": "quota", "status": "RESOURCE_EXHAUSTED"}}
+    )
+
+
+def test_interactive_requests_run_before_backlog():
+    scheduler = GeminiScheduler(rpm=1, tpm=0, window_seconds=0.05)
+    order: list[str] = []
+
+    async def call(name: str) -> str:
+        order.append(name)
+        return name
+
+    async def main():
+        with gemini_priority("backlog"):
+            backlog = [
+                asyncio.create_task(scheduler.run(lambda n=n: call(n), 1))
+                for n in ("backlog-1", "backlog-2")
+            ]
+        interactive = asyncio.create_task(scheduler.run(lambda: call("live"), 1))
+        return await asyncio.gather(*backlog, interactive)
+
+    results = asyncio.run(main())
+
+    assert results == ["backlog-1", "backlog-2", "live"]
+    assert order == ["live", "backlog-1", "backlog-2"]
+    assert GEMINI_QUEUE_DEPTH.value(priority="backlog") == 0
+
+
+def test_token_budget_delays_requests():
+    scheduler = GeminiScheduler(rpm=0, tpm=100, window_seconds=0.2)
+    before = GEMINI_QUEUE_WAIT.count(priority="interactive")
+
+    async def call() -> None:
+        return None
+
+    async def main():
+        start = time.perf_counter()
+        await scheduler.run(call, 100)
+        await scheduler.run(call, 50)
+        return time.perf_counter() - start
+
+    elapsed = asyncio.run(main())
+
+    # 使い切った後は 50 トークン分 (0.1 秒) 回復するまで待つ
+    assert elapsed >= 0.08  # noqa: PLR2004
+    assert GEMINI_QUEUE_WAIT.count(priority="interactive") == before + 2
+
+
+def test_quota_errors_are_retried(monkeypatch):
+    monkeypatch.setattr(gemini_scheduler, "GEMINI_BACKOFF_SECONDS", 0.01)
+    scheduler = GeminiScheduler(rpm=0, tpm=0, max_retries=2)
+    attempts: list[int] = []
+
+    async def call() -> str:
+        attempts.append(len(attempts))
+        if len(attempts) <= scheduler.max_retries:
+            raise quota_error()
+        return "ok"
+
+    before = RETRIES.value(target="gemini")
+
+    assert asyncio.run(scheduler.run(call, 1)) == "ok"
+    assert len(attempts) == scheduler.max_retries + 1
+    assert RETRIES.value(target="gemini") == before + 2
+
+
+def test_other_errors_and_exhausted_retries_are_raised(monkeypatch):
+    monkeypatch.setattr(gemini_scheduler, "GEMINI_BACKOFF_SECONDS", 0.01)
+    scheduler = GeminiScheduler(rpm=0, tpm=0, max_retries=1)
+    calls: list[str] = []
+
+    async def bad_request() -> None:
+        calls.append("bad")
+        raise errors.ClientError(400, {"error": {"message": "bad"}})
+
+    async def exhausted() -> None:
+        calls.append("quota")
+        raise quota_error()
+
+    with pytest.raises(errors.ClientError):
+        asyncio.run(scheduler.run(bad_request, 1))
+    with pytest.raises(errors.ClientError):
+        asyncio.run(scheduler.run(exhausted, 1))
+    assert calls == ["bad", "quota", "quota"]
+
+
+def test_ai_service_settles_actual_token_usage():
+    # テスト中に残量が回復しないよう、回復の間隔を長くする
+    scheduler = GeminiScheduler(rpm=0, tpm=100_000, window_seconds=1e6)
+
+    class FakeModels(fakes.FakeModels):
+        async def respond(self, model: str, contents, config):
+            return fakes.make_response("summary", grounded=False, tokens=TOKENS)
+
+    service = AIService(
+        router=ModelRouter(policy="pro"), hedging=False, scheduler=scheduler
+    )
+    fakes.use_models(service, FakeModels())
+
+    texts = asyncio.run(service.agenerate_content("prompt", "search"))
+
+    assert texts[0].startswith("summary")
+    # 見込み (入力の文字数 + 出力の見込み) ではなく、実際の使用量だけが引かれている
+    assert GEMINI_OUTPUT_TOKENS_ESTIMATE > TOKENS
+    assert 100_000 - scheduler.available_tokens() == pytest.approx(TOKENS, abs=1)
+
+
+def test_processes_share_one_budget(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    # 別のプロセスのスケジューラも、同じファイルの残量を使う
+    first = GeminiScheduler(rpm=2, tpm=0, store=RateLimitStore(path))
+    second = GeminiScheduler(rpm=2, tpm=0, store=RateLimitStore(path))
+
+    async def call() -> None:
+        return None
+
+    async def main():
+        await first.run(call, 1)
+        await first.run(call, 1)
+        # first が割り当てを使い切ったため、second は回復するまで待つ
+        await asyncio.wait_for(second.run(call, 1), timeout=0.2)
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(main())
+    # 割り当ての全体 (プロセス数で等分しない) を1つのプロセスで使える
+    assert first.rpm == 2  # noqa: PLR2004
@@ -0,0 +1,129 @@
+import asyncio
+import os
+import sys
+
+# プロジェクトの src ディレクトリをパスに追加
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+
+from services.job_service import JobProgress, JobService, JobStore
+from utils import storage
+
+
+def test_job_service_runs_job_and_records_progress():
+    async def run():
+        service = JobService(JobStore(path=":memory:"))
+        release = asyncio.Event()
+
+        async def runner(report):
+            report(JobProgress(total=2, done=1))
+            await release.wait()
+            return ["done"]
+
+        job, created = service.submit("summary", "summary:1", runner)
+        await asyncio.sleep(0)
+        running = service.store.get(job.id)
+        duplicate, duplicate_created = service.submit("summary", "summary:1", runner)
+        release.set()
+        await asyncio.gather(*service._tasks)
+        return job, created, running, duplicate, duplicate_created, service
+
+    job, created, running, duplicate, duplicate_created, service = asyncio.run(run())
+
+    assert created
+    assert running.status == "running"
+    assert running.progress == JobProgress(total=2, done=1)
+    # 実行中のジョブと同じキーで登録した場合は同じジョブを返す
+    assert not duplicate_created
+    assert duplicate.id == job.id
+    finished = service.store.get(job.id)
+    assert finished.status == "succeeded"
+    assert finished.result == ["done"]
+
+
+def test_job_service_records_failure():
+    async def run():
+        service = JobService(JobStore(path=":memory:"))
+
+        async def runner(report):
+            raise ValueError("boom")
+
+        job, _ = service.submit("summary", "summary:1", runner)
+        await asyncio.gather(*service._tasks)
+        return service.store.get(job.id)
+
+    job = asyncio.run(run())
+
+    assert job.status == "failed"
+    assert job.error == "boom"
+
+
+def test_interrupt_orphaned_keeps_jobs_of_live_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DATA_DIR", str(tmp_path))
+    worker = JobStore(path="jobs.sqlite3")
+    running, _ = worker.create_or_get_active("summary", "summary:1")
+    dead = JobStore(path="jobs.sqlite3")
+    # 終了したワーカーが残したジョブ
+    dead.owner = f"{dead.host}:{2**22 + 1}"
+    orphaned, _ = dead.create_or_get_active("summary", "summary:2")
+
+    restarted = JobStore(path="jobs.sqlite3")
+    restarted.owner = "other-worker"
+    restarted.interrupt_orphaned()
+
+    assert worker.get(running.id).status == "queued"
+    assert worker.get(orphaned.id).status == "interrupted"
+
+    # 終了するワーカーは自分のジョブだけを中断扱いにする
+    restarted.interrupt_active()
+    assert worker.get(running.id).status == "queued"
+    worker.interrupt_active()
+    assert worker.get(running.id).status == "interrupted"
+
+
+def test_job_service_run_waits_and_allows_one_run_per_key():
+    async def run():
+        service = JobService(JobStore(path=":memory:"))
+        release = asyncio.Event()
+
+        async def runner(report):
+            await release.wait()
+            return ["done"]
+
+        first = asyncio.create_task(service.run("rss_summary", "rss_summary", runner))
+        await asyncio.sleep(0)
+        # 実行中の間は、同じキーの2回目を実行しない
+        duplicate, duplicate_created = await service.run(
+            "rss_summary", "rss_summary", runner
+        )
+        release.set()
+        job, created = await first
+        return job, created, duplicate, duplicate_created
+
+    job, created, duplicate, duplicate_created = asyncio.run(run())
+
+    assert created
+    assert job.status == "succeeded"
+    assert job.result == ["done"]
+    assert not duplicate_created
+    assert duplicate.id == job.id
+
+
+def test_job_service_run_interrupts_cancelled_job():
+    async def run():
+        service = JobService(JobStore(path=":memory:"))
+
+        async def runner(report):
+            await asyncio.Event().wait()
+
+        task = asyncio.create_task(service.run("rss_summary", "rss_summary", runner))
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        # 取り消されたジョブは実行中のまま残らず、次の実行を登録できる
+        return service.store.create_or_get_active("rss_summary", "rss_summary")
+
+    _, created = asyncio.run(run())
+
+    assert created
@@ -0,0 +1,101 @@
+import asyncio
+import os
+import sys
+from datetime import UTC, datetime
+from types import SimpleNamespace
+
+# プロジェクトの src ディレクトリをパスに追加
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+os.environ.setdefault("PROJECT_ID", "test-project")
+os.environ.setdefault("REGION", "us-central1")
+
+from services.discord_service import ChannelConfig, to_message
+from services.live_service import LiveSummaryService
+from services.misskey_service import MisskeyService, SummaryResult
+from services.post_ledger import PostLedger
+from tests.fakes import FakeAIService
+
+
+class FakeMisskeyService:
+    def __init__(self):
+        self.summarized: list[int] = []
+        self.visibilities: dict[int, str] = {}
+
+    async def message_summaries(self, messages, visibility="home"):
+        self.summarized.extend(m.id for m in messages)
+        self.visibilities.update((m.id, visibility) for m in messages)
+        return [SummaryResult(message_id=m.id, status="success") for m in messages]
+
+
+def make_discord_message(message_id: int, channel_id: int = 10, bot: bool = False):
+    return SimpleNamespace(
+        id=message_id,
+        content=f"message {message_id}",
+        channel=SimpleNamespace(id=channel_id),
+        author=SimpleNamespace(name="user", id=1, bot=bot),
+        created_at=datetime(2025, 1, 1, tzinfo=UTC),
+    )
+
+
+def test_live_summary_summarizes_queued_messages():
+    async def run():
+        misskey_service = FakeMisskeyService()
+        channels = [
+            ChannelConfig(channel_id=10),
+            ChannelConfig(channel_id=20, visibility="public"),
+        ]
+        service = LiveSummaryService(misskey_service, channels, workers=2)
+        service.start()
+        assert service.enqueue(make_discord_message(1))
+        assert service.enqueue(make_discord_message(2))
+        assert service.enqueue(make_discord_message(5, channel_id=20))
+        assert not service.enqueue(make_discord_message(3, channel_id=99))
+        assert not service.enqueue(make_discord_message(4, bot=True))
+        await service.queue.join()
+        await service.stop()
+        return misskey_service
+
+    misskey_service = asyncio.run(run())
+
+    assert sorted(misskey_service.summarized) == [1, 2, 5]
+    assert misskey_service.visibilities == {1: "home", 2: "home", 5: "public"}
+
+
+def test_polling_after_live_summary_does_not_repost():
+    """ライブ要約はカーソルを進めず、ポーリングで読んだ同じメッセージは台帳で飛ばす"""
+
+    ai_service = FakeAIService()
+    misskey_service = MisskeyService(
+        ai_service=ai_service, ledger=PostLedger(":memory:")
+    )
+    posted: list[str] = []
+
+    async def fake_post(body):
+        posted.append(body["text"])
+        return f"note-{len(posted)}"
+
+    misskey_service._post_to_misskey = fake_post
+
+    async def run():
+        service = LiveSummaryService(
+            misskey_service, [ChannelConfig(channel_id=10)], workers=1
+        )
+        service.start()
+        service.enqueue(make_discord_message(2))
+        await service.queue.join()
+        await service.stop()
+        # 停止中に投稿された古いメッセージ 1 と、ライブ要約済みの 2 をポーリングで読む
+        return await misskey_service.message_summaries(
+            [
+                to_message(make_discord_message(1)),
+                to_message(make_discord_message(2)),
+            ]
+        )
+
+    results = asyncio.run(run())
+
+    assert [r.status for r in results] == ["success", "success"]
+    assert ai_service.prompts == ["message 2", "message 1"]
+    assert posted == ["message 2-1", "message 1-1"]
@@ -0,0 +1,34 @@
+import os
+import sys
+
+# プロジェクトの src ディレクトリをパスに追加
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+
+from services.metrics_store import MetricsStore
+from utils.metrics import Counter, Histogram, Registry
+
+
+def test_metrics_store_renders_every_process(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    stores = []
+    for process in ("worker-1", "worker-2"):
+        registry = Registry()
+        counter = registry.register(Counter("requests_total", "Requests.", ["kind"]))
+        histogram = registry.register(
+            Histogram("latency_seconds", "Latency.", buckets=[1])
+        )
+        counter.inc(kind="a")
+        histogram.observe(0.5)
+        stores.append(MetricsStore(path, registry=registry, process=process))
+    stores[1].publish()
+
+    # どちらのプロセスが応答しても、両方のサンプルを返す
+    text = stores[0].render()
+
+    assert text.count("# TYPE requests_total counter") == 1
+    assert 'requests_total{process="worker-1",kind="a"} 1.0' in text
+    assert 'requests_total{process="worker-2",kind="a"} 1.0' in text
+    assert 'latency_seconds_bucket{process="worker-2",le="+Inf"} 1' in text
+    assert 'latency_seconds_count{process="worker-1"} 1' in text
@@ -0,0 +1,212 @@
+import asyncio
+import os
+import sys
+import time
+from http import HTTPStatus
+
+import httpx
+import pytest
+
+# プロジェクトの src ディレクトリをパスに追加
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+os.environ.setdefault("PROJECT_ID", "test-project")
+os.environ.setdefault("REGION", "us-central1")
+
+from services import misskey_service
+from services.discord_service import Message
+from services.misskey_service import (
+    MisskeyPostError,
+    MisskeyService,
+    SummaryResult,
+    last_contiguous_success,
+)
+from tests.fakes import FakeAIService
+
+
+def make_message(i: int, content: str | None = None) -> Message:
+    return Message(
+        id=i,
+        content=content or f"message {i}",
+        author_name="user",
+        author_id=1,
+        created_at="2025-01-01T00:00:00+00:00",
+    )
+
+
+def make_service(
+    ai_service: FakeAIService, concurrency: int = 4, streaming: bool = False
+):
+    service = MisskeyService(concurrency=concurrency, streaming=streaming)
+    service.ai_searvice = ai_service
+    posted: list[dict[str, str]] = []
+
+    async def fake_post(body: dict[str, str]) -> str:
+        posted.append({**body, "posted_at": time.perf_counter()})
+        return f"note-{len(posted)}"
+
+    service._post_to_misskey = fake_post
+    return service, posted
+
+
+def test_message_summaries_runs_generation_in_parallel():
+    service, posted = make_service(FakeAIService(parts=2, latency=0.1), concurrency=8)
+    messages = [make_message(i) for i in range(8)]
+
+    start = time.perf_counter()
+    results = asyncio.run(service.message_summaries(messages))
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.5  # noqa: PLR2004
+    assert [r.message_id for r in results] == list(range(8))
+    assert all(r.status == "success" for r in results)
+    # 投稿はメッセージ順に行われ、スレッドはリプライで繋がる
+    assert [p["text"] for p in posted[:4]] == [
+        "message 0-1",
+        "message 0-2",
+        "message 1-1",
+        "message 1-2",
+    ]
+    assert posted[1]["replyId"] == "note-1"
+
+
+def test_message_summaries_reports_failures_per_message():
+    service, posted = make_service(FakeAIService(parts=2, failing_prompts={"bad"}))
+    messages = [make_message(1), make_message(2, "bad"), make_message(3)]
+
+    results = asyncio.run(service.message_summaries(messages))
+
+    assert [r.status for r in results] == ["success", "failed", "success"]
+    assert results[1].error == "generation failed"
+    assert results[2].note_ids == ["note-3", "note-4"]
+    assert len(posted) == 4  # noqa: PLR2004
+
+
+def test_message_summaries_streaming_posts_while_generating():
+    service, posted = make_service(FakeAIService(parts=2, latency=0.2), streaming=True)
+    messages = [make_message(1), make_message(2)]
+
+    start = time.perf_counter()
+    results = asyncio.run(service.message_summaries(messages))
+
+    assert all(r.status == "success" for r in results)
+    assert [p["text"] for p in posted] == [
+        "message 1-1",
+        "message 1-2",
+        "message 2-1",
+        "message 2-2",
+    ]
+    assert posted[1]["replyId"] == "note-1"
+    # 最初のノートは生成の完了を待たずに投稿される
+    assert posted[0]["posted_at"] - start < 0.1  # noqa: PLR2004
+
+
+def test_message_summaries_streaming_reports_failure_mid_stream():
+    service, posted = make_service(
+        FakeAIService(parts=2, failing_prompts={"bad"}), streaming=True
+    )
+    messages = [make_message(1, "bad"), make_message(2)]
+
+    results = asyncio.run(service.message_summaries(messages))
+
+    assert [r.status for r in results] == ["failed", "success"]
+    assert results[0].error == "generation failed"
+    assert [p["text"] for p in posted] == ["bad-1", "message 2-1", "message 2-2"]
+
+
+def make_http_client(statuses: list[int], headers: dict[str, str] | None = None):
+    calls: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        status = statuses[min(len(calls) - 1, len(statuses) - 1)]
+        if status == HTTPStatus.OK:
+            return httpx.Response(status, json={"createdNote": {"id": "note-1"}})
+        return httpx.Response(status, headers=headers or {}, text="error")
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler)), calls
+
+
+def test_post_to_misskey_retries_rate_limit(monkeypatch):
+    monkeypatch.setattr(misskey_service, "MISSKEY_BACKOFF_SECONDS", 0)
+    http_client, calls = make_http_client(
+        [HTTPStatus.TOO_MANY_REQUESTS, HTTPStatus.TOO_MANY_REQUESTS, HTTPStatus.OK],
+        headers={"Retry-After": "0"},
+    )
+    service = MisskeyService(http_client=http_client)
+
+    note_id = asyncio.run(service._post_to_misskey({"text": "hello"}))
+
+    assert note_id == "note-1"
+    assert len(calls) == 3  # noqa: PLR2004
+    assert service.posted_count == 1
+    assert service.retried_count == 2  # noqa: PLR2004
+
+
+@pytest.mark.parametrize("status", [HTTPStatus.BAD_REQUEST, HTTPStatus.BAD_GATEWAY])
+def test_post_to_misskey_does_not_retry_errors_other_than_rate_limit(status):
+    # 5xx はノートが作成済みかもしれないため、再試行すると重複する
+    http_client, calls = make_http_client([status])
+    service = MisskeyService(http_client=http_client)
+
+    with pytest.raises(MisskeyPostError):
+        asyncio.run(service._post_to_misskey({"text": "hello"}))
+    assert len(calls) == 1
+    assert service.retried_count == 0
+
+
+def make_failing_http_client(errors: list[Exception]):
+    """errors を順に送出し、尽きたら 200 を返す"""
+    calls: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return httpx.Response(HTTPStatus.OK, json={"createdNote": {"id": "note-1"}})
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler)), calls
+
+
+def test_post_to_misskey_retries_errors_before_sending(monkeypatch):
+    monkeypatch.setattr(misskey_service, "MISSKEY_BACKOFF_SECONDS", 0)
+    http_client, calls = make_failing_http_client(
+        [httpx.ConnectError("refused"), httpx.PoolTimeout("busy")]
+    )
+    service = MisskeyService(http_client=http_client)
+
+    assert asyncio.run(service._post_to_misskey({"text": "hello"})) == "note-1"
+    assert len(calls) == 3  # noqa: PLR2004
+
+
+@pytest.mark.parametrize(
+    "error", [httpx.ReadTimeout("slow"), httpx.RemoteProtocolError("closed")]
+)
+def test_post_to_misskey_does_not_retry_errors_after_sending(error):
+    # 送信後のエラーはノートが作成済みかもしれないため、再試行すると重複する
+    http_client, calls = make_failing_http_client([error])
+    service = MisskeyService(http_client=http_client)
+
+    with pytest.raises(MisskeyPostError):
+        asyncio.run(service._post_to_misskey({"text": "hello"}))
+    assert len(calls) == 1
+    assert service.retried_count == 0
+
+
+def test_last_contiguous_success_stops_at_first_failure():
+    results = [
+        SummaryResult(message_id=1, status="success"),
+        SummaryResult(message_id=2, status="success"),
+        SummaryResult(message_id=3, status="failed"),
+        SummaryResult(message_id=4, status="success"),
+    ]
+
+    assert last_contiguous_success(results) == 2  # noqa: PLR2004
+    assert last_contiguous_success(results[2:]) is None
+
+
+def test_ai_service_client_is_created_lazily():
+    service = MisskeyService()
+
+    assert "client" not in vars(service.ai_searvice)
@@ -0,0 +1,91 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+# プロジェクトの src ディレクトリをパスに追加
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+
+from services.ai_service import AIService, ModelRouter
+from tests import fakes
+from utils.metrics import FALLBACKS
+
+FAST = "fast-model"
+PRO = "pro-model"
+
+
+class FakeModels(fakes.FakeModels):
+    """Fast モデルの回答だけグラウンディングに失敗させる"""
+
+    def __init__(self, fast_grounded: bool):
+        super().__init__()
+        self.fast_grounded = fast_grounded
+
+    async def respond(self, model: str, contents, config):
+        grounded = model == PRO or self.fast_grounded
+        return fakes.make_response(f"answer from {model}", grounded)
+
+    def called_models(self) -> list[str]:
+        return [call["model"] for call in self.calls]
+
+
+def make_service(fast_grounded: bool) -> tuple[AIService, FakeModels]:
+    router = ModelRouter(policy="adaptive", fast_model=FAST, pro_model=PRO)
+    service = AIService(router=router)
+    models = FakeModels(fast_grounded)
+    fakes.use_models(service, models)
+    return service, models
+
+
+def test_router_selects_model_by_prompt():
+    router = ModelRouter(
+        policy="adaptive", fast_model=FAST, pro_model=PRO, max_prompt_chars=50
+    )
+
+    assert router.select("こんにちは", "search") == FAST
+    assert router.select("https://example.com/a", "url") == FAST
+    assert router.select("https://example.com/a https://example.com/b", "url") == PRO
+    assert router.select("あ" * 51, "search") == PRO
+    assert ModelRouter(policy="pro", pro_model=PRO).select("hi", "search") == PRO
+
+
+def test_router_rejects_unknown_policy():
+    with pytest.raises(ValueError):
+        ModelRouter(policy="cheapest")
+
+
+def test_fast_model_serves_grounded_answer():
+    service, models = make_service(fast_grounded=True)
+
+    texts = asyncio.run(service.agenerate_content_if("こんにちは"))
+
+    assert texts == [f"answer from {FAST}\n\n**References**:\n- [t](u)"]
+    assert models.called_models() == [FAST]
+
+
+def test_escalates_to_pro_when_grounding_fails():
+    service, models = make_service(fast_grounded=False)
+    before = FALLBACKS.value(kind="fast_to_pro")
+
+    texts = asyncio.run(service.agenerate_content_if("https://example.com/a"))
+
+    assert texts[0].startswith(f"answer from {PRO}")
+    # url ツールのまま Pro に切り替え、検索へのフォールバックは行わない
+    assert models.called_models() == [FAST, PRO]
+    assert FALLBACKS.value(kind="fast_to_pro") == before + 1
+
+
+def test_streaming_escalates_before_posting():
+    service, models = make_service(fast_grounded=False)
+
+    async def collect() -> list[str]:
+        return [text async for text in service.astream_content_if("こんにちは")]
+
+    texts = asyncio.run(collect())
+
+    assert len(texts) == 1
+    assert texts[0].startswith(f"answer from {PRO}")
+    assert models.called_models() == [FAST, PRO]
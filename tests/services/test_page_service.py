@@ -0,0 +1,265 @@
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import httpcore
+import httpx
+import pytest
+
+# プロジェクトの src ディレクトリをパスに追加
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+
+from services import page_service
+from services.ai_service import AIService
+from services.page_service import (
+    PageService,
+    _PublicNetworkBackend,
+    create_page_client,
+)
+from services.page_store import CachedPage, ExtractedPage, PageStore
+from tests import fakes
+
+ARTICLE = "これは記事の本文です。" * 30
+HTML = f"""<!doctype html>
+<html>
+<head><title>記事のタイトル</title><script>var tracker = 1;</script></head>
+<body>
+<nav>ホーム / ニュース</nav>
+<article><h1>見出し</h1><p>{ARTICLE}</p></article>
+<footer>Copyright</footer>
+</body>
+</html>"""
+PDF = b"%PDF-1.7\n" + b"0" * 100
+
+
+def make_service(handler, tmp_path) -> tuple[PageService, PageStore]:
+    store = PageStore(str(tmp_path / "pages.sqlite3"))
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return PageService(client, store), store
+
+
+def test_extracts_main_text_from_html(tmp_path):
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            200, text=HTML, headers={"Content-Type": "text/html; charset=utf-8"}
+        )
+
+    service, _ = make_service(handler, tmp_path)
+    page = asyncio.run(service.fetch("https://example.com/article"))
+
+    assert page is not None
+    assert page.kind == "html"
+    assert page.title == "記事のタイトル"
+    assert page.text.startswith("見出し\n")
+    assert ARTICLE in page.text
+    assert "tracker" not in page.text
+    assert "ホーム" not in page.text
+    assert "Copyright" not in page.text
+
+
+def test_detects_pdf_by_magic_bytes(tmp_path):
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            200, content=PDF, headers={"Content-Type": "application/octet-stream"}
+        )
+
+    service, _ = make_service(handler, tmp_path)
+    page = asyncio.run(service.fetch("https://example.com/download?id=1"))
+
+    assert page is not None
+    assert page.kind == "pdf"
+    assert page.data == PDF
+
+
+def test_revalidates_cached_page_with_etag(tmp_path):
+    requests: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(
+            200, text=HTML, headers={"Content-Type": "text/html", "ETag": '"v1"'}
+        )
+
+    service, _ = make_service(handler, tmp_path)
+    first = asyncio.run(service.fetch("https://example.com/article"))
+    second = asyncio.run(service.fetch("https://example.com/article"))
+
+    assert second == first
+    assert "If-None-Match" not in requests[0].headers
+    assert requests[1].headers["If-None-Match"] == '"v1"'
+
+
+def test_returns_none_when_text_is_too_short(tmp_path):
+    def handler(request: httpx.Request) -> httpx.Response:
+        # JavaScript で描画するページは本文がほとんど取れない
+        return httpx.Response(
+            200,
+            text='<html><body><div id="root"></div></body></html>',
+            headers={"Content-Type": "text/html"},
+        )
+
+    service, store = make_service(handler, tmp_path)
+
+    assert asyncio.run(service.fetch("https://example.com/app")) is None
+    assert store.get("https://example.com/app") is None
+
+
+def test_refuses_private_addresses(tmp_path):
+    requests: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.url.host == "example.com":
+            return httpx.Response(302, headers={"Location": "http://127.0.0.1/admin"})
+        return httpx.Response(200, text=HTML, headers={"Content-Type": "text/html"})
+
+    service, _ = make_service(handler, tmp_path)
+
+    assert asyncio.run(service.fetch("https://192.168.0.1/")) is None
+    assert asyncio.run(service.fetch("https://example.com/redirect")) is None
+    # リダイレクト先の内部アドレスにはリクエストを送らない
+    assert [request.url.host for request in requests] == ["example.com"]
+
+
+def test_invalid_urls_are_not_fetched(tmp_path):
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise AssertionError("should not be requested")
+
+    service, _ = make_service(handler, tmp_path)
+
+    # URL_PATTERN には一致するが、URL として解釈できない
+    assert asyncio.run(service.fetch("https://[oops")) is None
+
+
+class FakeBackend(httpcore.AsyncNetworkBackend):
+    def __init__(self):
+        self.connected: list[str] = []
+
+    async def connect_tcp(self, host, port, *args):
+        self.connected.append(host)
+        return SimpleNamespace()
+
+
+def resolve_to(monkeypatch, *addresses: str) -> None:
+    async def fake_resolve(host: str, port: int) -> list[str]:
+        return list(addresses)
+
+    monkeypatch.setattr(page_service, "_resolve", fake_resolve)
+
+
+@pytest.mark.parametrize(
+    "addresses",
+    [("127.0.0.1",), ("169.254.169.254",), ("93.184.215.14", "10.0.0.1")],
+)
+def test_refuses_hostnames_resolving_to_private_addresses(monkeypatch, addresses):
+    # metadata.google.internal や *.nip.io のように、名前で内部アドレスを指す場合
+    resolve_to(monkeypatch, *addresses)
+    fake = FakeBackend()
+    backend = _PublicNetworkBackend(fake)
+
+    with pytest.raises(httpcore.ConnectError):
+        asyncio.run(backend.connect_tcp("internal.example", 443))
+    assert fake.connected == []
+
+
+def test_page_client_does_not_connect_to_private_addresses(monkeypatch, tmp_path):
+    resolve_to(monkeypatch, "127.0.0.1")
+    service = PageService(create_page_client(), PageStore(str(tmp_path / "p.db")))
+
+    assert asyncio.run(service.fetch("http://127.0.0.1.nip.io/admin")) is None
+
+
+def test_page_client_connects_through_the_guarded_backend(monkeypatch, tmp_path):
+    class UnreachableBackend(FakeBackend):
+        async def connect_tcp(self, host, port, *args):
+            await super().connect_tcp(host, port, *args)
+            raise httpcore.ConnectError("unreachable")
+
+    resolve_to(monkeypatch, "93.184.215.14")
+    fake = UnreachableBackend()
+    service = PageService(create_page_client(fake), PageStore(str(tmp_path / "p.db")))
+
+    assert asyncio.run(service.fetch("https://example.com/article")) is None
+
+    # クライアントの接続は、名前解決して確認したアドレスへの接続だけになる
+    assert fake.connected == ["93.184.215.14"]
+
+
+def test_connects_to_the_checked_address(monkeypatch):
+    resolve_to(monkeypatch, "93.184.215.14")
+    fake = FakeBackend()
+    backend = _PublicNetworkBackend(fake)
+
+    asyncio.run(backend.connect_tcp("example.com", 443))
+
+    # 名前を解決し直さず、確認したアドレスに接続する
+    assert fake.connected == ["93.184.215.14"]
+
+
+def test_page_store_evicts_expired_and_oversized_pages(tmp_path):
+    store = PageStore(str(tmp_path / "pages.sqlite3"), ttl_seconds=60, max_bytes=250)
+
+    def save(url: str, size: int) -> None:
+        page = ExtractedPage(url=url, kind="pdf", data=b"0" * size)
+        store.save(CachedPage(page=page))
+
+    save("https://example.com/a", 100)
+    save("https://example.com/b", 100)
+    save("https://example.com/c", 100)
+
+    # 合計の上限を超えた古いページから削除する
+    assert store.get("https://example.com/a") is None
+    assert store.get("https://example.com/c") is not None
+
+    store.ttl_seconds = -1
+    assert store.get("https://example.com/c") is None
+
+
+class FakePageService:
+    def __init__(self, page: ExtractedPage | None):
+        self.page = page
+
+    async def fetch(self, url: str) -> ExtractedPage | None:
+        return self.page
+
+
+def make_ai_service(
+    page: ExtractedPage | None,
+) -> tuple[AIService, fakes.FakeModels]:
+    service = AIService(page_service=FakePageService(page), hedging=False)
+    models = fakes.FakeModels()
+    fakes.use_models(service, models)
+    return service, models
+
+
+def test_summarizes_prefetched_page_without_url_tool():
+    page = ExtractedPage(
+        url="https://example.com/article", kind="html", title="記事", text=ARTICLE
+    )
+    service, models = make_ai_service(page)
+
+    texts = asyncio.run(service.agenerate_content_if("https://example.com/article"))
+
+    # グラウンディングが無くても、取得したページを参考文献として添える
+    assert texts == [
+        "要約です\n\n**References**:\n- [記事](https://example.com/article)"
+    ]
+    contents = models.calls[0]["contents"]
+    assert contents[0].text == "https://example.com/article"
+    assert ARTICLE in contents[1].text
+    tools = models.calls[0]["config"].tools
+    assert all(tool.url_context is None for tool in tools)
+
+
+def test_falls_back_to_url_tool_when_prefetch_fails():
+    service, models = make_ai_service(None)
+    # URL ツールの回答はグラウンディングが無いため、検索にフォールバックする
+    texts = asyncio.run(service.agenerate_content_if("https://example.com/article"))
+
+    assert texts == ["要約です"]
+    assert all(isinstance(call["contents"], str) for call in models.calls)
@@ -0,0 +1,163 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+# プロジェクトの src ディレクトリをパスに追加
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+os.environ.setdefault("PROJECT_ID", "test-project")
+os.environ.setdefault("REGION", "us-central1")
+
+from services.discord_service import Message
+from services.misskey_service import MisskeyPostError, MisskeyService
+from services.post_ledger import PostLedger
+from tests.fakes import FakeAIService
+
+
+def make_service(fail_at: int | None = None, streaming: bool = False):
+    """fail_at 回目の投稿だけ失敗する MisskeyService"""
+    ai_service = FakeAIService(parts=3)
+    service = MisskeyService(
+        ai_service=ai_service, streaming=streaming, ledger=PostLedger(":memory:")
+    )
+    posted: list[dict[str, str]] = []
+    attempts = 0
+
+    async def fake_post(body: dict[str, str]) -> str:
+        nonlocal attempts
+        attempts += 1
+        if attempts == fail_at:
+            raise MisskeyPostError("unavailable")
+        posted.append(dict(body))
+        return f"note-{len(posted)}"
+
+    service._post_to_misskey = fake_post
+    return service, ai_service, posted
+
+
+def test_ledger_keeps_posted_segments():
+    ledger = PostLedger(":memory:")
+    ledger.record_texts("k", ["a", "b", "c"], complete=True)
+    ledger.record_note("k", 0, "note-1")
+
+    # 作り直した要約でも、投稿済みのテキストは書き換えず、未投稿の残りは捨てる
+    ledger.record_texts("k", ["x", "y"], complete=True)
+
+    entry = ledger.get("k")
+    assert entry is not None
+    assert entry.texts == ["a", "y"]
+    assert entry.note_ids == ["note-1"]
+    assert entry.complete
+    assert ledger.get("missing") is None
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_message_summary_resumes_from_first_unposted_segment(streaming):
+    service, ai_service, posted = make_service(fail_at=2, streaming=streaming)
+
+    with pytest.raises(MisskeyPostError):
+        asyncio.run(service.message_summary("https://example.com", key="rss:a"))
+    note_ids = asyncio.run(service.message_summary("https://example.com", key="rss:a"))
+
+    assert note_ids == ["note-1", "note-2", "note-3"]
+    assert [body["text"] for body in posted] == [
+        "https://example.com-1",
+        "https://example.com-2",
+        "https://example.com-3",
+    ]
+    # 続きは最後に投稿したノートへのリプライになる
+    assert posted[1]["replyId"] == "note-1"
+    # 投稿に失敗しても生成は最後まで記録しているため、生成し直さない
+    assert ai_service.prompts == ["https://example.com"]
+
+
+def test_interrupted_generation_is_posted_as_a_new_thread():
+    service, ai_service, posted = make_service(streaming=True)
+    ai_service.stream_failures = 1
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(service.message_summary("https://example.com", key="rss:a"))
+    note_ids = asyncio.run(service.message_summary("https://example.com", key="rss:a"))
+
+    # 生成し直した要約を前回のスレッドに続けず、最初から新しいスレッドとして投稿する
+    assert note_ids == ["note-2", "note-3", "note-4"]
+    assert "replyId" not in posted[1]
+    assert [body["text"] for body in posted[1:]] == [
+        "https://example.com-1",
+        "https://example.com-2",
+        "https://example.com-3",
+    ]
+
+
+def make_message(message_id: int, content: str) -> Message:
+    return Message(
+        id=message_id,
+        content=content,
+        author_name="user",
+        author_id=1,
+        created_at="2025-01-01T00:00:00+00:00",
+    )
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_message_summaries_do_not_regenerate_or_repost_finished_work(streaming):
+    service, ai_service, posted = make_service(fail_at=4, streaming=streaming)
+    messages = [make_message(i, f"message {i}") for i in (1, 2)]
+
+    first = asyncio.run(service.message_summaries(messages))
+    second = asyncio.run(service.message_summaries(messages))
+
+    assert [r.status for r in first] == ["success", "failed"]
+    assert [r.status for r in second] == ["success", "success"]
+    assert second[0].note_ids == first[0].note_ids
+    assert second[1].note_ids == ["note-4", "note-5", "note-6"]
+    assert ai_service.prompts == ["message 1", "message 2"]
+    assert [body["text"] for body in posted] == [
+        f"message {i}-{j}" for i in (1, 2) for j in (1, 2, 3)
+    ]
+    assert "replyId" not in posted[3]
+
+
+def test_digest_rerun_after_partial_failure_does_not_repost_chatter():
+    service, ai_service, posted = make_service()
+    url = "https://example.com/two"
+    ai_service.failing_prompts.add(url)
+    messages = {
+        1: make_message(1, "chat one"),
+        2: make_message(2, url),
+        3: make_message(3, "chat three"),
+        4: make_message(4, "chat four"),
+        5: make_message(5, "chat five"),
+    }
+
+    first = asyncio.run(
+        service.message_summaries([messages[i] for i in (1, 2, 3, 4)], digest=True)
+    )
+    ai_service.failing_prompts.clear()
+    ai_service.prompts.clear()
+    # カーソルは失敗した URL の手前で止まるため、2 から読み直す
+    second = asyncio.run(
+        service.message_summaries([messages[i] for i in (2, 3, 4, 5)], digest=True)
+    )
+
+    assert [r.status for r in first] == ["success", "failed", "success", "success"]
+    assert [r.status for r in second] == ["success"] * 4
+    # 投稿済みの 3, 4 のダイジェストはまとめ直さず、残りの 5 だけを新しく要約する
+    assert ai_service.prompts == [url, "chat five"]
+    assert second[1].note_ids == first[2].note_ids
+    assert sum("chat four" in body["text"] for body in posted) == len(first[2].note_ids)
+
+
+def test_digest_skips_message_posted_by_live_summary():
+    service, ai_service, posted = make_service()
+    messages = [make_message(1, "chat one"), make_message(2, "chat two")]
+
+    live = asyncio.run(service.message_summaries(messages[:1]))
+    polled = asyncio.run(service.message_summaries(messages, digest=True))
+
+    assert ai_service.prompts == ["chat one", "chat two"]
+    assert polled[0].note_ids == live[0].note_ids
+    assert len(posted) == len(live[0].note_ids) + len(polled[1].note_ids)
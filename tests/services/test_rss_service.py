@@ -0,0 +1,110 @@
+import asyncio
+import os
+import sys
+from http import HTTPStatus
+
+import httpx
+
+# プロジェクトの src ディレクトリをパスに追加
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+
+from services.rss_service import RSSService
+from services.rss_store import RSSStore
+
+FEED = """<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>feed</title>
+<item><title>a</title><link>https://example.com/a</link><guid>a</guid></item>
+<item><title>b</title><link>https://example.com/b</link><guid>b</guid></item>
+</channel></rss>"""
+
+
+def make_service(handler) -> RSSService:
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    service = RSSService(http_client=http_client, store=RSSStore(path=":memory:"))
+    service.rss_urls = ["https://feed.example.com/ok.rss"]
+    return service
+
+
+def test_rss_service_uses_conditional_get():
+    requests: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(HTTPStatus.NOT_MODIFIED)
+        return httpx.Response(HTTPStatus.OK, text=FEED, headers={"ETag": '"v1"'})
+
+    service = make_service(handler)
+
+    first = asyncio.run(service.get_rss_feed_urls())
+    second = asyncio.run(service.get_rss_feed_urls())
+
+    assert first == ["https://example.com/a", "https://example.com/b"]
+    assert second == first
+    assert "If-None-Match" not in requests[0].headers
+    assert requests[1].headers["If-None-Match"] == '"v1"'
+
+
+def test_rss_service_follows_redirected_feed():
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/ok.rss":
+            return httpx.Response(
+                HTTPStatus.MOVED_PERMANENTLY,
+                headers={"Location": "https://feed.example.com/moved.rss"},
+            )
+        return httpx.Response(HTTPStatus.OK, text=FEED)
+
+    service = make_service(handler)
+
+    urls = asyncio.run(service.get_rss_feed_urls())
+
+    assert urls == ["https://example.com/a", "https://example.com/b"]
+
+
+def test_rss_service_degrades_dead_feed_only():
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/dead.rss":
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(HTTPStatus.OK, text=FEED)
+
+    service = make_service(handler)
+    service.rss_urls.append("https://feed.example.com/dead.rss")
+
+    urls = asyncio.run(service.get_rss_feed_urls())
+
+    assert urls == ["https://example.com/a", "https://example.com/b"]
+
+
+def test_rss_service_returns_only_new_entries():
+    feeds = {"/ok.rss": FEED}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(HTTPStatus.OK, text=feeds[request.url.path])
+
+    service = make_service(handler)
+
+    first = asyncio.run(service.get_rss_feed_urls(only_new=True))
+    feeds["/ok.rss"] = FEED.replace(
+        "</channel>",
+        "<item><title>c</title><link>https://example.com/c</link></item>"
+        "<item><title>a</title><link>https://EXAMPLE.com/a?utm_source=rss</link>"
+        "</item></channel>",
+    )
+    second = asyncio.run(service.get_rss_feed_urls(only_new=True))
+
+    assert first == ["https://example.com/a", "https://example.com/b"]
+    assert second == ["https://example.com/c"]
+
+
+def test_rss_service_merges_overlapping_feeds():
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(HTTPStatus.OK, text=FEED)
+
+    service = make_service(handler)
+    service.rss_urls.append("https://feed.example.com/other.rss")
+
+    urls = asyncio.run(service.get_rss_feed_urls())
+
+    assert urls == ["https://example.com/a", "https://example.com/b"]
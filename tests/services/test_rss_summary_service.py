@@ -0,0 +1,103 @@
+import asyncio
+import os
+import sys
+from http import HTTPStatus
+
+import httpx
+
+# プロジェクトの src ディレクトリをパスに追加
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+os.environ.setdefault("PROJECT_ID", "test-project")
+os.environ.setdefault("REGION", "us-central1")
+
+from services import ai_service
+from services.rss_service import RSSService
+from services.rss_store import RSSStore
+from services.rss_summary_service import RSSSummaryService
+
+FEED = """<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>feed</title>
+<item><link>https://example.com/a</link></item>
+<item><link>https://example.com/b</link></item>
+<item><link>https://example.com/c</link></item>
+</channel></rss>"""
+
+
+class FakeMisskeyService:
+    def __init__(self, fail_on: str | None = None, tokens: int = 100):
+        self.fail_on = fail_on
+        self.tokens = tokens
+        self.summarized: list[str] = []
+
+    async def message_summary(self, message: str, key: str | None = None) -> list[str]:
+        await asyncio.sleep(0)
+        if usage := ai_service._token_usage.get():
+            usage.total_tokens += self.tokens
+        if message == self.fail_on:
+            raise ValueError("generation failed")
+        self.summarized.append(message)
+        return [f"note-{message}"]
+
+
+def make_service(misskey_service: FakeMisskeyService, concurrency: int = 1):
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(HTTPStatus.OK, text=FEED)
+
+    rss_service = RSSService(
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        store=RSSStore(path=":memory:"),
+    )
+    rss_service.rss_urls = ["https://feed.example.com/it.rss"]
+    return RSSSummaryService(rss_service, misskey_service, concurrency=concurrency)
+
+
+def test_summarize_new_entries_skips_already_summarized():
+    misskey_service = FakeMisskeyService(fail_on="https://example.com/b")
+    service = make_service(misskey_service, concurrency=3)
+
+    first = asyncio.run(service.summarize_new_entries(max_items=10))
+    misskey_service.fail_on = None
+    second = asyncio.run(service.summarize_new_entries(max_items=10))
+
+    assert [r.status for r in first] == ["success", "failed", "success"]
+    assert first[0].tokens == 100  # noqa: PLR2004
+    assert [r.link for r in second] == ["https://example.com/b"]
+    assert second[0].status == "success"
+
+
+def test_summarize_new_entries_respects_budget():
+    misskey_service = FakeMisskeyService(tokens=100)
+    service = make_service(misskey_service)
+
+    results = asyncio.run(service.summarize_new_entries(max_items=2, max_tokens=50))
+
+    assert [r.status for r in results] == ["success", "skipped"]
+    assert misskey_service.summarized == ["https://example.com/a"]
+
+
+class FakeBatchService:
+    def __init__(self):
+        self.prompts: list[str] = []
+
+    def should_batch(self, count: int) -> bool:
+        return count >= 2  # noqa: PLR2004
+
+    async def summarize(self, prompts: list[str]):
+        self.prompts.extend(prompts)
+        raise AssertionError("batch should not be used")
+
+
+def test_summarize_new_entries_online_when_batch_is_not_allowed():
+    misskey_service = FakeMisskeyService()
+    service = make_service(misskey_service)
+    service.batch_service = FakeBatchService()
+
+    pending = asyncio.run(service.pending_entries(max_items=10))
+    # 溜まっているためバッチ予測の対象だが、ジョブ以外ではオンラインで要約する
+    assert service.should_batch(len(pending))
+    results = asyncio.run(service.summarize_new_entries(allow_batch=False))
+
+    assert [r.status for r in results] == ["success"] * len(pending)
+    assert service.batch_service.prompts == []
@@ -0,0 +1,144 @@
+import asyncio
+import os
+import sys
+import time
+from datetime import UTC, datetime
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import discord
+
+# プロジェクトの src ディレクトリをパスに追加
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+os.environ.setdefault("PROJECT_ID", "test-project")
+os.environ.setdefault("REGION", "us-central1")
+
+from services import summary_service
+from services.cursor_store import CursorStore
+from services.discord_service import ChannelConfig, DiscordService
+from services.job_service import JobProgress
+from services.misskey_service import MisskeyService
+from services.summary_service import summarize_channel, summarize_channels
+from tests.fakes import FakeAIService
+
+HISTORY_LATENCY = 0.1
+
+
+def make_channel(channel_id: int, message_ids: list[int]):
+    async def history(**kwargs):
+        # 履歴の取得 (REST API) に時間がかかるチャンネル
+        await asyncio.sleep(HISTORY_LATENCY)
+        for message_id in message_ids:
+            yield SimpleNamespace(
+                id=message_id,
+                content=f"message {message_id}",
+                author=SimpleNamespace(name="user", id=1),
+                created_at=datetime(2025, 1, 1, tzinfo=UTC),
+            )
+
+    channel = MagicMock(spec=discord.TextChannel)
+    channel.name = f"channel-{channel_id}"
+    channel.history = history
+    return channel
+
+
+def make_services(channels: dict[int, MagicMock], rest_concurrency: int):
+    discord_client = MagicMock()
+    discord_client.is_closed.return_value = False
+    discord_client.get_channel.side_effect = channels.get
+    discord_service = DiscordService()
+    discord_service.discord_client = discord_client
+    discord_service.cursor_store = CursorStore(path=":memory:")
+    discord_service.rest_semaphore = asyncio.Semaphore(rest_concurrency)
+    for channel_id in channels:
+        discord_service.cursor_store.advance(channel_id, 0)
+
+    misskey_service = MisskeyService(ai_service=FakeAIService())
+    posted: list[dict[str, str]] = []
+
+    async def fake_post(body: dict[str, str]) -> str:
+        posted.append(dict(body))
+        return f"note-{len(posted)}"
+
+    misskey_service._post_to_misskey = fake_post
+    return discord_service, misskey_service, posted
+
+
+def run_channels(rest_concurrency: int, reports: list[JobProgress] | None = None):
+    configs = [
+        ChannelConfig(channel_id=1, visibility="public"),
+        ChannelConfig(channel_id=2, visibility="home"),
+        ChannelConfig(channel_id=3, visibility="followers"),
+    ]
+    channels = {1: make_channel(1, [11, 12]), 2: make_channel(2, [21]), 3: None}
+
+    async def run():
+        discord_service, misskey_service, posted = make_services(
+            channels, rest_concurrency
+        )
+        start = time.perf_counter()
+        results = await summarize_channels(
+            discord_service,
+            misskey_service,
+            configs,
+            report=reports.append if reports is not None else None,
+        )
+        return results, posted, time.perf_counter() - start, discord_service
+
+    return asyncio.run(run())
+
+
+def test_summarize_channels_posts_with_channel_visibility():
+    reports: list[JobProgress] = []
+
+    results, posted, _, discord_service = run_channels(4, reports)
+
+    assert [r.channel_id for r in results] == [1, 2, 3]
+    assert [r.status for r in results] == ["success", "success", "failed"]
+    assert [m.message_id for m in results[0].results] == [11, 12]
+    visibilities = {note["text"]: note["visibility"] for note in posted}
+    assert visibilities == {
+        "message 11-1": "public",
+        "message 12-1": "public",
+        "message 21-1": "home",
+    }
+    assert discord_service.cursor_store.get(1) == 12  # noqa: PLR2004
+    assert discord_service.cursor_store.get(2) == 21  # noqa: PLR2004
+    # 進捗は全チャンネルの合計
+    assert reports[-1] == JobProgress(total=3, done=3, failed=0)
+
+
+def test_summarize_channels_fetches_history_concurrently():
+    _, _, concurrent, _ = run_channels(4)
+    _, _, serial, _ = run_channels(1)
+
+    assert concurrent < HISTORY_LATENCY * 1.8
+    assert serial >= HISTORY_LATENCY * 2
+
+
+def test_message_that_keeps_failing_is_skipped(monkeypatch):
+    """失敗し続けるメッセージで、カーソルが止まり続けない"""
+
+    monkeypatch.setattr(summary_service, "MESSAGE_MAX_ATTEMPTS", 2)
+
+    async def run():
+        discord_service, misskey_service, posted = make_services(
+            {1: make_channel(1, [11, 12])}, rest_concurrency=1
+        )
+        misskey_service.ai_searvice = FakeAIService(failing_prompts={"message 11"})
+        statuses: list[list[str]] = []
+        cursors: list[int | None] = []
+        for _ in range(2):
+            results = await summarize_channel(discord_service, misskey_service, 1)
+            statuses.append([r.status for r in results])
+            cursors.append(discord_service.cursor_store.get(1))
+        return statuses, cursors, posted
+
+    statuses, cursors, posted = asyncio.run(run())
+
+    assert statuses == [["failed", "success"], ["skipped", "success"]]
+    # 1回目はメッセージ 11 で止まり、上限に達した2回目で飛ばして進める
+    assert cursors == [0, 12]
+    assert {note["text"] for note in posted} == {"message 12-1"}
@@ -0,0 +1,105 @@
+import asyncio
+import os
+import sys
+import time
+
+# プロジェクトの src ディレクトリをパスに追加
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+
+from services.ai_service import AIService, ModelRouter
+from services.domain_store import DomainFailureStore
+from tests import fakes
+
+PROMPT = "https://paywall.example.com/article"
+
+
+class FakeModels(fakes.FakeModels):
+    """url ツールはグラウンディングに失敗させる (url_ok の場合は成功させる)"""
+
+    def __init__(self, latency: float, url_ok: bool):
+        super().__init__()
+        self.latency = latency
+        self.url_ok = url_ok
+        self.tools: list[str] = []
+        self.cancelled: list[str] = []
+
+    async def respond(self, model: str, contents, config):
+        tool = "url" if config.tools[0].url_context is not None else "search"
+        self.tools.append(tool)
+        try:
+            await asyncio.sleep(self.latency)
+        except asyncio.CancelledError:
+            self.cancelled.append(tool)
+            raise
+        return fakes.make_response(
+            f"{tool} answer", grounded=tool == "search" or self.url_ok, title=tool
+        )
+
+
+def make_service(
+    url_ok: bool, hedging: bool = True, latency: float = 0.1
+) -> tuple[AIService, FakeModels]:
+    service = AIService(
+        router=ModelRouter(policy="pro"),
+        domain_store=DomainFailureStore(path=":memory:", threshold=2),
+        hedging=hedging,
+    )
+    models = FakeModels(latency, url_ok)
+    fakes.use_models(service, models)
+    return service, models
+
+
+def test_hedged_failure_costs_one_latency():
+    service, models = make_service(url_ok=False, latency=0.2)
+
+    start = time.perf_counter()
+    texts = asyncio.run(service.agenerate_content_if(PROMPT))
+    elapsed = time.perf_counter() - start
+
+    assert texts[0].startswith("search answer")
+    assert sorted(models.tools) == ["search", "url"]
+    # 逐次にフォールバックすると 0.4 秒かかる
+    assert elapsed < 0.35  # noqa: PLR2004
+
+
+def test_hedged_success_cancels_search():
+    service, models = make_service(url_ok=True)
+    models.latency = 0.05
+
+    async def run():
+        texts = await service.agenerate_content_if(PROMPT)
+        await asyncio.sleep(0)
+        return texts
+
+    texts = asyncio.run(run())
+
+    assert texts[0].startswith("url answer")
+    assert models.cancelled == ["search"]
+
+
+def test_known_bad_domain_goes_straight_to_search():
+    service, models = make_service(url_ok=False, hedging=False, latency=0)
+
+    for _ in range(2):
+        asyncio.run(service.agenerate_content_if(PROMPT))
+    assert models.tools == ["url", "search", "url", "search"]
+    models.tools.clear()
+
+    texts = asyncio.run(service.agenerate_content_if(PROMPT))
+
+    assert texts[0].startswith("search answer")
+    assert models.tools == ["search"]
+
+
+def test_hedged_streaming_falls_back_to_search_result():
+    service, models = make_service(url_ok=False, latency=0.05)
+
+    async def collect() -> list[str]:
+        return [text async for text in service.astream_content_if(PROMPT)]
+
+    texts = asyncio.run(collect())
+
+    assert texts[0].startswith("search answer")
+    assert sorted(models.tools) == ["search", "url"]
@@ -0,0 +1,51 @@
+import asyncio
+import os
+import sys
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from benchmarks.bench_summary import run_once
+
+
+def test_benchmark_summary_flow_runs_offline():
+    stats = asyncio.run(
+        run_once(10, gemini_latency=0.01, misskey_latency=0.0, concurrency=4)
+    )
+
+    assert stats["succeeded"] == 10  # noqa: PLR2004
+    assert stats["notes"] == 10  # noqa: PLR2004
+    assert stats["messages_per_second"] > 0
+    assert stats["p50_completion_seconds"] <= stats["p95_completion_seconds"]
+    assert stats["peak_memory_mib"] > 0
+
+
+def test_benchmark_summary_flow_streaming_posts_same_notes():
+    stats = asyncio.run(
+        run_once(
+            4,
+            gemini_latency=0.01,
+            misskey_latency=0.0,
+            concurrency=4,
+            streaming=True,
+            output_chars=8000,
+        )
+    )
+
+    assert stats["succeeded"] == 4  # noqa: PLR2004
+    # 8000文字の要約は3件に分割して投稿される
+    assert stats["notes"] == 12  # noqa: PLR2004
+    assert stats["first_post_seconds"] <= stats["p50_completion_seconds"]
+
+
+def test_benchmark_summary_flow_digest_reduces_calls():
+    stats = asyncio.run(
+        run_once(
+            10, gemini_latency=0.01, misskey_latency=0.0, concurrency=4, digest=True
+        )
+    )
+
+    assert stats["succeeded"] == 10  # noqa: PLR2004
+    # URL の3件 (1, 5, 9) は1件ずつ、間の雑談 (2-4, 6-8, 10) はまとめて要約する
+    assert stats["gemini_calls"] == 6  # noqa: PLR2004
+    assert stats["notes"] == 6  # noqa: PLR2004
@@ -0,0 +1,44 @@
+import json
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../src"))
+# 起動時に読み込まれてはいけない重いモジュール
+HEAVY_MODULES = ["langchain_community", "vertexai", "numpy", "google.cloud.storage"]
+
+SCRIPT = """
+import json
+import sys
+import time
+
+start = time.perf_counter()
+import main
+
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "elapsed": elapsed,
+    "loaded": [name for name in %r if name in sys.modules],
+}))
+"""
+
+
+def measure_startup() -> dict:
+    env = {**os.environ, "PROJECT_ID": "test-project", "REGION": "us-central1"}
+    completed = subprocess.run(  # noqa: S603
+        [sys.executable, "-c", SCRIPT % HEAVY_MODULES],
+        cwd=SRC_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def test_startup_does_not_import_heavy_modules():
+    """コールドスタートの時間は実行環境で変わるため、読み込むモジュールで確認する"""
+    result = measure_startup()
+    print(f"main の import にかかった時間: {result['elapsed']:.3f}秒")
+
+    assert result["loaded"] == []
@@ -0,0 +1,45 @@
+import os
+import sys
+
+import pytest
+
+# プロジェクトの src ディレクトリをパスに追加
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+
+from utils.metrics import STAGE_DURATION, Counter, Histogram, Registry
+from utils.telemetry import span
+
+
+class TestRegistry:
+    def test_render_counter_and_histogram(self):
+        registry = Registry()
+        counter = registry.register(Counter("requests_total", "Requests.", ["kind"]))
+        histogram = registry.register(
+            Histogram("latency_seconds", "Latency.", ["stage"], buckets=[0.1, 1])
+        )
+        counter.inc(kind="a")
+        counter.inc(2, kind="a")
+        histogram.observe(0.5, stage="post")
+
+        text = registry.render()
+
+        assert "# TYPE requests_total counter" in text
+        assert 'requests_total{kind="a"} 3.0' in text
+        assert 'latency_seconds_bucket{stage="post",le="0.1"} 0' in text
+        assert 'latency_seconds_bucket{stage="post",le="1.0"} 1' in text
+        assert 'latency_seconds_bucket{stage="post",le="+Inf"} 1' in text
+        assert 'latency_seconds_count{stage="post"} 1' in text
+
+    def test_labels_must_match(self):
+        counter = Counter("requests_total", "Requests.", ["kind"])
+        with pytest.raises(ValueError):
+            counter.inc(other="a")
+
+    def test_span_records_stage_duration(self):
+        before = STAGE_DURATION.count(stage="test_stage", status="error")
+        with pytest.raises(RuntimeError), span("test_stage"):
+            raise RuntimeError("boom")
+
+        assert STAGE_DURATION.count(stage="test_stage", status="error") == before + 1
@@ -0,0 +1,128 @@
+import os
+import sys
+
+from hypothesis import given, settings
+from hypothesis import strategies as st
+
+# プロジェクトの src ディレクトリをパスに追加
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+)
+
+from utils.text_splitter import NoteSplitter, misskey_length, split_note
+
+MAX_LENGTH = 200
+# URL やリンク 1つが、投稿の後半に収まらない長さ
+SMALL_MAX_LENGTH = 40
+
+words = st.text(
+    alphabet=st.characters(codec="utf-8", exclude_characters="\n\r[]()*<>"),
+    min_size=1,
+    max_size=30,
+)
+urls = st.builds(
+    lambda path: f"https://example.com/{path}",
+    st.text(alphabet="abcdefghij0123456789/-_", max_size=40),
+)
+links = st.builds(
+    lambda title, url: f"[{title}]({url})", st.text("abcあいう", max_size=10), urls
+)
+bolds = st.builds(lambda text: f"**{text}**", words)
+separators = st.sampled_from([" ", " ", "。", ". ", "\n", "\n\n"])
+markup = st.sampled_from(["[", "]", "(", ")", "*", "**"])
+texts = st.lists(st.one_of(words, urls, links, separators), max_size=80).map("".join)
+marked_texts = st.lists(
+    st.one_of(words, urls, links, bolds, separators, markup), max_size=80
+).map("".join)
+references = st.lists(urls, max_size=5)
+long_urls = st.builds(
+    lambda path: f"https://example.com/{path}",
+    st.text(alphabet="abcdefghij0123456789/-_", min_size=10, max_size=80),
+)
+long_links = st.builds(
+    lambda title, url: f"[{title}]({url})", st.text("abcあいう", max_size=10), long_urls
+)
+
+
+def _compact(text: str) -> str:
+    return "".join(text.split())
+
+
+@settings(max_examples=200, deadline=None)
+@given(texts, references)
+def test_notes_fit_and_keep_content(text, refs):
+    notes = split_note(text, refs, MAX_LENGTH)
+
+    assert all(0 < misskey_length(note) <= MAX_LENGTH for note in notes)
+    expected = text + (
+        "\n\n**References**:" + "".join(f"\n{r}" for r in refs) if refs else ""
+    )
+    assert _compact("".join(notes)) == _compact(expected)
+
+
+@settings(max_examples=300, deadline=None)
+@given(
+    st.lists(st.one_of(words, long_urls, long_links, separators), max_size=40).map(
+        "".join
+    ),
+    st.lists(long_urls, max_size=3),
+)
+def test_long_urls_fit_small_notes(text, refs):
+    notes = split_note(text, refs, SMALL_MAX_LENGTH)
+
+    assert all(0 < misskey_length(note) <= SMALL_MAX_LENGTH for note in notes)
+
+
+def test_flushes_until_a_long_url_fits():
+    text = "a" * 50 + "\n\n" + "bbbbbbbbb " * 4 + "https://example.com/" + "x" * 70
+    notes = split_note(text, max_length=100)
+
+    assert all(misskey_length(note) <= 100 for note in notes)  # noqa: PLR2004
+    assert notes[-1] == "https://example.com/" + "x" * 70
+
+
+@settings(max_examples=200, deadline=None)
+@given(st.lists(st.one_of(words, urls, separators), max_size=80).map("".join))
+def test_urls_are_not_split(text):
+    notes = split_note(text, max_length=MAX_LENGTH)
+
+    # 1つで上限の長さを超える URL だけは文字単位で分割される
+    for url in text.split():
+        if url.startswith("https://") and misskey_length(url) <= MAX_LENGTH:
+            assert any(url in note for note in notes)
+
+
+@settings(max_examples=100, deadline=None)
+@given(marked_texts, st.lists(st.integers(min_value=1, max_value=50), max_size=20))
+def test_chunked_feed_matches_one_shot(text, sizes):
+    splitter = NoteSplitter(MAX_LENGTH)
+    notes: list[str] = []
+    position = 0
+    for size in sizes:
+        notes.extend(splitter.feed(text[position : position + size]))
+        position += size
+    notes.extend(splitter.feed(text[position:]))
+    notes.extend(splitter.finish())
+
+    assert notes == split_note(text, max_length=MAX_LENGTH)
+
+
+def test_short_text_with_references_is_single_note():
+    notes = split_note("要約です。", ["https://example.com/a"], MAX_LENGTH)
+
+    assert notes == ["要約です。\n\n**References**:\nhttps://example.com/a"]
+
+
+def test_prefers_paragraph_boundary():
+    first = "あ" * 120 + "。"
+    second = "い" * 120 + "。"
+    notes = split_note(f"{first}\n\n{second}", max_length=MAX_LENGTH)
+
+    assert notes == [first, second]
+
+
+def test_counts_surrogate_pairs_as_two():
+    assert misskey_length("😀a") == 3  # noqa: PLR2004
+    notes = split_note("😀" * 150, max_length=MAX_LENGTH)
+
+    assert [misskey_length(note) for note in notes] == [200, 100]
@@ -6,7 +6,7 @@ import pytest
 # プロジェクトのルートディレクトリをパスに追加
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
 
-from src.utils.url_validator import which_url
+from src.utils.url_validator import normalize_prompt, which_url
 
 
 class TestWhichUrl:
@@ -15,7 +15,7 @@ class TestWhichUrl:
         with pytest.raises(ValueError) as e:
             which_url("")
         if str(e.value) != "テキストが指定されていません":
-            raise Assertio  nError(
+            raise AssertionError(
                 f"Expected 'テキストが指定されていません', but got {e.value!s}"
             )
 
@@ -25,6 +25,12 @@ class TestWhichUrl:
         if result != "html":
             raise AssertionError(f"Expected 'html', but got {result}")
 
+    def test_pdf_url_returns_pdf(self):
+        """拡張子が.pdfのURLが渡された場合、'pdf'が返ることを確認するテスト"""
+        result = which_url("https://example.com/docs/Paper.PDF?download=1")
+        if result != "pdf":
+            raise AssertionError(f"Expected 'pdf', but got {result}")
+
     def test_non_https_url_returns_none(self):
         """https://で始まらないテキストが渡された場合、Noneが返ることを確認するテスト"""
         # http://で始まるURL
@@ -41,3 +47,7 @@ class TestWhichUrl:
         result3 = which_url("これはURLではありません")
         if result3 is not None:
             raise AssertionError(f"Expected None, but got {result3}")
+
+
+def test_normalize_prompt_keeps_unparsable_urls():
+    assert normalize_prompt("見て  https://[oops") == "見て https://[oops"